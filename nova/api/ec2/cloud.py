@@ -1087,12 +1087,14 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_id, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType"""
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_id):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_id)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1164,18 +1166,37 @@ class CloudController(object):
                                                      sort_dir='asc')
             except exception.NotFound:
                 instances = []
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if instance['image_ref'] != str(FLAGS.vpn_image_id)]
+
+        # Look up what is needed for all instances up front rather than
+        # once per instance.
+        image_ids = ec2utils.glance_ids_to_ids(context,
+                [instance[key] for instance in instances
+                 for key in ('image_ref', 'kernel_id', 'ramdisk_id')])
+        bdms = {}
+        for bdm in db.block_device_mapping_get_all_by_instances(context,
+                [instance['id'] for instance in instances]):
+            bdms.setdefault(bdm['instance_id'], []).append(bdm)
+        services = {}
+        if instances:
+            for service in db.service_get_all(context.elevated()):
+                services.setdefault(service['host'], []).append(service)
+
         for instance in instances:
-            if not context.is_admin:
-                if instance['image_ref'] == str(FLAGS.vpn_image_id):
-                    continue
             i = {}
             instance_id = instance['id']
             ec2_id = ec2utils.id_to_ec2_id(instance_id)
             i['instanceId'] = ec2_id
             image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['imageId'] = ec2utils.image_ec2_id(image_ids[image_uuid])
+            if instance['kernel_id']:
+                i['kernelId'] = ec2utils.image_ec2_id(
+                        image_ids[instance['kernel_id']], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = ec2utils.image_ec2_id(
+                        image_ids[instance['ramdisk_id']], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1209,10 +1230,11 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance_id,
-                                      i['rootDeviceName'], i)
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms.get(instance_id, []))
             host = instance['host']
-            services = db.service_get_all_by_host(context.elevated(), host)
-            zone = ec2utils.get_availability_zone_by_host(services, host)
+            zone = ec2utils.get_availability_zone_by_host(
+                    services.get(host, []), host)
             i['placement'] = {'availabilityZone': zone}
             if instance['reservation_id'] not in reservations:
                 r = {}
@@ -62,6 +62,21 @@ def glance_id_to_id(context, glance_id):
         return db.s3_image_create(context, glance_id)['id']
 
 
+def glance_ids_to_ids(context, glance_ids):
+    """Convert glance ids to internal (db) ids.
+
+    Returns a dict of glance id to internal id.  Known ids are looked up
+    all at once.
+    """
+    glance_ids = set(glance_id for glance_id in glance_ids
+                     if glance_id is not None)
+    ids = dict((s3_image['uuid'], s3_image['id']) for s3_image in
+               db.s3_image_get_all_by_uuids(context, list(glance_ids)))
+    for glance_id in glance_ids - set(ids):
+        ids[glance_id] = db.s3_image_create(context, glance_id)['id']
+    return ids
+
+
 def ec2_id_to_glance_id(context, ec2_id):
     image_id = ec2_id_to_id(ec2_id)
     return id_to_glance_id(context, image_id)
@@ -125,6 +125,16 @@ def get_pagination_params(request):
     return params
 
 
+def get_limit_and_marker(request, max_limit=FLAGS.osapi_max_limit):
+    """Return the limit and marker to page through items with.
+
+    The limit is capped to max_limit, and is max_limit if not given.
+    """
+    params = get_pagination_params(request)
+    limit = min(max_limit, params.get('limit', max_limit) or max_limit)
+    return limit, params.get('marker')
+
+
 def _get_limit_param(request):
     """Extract integer limit from request or fail"""
     try:
@@ -22,26 +22,61 @@ import copy
 import httplib
 import json
 import math
+import os
 import re
 import time
 
+import eventlet
+from eventlet.green import socket
+import eventlet.wsgi
 import webob.dec
 import webob.exc
 
 from nova.api.openstack.compute.views import limits as limits_views
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
 from nova import quota
 from nova import utils
 from nova import wsgi as base_wsgi
 
 
+limits_opts = [
+    cfg.StrOpt('api_limiter_socket',
+               default=None,
+               help='Unix socket of the nova-api-limiter shared by all API '
+                    'servers of this node. When set, rate limits are '
+                    'enforced by nova-api-limiter instead of separately in '
+                    'each API server.'),
+    cfg.StrOpt('api_limiter_limits',
+               default=None,
+               help='Limits enforced by nova-api-limiter, in the format of '
+                    'the limits option of the ratelimit filter in '
+                    'api-paste.ini. Unset for the default limits.'),
+    cfg.MultiStrOpt('api_limiter_user_limits',
+                    default=[],
+                    help='Per user limits enforced by nova-api-limiter, '
+                         'given as <username>=<limits> in the format of '
+                         'api_limiter_limits.'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(limits_opts)
+
+LOG = logging.getLogger(__name__)
+
+
 # Convenience constants for the limits dictionary passed to Limiter().
 PER_SECOND = 1
 PER_MINUTE = 60
 PER_HOUR = 60 * 60
 PER_DAY = 60 * 60 * 24
 
+# Seconds between sweeps for users whose limits have all drained.
+IDLE_SWEEP_INTERVAL = 60
+
 
 limits_nsmap = {None: xmlutil.XMLNS_COMMON_V10, 'atom': xmlutil.XMLNS_ATOM}
 
@@ -123,6 +158,8 @@ class Limit(object):
         self.verb = verb
         self.uri = uri
         self.regex = regex
+        # Compiled on first use, limits are also built just for display.
+        self._regex = None
         self.value = int(value)
         self.unit = unit
         self.unit_string = self.display_unit().lower()
@@ -148,7 +185,7 @@ class Limit(object):
         @param verb: string http verb (POST, GET, etc.)
         @param url: string URL
         """
-        if self.verb != verb or not re.match(self.regex, url):
+        if self.verb != verb or not self._match(url):
             return
 
         now = self._get_time()
@@ -178,10 +215,26 @@ class Limit(object):
         self.remaining = math.floor(((cap - water) / cap) * val)
         self.next_request = now
 
+    def _match(self, url):
+        if self._regex is None:
+            self._regex = re.compile(self.regex)
+        return self._regex.match(url)
+
     def _get_time(self):
         """Retrieve the current time. Broken out for testability."""
         return time.time()
 
+    def __deepcopy__(self, memo):
+        # All state is immutable or shared, including the compiled regex
+        # which cannot be deep copied.
+        return copy.copy(self)
+
+    def is_idle(self):
+        """Return whether this limit has drained back to its initial state.
+        """
+        return (self.last_request is None or
+                self._get_time() - self.last_request >= self.water_level)
+
     def display_unit(self):
         """Display the string name of the unit."""
         return self.UNITS.get(self.unit, "UNKNOWN")
@@ -226,9 +279,22 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
         @param limiter: String identifying class for representing limits
 
         Other parameters are passed to the constructor for the limiter.
+        All of them are ignored if api_limiter_socket is set, in favour of
+        the api_limiter_limits and api_limiter_user_limits of
+        nova-api-limiter.
         """
         base_wsgi.Middleware.__init__(self, application)
 
+        if FLAGS.api_limiter_socket:
+            if limits is not None or kwargs:
+                LOG.warn(_("The limits of the ratelimit filter are ignored "
+                           "since api_limiter_socket is set, nova-api-limiter "
+                           "enforces api_limiter_limits and "
+                           "api_limiter_user_limits instead."))
+            self._limiter = WsgiLimiterProxy('unix:%s' %
+                                             FLAGS.api_limiter_socket)
+            return
+
         # Select the limiter class
         if limiter is None:
             limiter = Limiter
@@ -264,7 +330,7 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
 
         if delay:
             msg = _("This request was rate-limited.")
-            retry = time.time() + delay
+            retry = time.time() + float(delay)
             return wsgi.OverLimitFault(msg, error, retry)
 
         req.environ["nova.limits"] = self._limiter.get_limits(username)
@@ -272,9 +338,35 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
         return self.application
 
 
+class LimitLevels(dict):
+    """Copies of the limits of each user, made on first use."""
+
+    def __init__(self, limits):
+        super(LimitLevels, self).__init__()
+        self.limits = limits
+        self.user_limits = {}
+
+    def __missing__(self, username):
+        limits = self.user_limits.get(username, self.limits)
+        level = self[username] = copy.deepcopy(limits)
+        return level
+
+
+def _index_by_verb(limits):
+    """Return {verb: [index of each limit for verb]}."""
+    index = collections.defaultdict(list)
+    for i, limit in enumerate(limits):
+        index[limit.verb].append(i)
+    return dict(index)
+
+
 class Limiter(object):
     """
     Rate-limit checking class which handles limits in memory.
+
+    Only the limits for the verb of a request are checked.  Users whose
+    limits have all drained are forgotten, as they would be recreated
+    in the same state.
     """
 
     def __init__(self, limits, **kwargs):
@@ -284,13 +376,17 @@ class Limiter(object):
         @param limits: List of `Limit` objects
         """
         self.limits = copy.deepcopy(limits)
-        self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self.levels = LimitLevels(limits)
+        self._indexes = {None: _index_by_verb(limits)}
+        self._last_sweep = None
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
             if key.startswith('user:'):
                 username = key[5:]
-                self.levels[username] = self.parse_limits(value)
+                user_limits = self.parse_limits(value)
+                self.levels.user_limits[username] = user_limits
+                self._indexes[username] = _index_by_verb(user_limits)
 
     def get_limits(self, username=None):
         """
@@ -298,15 +394,37 @@ class Limiter(object):
         """
         return [limit.display() for limit in self.levels[username]]
 
+    def _get_time(self):
+        """Retrieve the current time. Broken out for testability."""
+        return time.time()
+
+    def _sweep_idle(self):
+        """Forget the users whose limits have all drained."""
+        now = self._get_time()
+        if self._last_sweep is None:
+            self._last_sweep = now
+        if now - self._last_sweep < IDLE_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for username, level in self.levels.items():
+            if all(limit.is_idle() for limit in level):
+                del self.levels[username]
+
     def check_for_delay(self, verb, url, username=None):
         """
         Check the given verb/user/user triplet for limit.
 
         @return: Tuple of delay (in seconds) and error message (or None, None)
         """
-        delays = []
+        self._sweep_idle()
+        index = self._indexes.get(username, self._indexes[None])
+        if verb not in index:
+            return None, None
 
-        for limit in self.levels[username]:
+        delays = []
+        level = self.levels[username]
+        for i in index[verb]:
+            limit = level[i]
             delay = limit(verb, url)
             if delay:
                 delays.append((delay, limit.error_message))
@@ -392,15 +510,23 @@ class WsgiLimiter(object):
     and receive a 204 No Content, or a 403 Forbidden with an X-Wait-Seconds
     header containing the number of seconds to wait before the action would
     succeed.
+
+    GET ``/<username>`` returns the limits of the user as JSON::
+
+        {
+            "limits": [...]
+        }
     """
 
-    def __init__(self, limits=None):
+    def __init__(self, limits=None, **kwargs):
         """
         Initialize the new `WsgiLimiter`.
 
         @param limits: List of `Limit` objects
+
+        Other parameters are passed to the constructor of the `Limiter`.
         """
-        self._limiter = Limiter(limits or DEFAULT_LIMITS)
+        self._limiter = Limiter(limits or DEFAULT_LIMITS, **kwargs)
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, request):
@@ -409,6 +535,11 @@ class WsgiLimiter(object):
         acceptable to the limiter, else a 403 is returned with a relevant
         header indicating when the request *will* succeed.
         """
+        if request.method == "GET":
+            username = request.path_info_pop()
+            body = json.dumps({"limits": self._limiter.get_limits(username)})
+            return webob.Response(body=body, content_type="application/json")
+
         if request.method != "POST":
             raise webob.exc.HTTPMethodNotAllowed()
 
@@ -430,9 +561,51 @@ class WsgiLimiter(object):
             return webob.exc.HTTPNoContent()
 
 
+class UnixHTTPConnection(httplib.HTTPConnection):
+    """HTTP connection over the unix socket given as host."""
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.host)
+
+
+def serve_local(path, limits=None, **kwargs):
+    """
+    Serve a `WsgiLimiter` on the unix socket at path, so that all API
+    servers of a node can share it through a `WsgiLimiterProxy` given
+    "unix:<path>" as its address.  Other parameters are passed to the
+    `WsgiLimiter`.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = _UnixListener(eventlet.listen(path, family=socket.AF_UNIX))
+    eventlet.wsgi.server(sock, WsgiLimiter(limits, **kwargs))
+
+
+class _UnixListener(object):
+    """Unix listening socket handing out (host, port) style addresses.
+
+    eventlet.wsgi expects client addresses to be tuples, while unix socket
+    clients are unnamed.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def accept(self):
+        conn, _address = self._sock.accept()
+        return conn, ('localhost', 0)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
 class WsgiLimiterProxy(object):
     """
     Rate-limit requests based on answers from a remote source.
+
+    If the address is "unix:<path>", the limiter is reached over a unix
+    socket and connections are kept open between requests.
     """
 
     def __init__(self, limiter_address):
@@ -442,24 +615,59 @@ class WsgiLimiterProxy(object):
         @param limiter_address: IP/port combination of where to request limit
         """
         self.limiter_address = limiter_address
+        self._free_connections = []
 
-    def check_for_delay(self, verb, path, username=None):
-        body = json.dumps({"verb": verb, "path": path})
-        headers = {"Content-Type": "application/json"}
+    def _get_connection(self):
+        if not self.limiter_address.startswith('unix:'):
+            return httplib.HTTPConnection(self.limiter_address)
+        if self._free_connections:
+            return self._free_connections.pop()
+        return UnixHTTPConnection(self.limiter_address[len('unix:'):])
 
-        conn = httplib.HTTPConnection(self.limiter_address)
+    def _put_connection(self, conn):
+        if isinstance(conn, UnixHTTPConnection):
+            self._free_connections.append(conn)
 
+    def _request(self, method, username, body="", headers=None):
+        """Make a request to the limiter, return the response and body."""
         if username:
-            conn.request("POST", "/%s" % (username), body, headers)
+            url = "/%s" % (username)
         else:
-            conn.request("POST", "/", body, headers)
+            url = "/"
 
-        resp = conn.getresponse()
+        conn = self._get_connection()
+        try:
+            conn.request(method, url, body, headers or {})
+            resp = conn.getresponse()
+        except (socket.error, httplib.HTTPException):
+            if not isinstance(conn, UnixHTTPConnection):
+                raise
+            # The limiter may have closed a kept open connection.
+            conn.close()
+            conn.request(method, url, body, headers or {})
+            resp = conn.getresponse()
+        # Read the whole response so that the connection can be reused.
+        body = resp.read()
+        self._put_connection(conn)
+        return resp, body
+
+    def check_for_delay(self, verb, path, username=None):
+        body = json.dumps({"verb": verb, "path": path})
+        headers = {"Content-Type": "application/json"}
+
+        resp, error = self._request("POST", username, body, headers)
 
         if 200 >= resp.status < 300:
             return None, None
 
-        return resp.getheader("X-Wait-Seconds"), resp.read() or None
+        return resp.getheader("X-Wait-Seconds"), error or None
+
+    def get_limits(self, username=None):
+        """
+        Return the limits for a given user, as kept by the remote limiter.
+        """
+        resp, body = self._request("GET", username)
+        return json.loads(body)["limits"]
 
     # Note: This method gets called before the class is instantiated,
     # so this must be either a static method or a class method.  It is
@@ -456,15 +456,24 @@ class Controller(wsgi.Controller):
             else:
                 search_opts['user_id'] = context.user_id
 
-        instance_list = self.compute_api.get_all(context,
-                                                 search_opts=search_opts)
+        # Pagination is done by the database, not as a search option.
+        search_opts.pop('limit', None)
+        search_opts.pop('marker', None)
+        limit, marker = common.get_limit_and_marker(req)
+        try:
+            instance_list = self.compute_api.get_all(context,
+                                                     search_opts=search_opts,
+                                                     limit=limit,
+                                                     marker=marker)
+        except exception.MarkerNotFound:
+            msg = _('marker [%s] not found') % marker
+            raise exc.HTTPBadRequest(explanation=msg)
 
-        limited_list = self._limit_items(instance_list, req)
         if is_detail:
-            self._add_instance_faults(context, limited_list)
-            return self._view_builder.detail(req, limited_list)
+            self._add_instance_faults(context, instance_list)
+            return self._view_builder.detail(req, instance_list)
         else:
-            return self._view_builder.index(req, limited_list)
+            return self._view_builder.index(req, instance_list)
 
     def _get_server(self, context, instance_uuid):
         """Utility function for looking up an instance by uuid"""
@@ -969,9 +978,6 @@ class Controller(wsgi.Controller):
         self.compute_api.set_admin_password(context, server, password)
         return webob.Response(status_int=202)
 
-    def _limit_items(self, items, req):
-        return common.limited_by_marker(items, req)
-
     def _validate_metadata(self, metadata):
         """Ensure that we can work with the metadata given."""
         try:
@@ -18,47 +18,164 @@
 
 """Super simple fake memcache client."""
 
+import heapq
+import threading
+
+from nova import flags
+from nova.openstack.common import cfg
 from nova import utils
 
 
+memorycache_opts = [
+    cfg.IntOpt('memorycache_max_entries',
+               default=0,
+               help='Maximum number of entries kept by the in-process '
+                    'cache used when memcached_servers is not set. The '
+                    'least recently used entries are evicted first. '
+                    '0 means unbounded.'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(memorycache_opts)
+
+# Indexes into the [prev, next, key] nodes of the LRU list.
+_PREV, _NEXT, _KEY = 0, 1, 2
+
+
 class Client(object):
-    """Replicates a tiny subset of memcached client interface."""
+    """Replicates a tiny subset of memcached client interface.
+
+    Expired keys are found through a heap ordered by expiry time and
+    recently used keys are tracked in a linked list, so no call has to
+    look at every key.
+    """
 
     def __init__(self, *args, **kwargs):
-        """Ignores the passed in args."""
-        self.cache = {}
+        """Ignores the passed in args, except for max_entries."""
+        max_entries = kwargs.get('max_entries')
+        if max_entries is None:
+            max_entries = FLAGS.memorycache_max_entries
+        self.max_entries = max_entries
+        self.cache = {}  # { key : (timeout, value, lru node) }
+        self._expiry_heap = []  # [ (timeout, key), ... ]
+        # Circular LRU list, least recently used right after the root.
+        self._lru_root = root = []
+        root[:] = [root, root, None]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def get(self, key):
-        """Retrieves the value for a key or None.
+    def _lru_link(self, key):
+        """Add key as the most recently used and return its node."""
+        root = self._lru_root
+        last = root[_PREV]
+        node = [last, root, key]
+        last[_NEXT] = root[_PREV] = node
+        return node
+
+    def _lru_unlink(self, node):
+        node[_PREV][_NEXT] = node[_NEXT]
+        node[_NEXT][_PREV] = node[_PREV]
+
+    def _remove(self, key):
+        _timeout, _value, node = self.cache.pop(key)
+        self._lru_unlink(node)
 
-        this expunges expired keys during each get"""
+    def _expire(self):
+        """Drop the keys which have expired by now."""
+        heap = self._expiry_heap
+        if not heap:
+            return
+        now = utils.utcnow_ts()
+        while heap and heap[0][0] <= now:
+            timeout, key = heapq.heappop(heap)
+            # Skip entries for keys since deleted or set again.
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] == timeout:
+                self._remove(key)
 
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and utils.utcnow_ts() >= timeout:
-                del self.cache[k]
+    def _lookup(self, key):
+        """Return the live entry for key or None."""
+        self._expire()
+        return self.cache.get(key)
 
-        return self.cache.get(key, (0, None))[1]
+    def _store(self, key, value, timeout):
+        if key in self.cache:
+            self._remove(key)
+        self.cache[key] = (timeout, value, self._lru_link(key))
+        if timeout:
+            heap = self._expiry_heap
+            heapq.heappush(heap, (timeout, key))
+            if len(heap) > 2 * len(self.cache) + 64:
+                # Too many entries for keys set again or deleted.
+                self._expiry_heap = [(t, k) for t, k in heap
+                                     if self.cache.get(k, (None,))[0] == t]
+                heapq.heapify(self._expiry_heap)
+        while self.max_entries and len(self.cache) > self.max_entries:
+            self._remove(self._lru_root[_NEXT][_KEY])
+            self.evictions += 1
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            timeout, value, node = entry
+            # Move to the most recently used end.
+            self._lru_unlink(node)
+            self.cache[key] = (timeout, value, self._lru_link(key))
+            return value
 
     def set(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key."""
         timeout = 0
         if time != 0:
             timeout = utils.utcnow_ts() + time
-        self.cache[key] = (timeout, value)
+        with self._lock:
+            self._expire()
+            self._store(key, value, timeout)
         return True
 
     def add(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key if it doesn't exist."""
-        if not self.get(key) is None:
-            return False
-        return self.set(key, value, time, min_compress_len)
+        timeout = 0
+        if time != 0:
+            timeout = utils.utcnow_ts() + time
+        with self._lock:
+            if self._lookup(key) is not None:
+                return False
+            self._store(key, value, timeout)
+        return True
 
     def incr(self, key, delta=1):
         """Increments the value for a key."""
-        value = self.get(key)
-        if value is None:
-            return None
-        new_value = int(value) + delta
-        self.cache[key] = (self.cache[key][0], str(new_value))
-        return new_value
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            timeout, value, node = entry
+            new_value = int(value) + delta
+            self.cache[key] = (timeout, str(new_value), node)
+            return new_value
+
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        with self._lock:
+            if self._lookup(key) is None:
+                return False
+            self._remove(key)
+            return True
+
+    def get_stats(self):
+        """Returns memcached style statistics for this cache."""
+        with self._lock:
+            self._expire()
+            stats = {'curr_items': len(self.cache),
+                     'get_hits': self.hits,
+                     'get_misses': self.misses,
+                     'evictions': self.evictions}
+        return [('memorycache', stats)]
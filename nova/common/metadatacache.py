@@ -0,0 +1,143 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache of the metadata served to instances.
+
+Metadata is cached per fixed ip address.  The cache is shared between all
+nova services when memcached_servers is set, which lets compute prefetch
+the metadata of instances when they become active and lets the services
+changing an instance invalidate it.  Without memcached the cache is local
+to each process.
+"""
+
+from nova import context
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova.network import model as network_model
+from nova.openstack.common import cfg
+
+
+LOG = logging.getLogger(__name__)
+
+metadatacache_opts = [
+    cfg.IntOpt('metadata_cache_expiration',
+               default=15,
+               help='Number of seconds metadata is cached for a fixed ip. '
+                    'Instance, floating ip and security group changes '
+                    'invalidate the cache, so this can be raised when '
+                    'memcached_servers is set.'),
+    cfg.BoolOpt('metadata_prefetch',
+                default=False,
+                help='Build and cache the metadata of instances when they '
+                     'become active. Only useful when memcached_servers is '
+                     'set, so the metadata service sees the same cache.'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(metadatacache_opts)
+
+if FLAGS.memcached_servers:
+    import memcache
+else:
+    from nova.common import memorycache as memcache
+
+_CACHE = None
+
+
+def get_cache():
+    """Return the metadata cache client shared by this process."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = memcache.Client(FLAGS.memcached_servers, debug=0)
+    return _CACHE
+
+
+def cache_key(address):
+    return 'metadata-%s' % address
+
+
+def _fixed_addresses(ctxt, instance_ref):
+    try:
+        info_cache = instance_ref['info_cache']
+    except KeyError:
+        # Not every caller has the instance with its network info.
+        instance_ref = db.instance_get_by_uuid(ctxt, instance_ref['uuid'])
+        info_cache = instance_ref['info_cache']
+    cached_nwinfo = (info_cache or {}).get('network_info') or []
+    nw_info = network_model.NetworkInfo.hydrate(cached_nwinfo)
+    return [ip['address'] for vif in nw_info for ip in vif.fixed_ips()
+            if ip['version'] == 4]
+
+
+def _build_metadata(ctxt, instance_ref, address):
+    # NOTE: prefetching builds the metadata the way the metadata api
+    #       serves it, so the api is only loaded if metadata_prefetch is set
+    from nova.api.metadata import base
+    return base.get_metadata_for_instance(ctxt, instance_ref, address)
+
+
+def cached_addresses(ctxt, instance_ref):
+    """Return the fixed ips whose cached metadata other services see.
+
+    Without memcached_servers nothing outside of the metadata service
+    sees its cache, so there is nothing to invalidate.
+    """
+    if not FLAGS.memcached_servers:
+        return []
+    try:
+        return _fixed_addresses(ctxt, instance_ref)
+    except Exception:
+        LOG.exception(_('Failed to look up the fixed ips of the instance'),
+                      instance=instance_ref)
+        return []
+
+
+def refresh(ctxt, instance_uuid):
+    """Update the cached metadata after an instance became active.
+
+    The metadata for all fixed ips of the instance is built and cached if
+    metadata_prefetch is set, otherwise stale entries are dropped.
+    """
+    if not (FLAGS.metadata_prefetch or FLAGS.memcached_servers):
+        # Nothing outside of this process would see the cache.
+        return
+    ctxt = context.get_admin_context()
+    try:
+        instance_ref = db.instance_get_by_uuid(ctxt, instance_uuid)
+        for address in _fixed_addresses(ctxt, instance_ref):
+            if not FLAGS.metadata_prefetch:
+                invalidate_address(address)
+                continue
+            data = _build_metadata(ctxt, instance_ref, address)
+            get_cache().set(cache_key(address), data,
+                            FLAGS.metadata_cache_expiration)
+    except Exception:
+        LOG.exception(_('Failed to refresh cached metadata'),
+                      instance_uuid=instance_uuid)
+
+
+def invalidate_address(address):
+    """Drop the cached metadata for a fixed ip."""
+    if address:
+        get_cache().delete(cache_key(address))
+
+
+def invalidate(ctxt, instance_ref):
+    """Drop the cached metadata for all fixed ips of an instance."""
+    for address in cached_addresses(ctxt, instance_ref):
+        invalidate_address(address)
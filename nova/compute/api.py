@@ -27,6 +27,7 @@ import time
 import webob.exc
 
 from nova import block_device
+from nova.common import metadatacache
 from nova.compute import aggregate_states
 from nova.compute import instance_types
 from nova.compute import power_state
@@ -819,6 +820,7 @@ class API(BaseAPI):
         self.db.instance_add_security_group(context.elevated(),
                                             instance_uuid,
                                             security_group['id'])
+        metadatacache.invalidate(context, instance)
         params = {"security_group_id": security_group['id']}
         # NOTE(comstud): No instance_uuid argument to this compute manager
         # call
@@ -848,6 +850,7 @@ class API(BaseAPI):
         self.db.instance_remove_security_group(context.elevated(),
                                                instance_uuid,
                                                security_group['id'])
+        metadatacache.invalidate(context, instance)
         params = {"security_group_id": security_group['id']}
         # NOTE(comstud): No instance_uuid argument to this compute manager
         # call
@@ -1049,7 +1052,7 @@ class API(BaseAPI):
         return inst
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
-                sort_dir='desc'):
+                sort_dir='desc', limit=None, marker=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1061,6 +1064,9 @@ class API(BaseAPI):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        If 'limit' is given, at most that many instances following the
+        instance with uuid 'marker' are returned.
         """
 
         #TODO(bcwaldon): determine the best argument for target here
@@ -1127,7 +1133,9 @@ class API(BaseAPI):
                         return []
 
         inst_models = self._get_instances_by_filters(context, filters,
-                                                     sort_key, sort_dir)
+                                                     sort_key, sort_dir,
+                                                     limit=limit,
+                                                     marker=marker)
 
         # Convert the models to dictionaries
         instances = []
@@ -1139,7 +1147,8 @@ class API(BaseAPI):
 
         return instances
 
-    def _get_instances_by_filters(self, context, filters, sort_key, sort_dir):
+    def _get_instances_by_filters(self, context, filters, sort_key, sort_dir,
+                                  limit=None, marker=None):
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
                                                                    filters)
@@ -1149,7 +1158,8 @@ class API(BaseAPI):
             filters['uuid'] = uuids
 
         return self.db.instance_get_all_by_filters(context, filters, sort_key,
-                                                   sort_dir)
+                                                   sort_dir, limit=limit,
+                                                   marker=marker)
 
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.SHUTOFF])
@@ -45,6 +45,7 @@ import traceback
 from eventlet import greenthread
 
 from nova import block_device
+from nova.common import metadatacache
 import nova.context
 from nova.compute import aggregate_states
 from nova.compute import instance_types
@@ -62,6 +63,7 @@ from nova.network import model as network_model
 from nova.notifier import api as notifier
 from nova.openstack.common import cfg
 from nova import rpc
+from nova.scheduler import api as scheduler_api
 from nova import utils
 from nova.virt import driver
 from nova import vnc
@@ -98,6 +100,10 @@ compute_opts = [
     cfg.IntOpt('host_state_interval',
                default=120,
                help='Interval in seconds for querying the host status'),
+    cfg.IntOpt('sync_power_state_interval',
+               default=600,
+               help='Interval in seconds for syncing the power states of '
+                    'the instances with the hypervisor'),
     cfg.IntOpt("running_deleted_instance_timeout",
                default=0,
                help="Number of seconds after being deleted when a running "
@@ -204,9 +210,6 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_api = network.API()
         self.volume_api = volume.API()
         self.network_manager = utils.import_object(FLAGS.network_manager)
-        self._last_host_check = 0
-        self._last_bw_usage_poll = 0
-        self._last_info_cache_heal = 0
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -437,6 +440,7 @@ class ComputeManager(manager.SchedulerDependentManager):
 
             self._notify_about_instance_usage(instance, "create.end",
                                               network_info=network_info)
+            metadatacache.refresh(context, instance_uuid)
 
             if self._is_instance_terminated(instance_uuid):
                 raise exception.InstanceNotFound
@@ -652,6 +656,19 @@ class ComputeManager(manager.SchedulerDependentManager):
             self._run_instance(context, instance_uuid, **kwargs)
         do_run_instance()
 
+    def run_instances(self, context, instance_uuids, **kwargs):
+        """Launch all the instances a request scheduled to this host."""
+        def _run_instance(instance_uuid):
+            try:
+                self.run_instance(context, instance_uuid, **kwargs)
+            except Exception:
+                LOG.exception(_("Failed to run instance"),
+                              instance_uuid=instance_uuid)
+
+        # Build them concurrently, as separate casts would have.
+        for instance_uuid in instance_uuids:
+            greenthread.spawn_n(_run_instance, instance_uuid)
+
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @checks_instance_lock
     @wrap_instance_fault
@@ -725,7 +742,13 @@ class ComputeManager(manager.SchedulerDependentManager):
                               task_state=None,
                               terminated_at=utils.utcnow())
 
+        # The fixed ips are looked up before they go with the instance
+        addresses = metadatacache.cached_addresses(context, instance)
         self.db.instance_destroy(context, instance_id)
+        for address in addresses:
+            metadatacache.invalidate_address(address)
+        scheduler_api.delete_instance_info(context, self.host,
+                                           instance['uuid'])
         self._notify_about_instance_usage(instance, "delete.end")
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
@@ -867,6 +890,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                               vm_state=vm_states.ACTIVE,
                               task_state=None,
                               launched_at=utils.utcnow())
+        metadatacache.refresh(context, instance_uuid)
 
         self._notify_about_instance_usage(instance, "rebuild.end",
                                           network_info=network_info)
@@ -1237,7 +1261,7 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         # Just roll back the record. There's no need to resize down since
         # the 'old' VM already has the preferred attributes
-        self._instance_update(context,
+        instance_ref = self._instance_update(context,
                               instance_ref['uuid'],
                               memory_mb=instance_type['memory_mb'],
                               host=migration_ref['source_compute'],
@@ -1250,6 +1274,9 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         self.db.migration_update(context, migration_id,
                 {'status': 'reverted'})
+        scheduler_api.update_instance_info(context,
+                migration_ref['source_compute'], instance_ref)
+        metadatacache.refresh(context, instance_ref['uuid'])
 
         self._notify_about_instance_usage(instance_ref, "resize.revert.end")
 
@@ -1386,7 +1413,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                                      self._legacy_nw_info(network_info),
                                      image, resize_instance)
 
-        self._instance_update(context,
+        instance_ref = self._instance_update(context,
                               instance_ref.uuid,
                               vm_state=vm_states.ACTIVE,
                               host=migration_ref['dest_compute'],
@@ -1394,6 +1421,9 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         self.db.migration_update(context, migration_ref.id,
                                  {'status': 'finished'})
+        scheduler_api.update_instance_info(context,
+                migration_ref['dest_compute'], instance_ref)
+        metadatacache.refresh(context, instance_ref['uuid'])
 
         self._notify_about_instance_usage(instance_ref, "finish_resize.end",
                                           network_info=network_info)
@@ -2115,6 +2145,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                               power_state=current_power_state,
                               vm_state=vm_states.ACTIVE,
                               task_state=None)
+        scheduler_api.update_instance_info(context, self.host, instance_ref)
 
         # NOTE(vish): this is necessary to update dhcp
         self.network_api.setup_networks_on_host(context,
@@ -2182,7 +2213,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.driver.destroy(instance_ref, self._legacy_nw_info(network_info),
                             block_device_info)
 
-    @manager.periodic_task
+    @manager.periodic_task(spacing='heal_instance_info_cache_interval')
     def _heal_instance_info_cache(self, context):
         """Called periodically.  On every call, try to update the
         info_cache's network information for another instance by
@@ -2194,13 +2225,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         If anything errors, we don't care.  It's possible the instance
         has been deleted, etc.
         """
-        heal_interval = FLAGS.heal_instance_info_cache_interval
-        if not heal_interval:
-            return
-        curr_time = time.time()
-        if self._last_info_cache_heal + heal_interval > curr_time:
+        if not FLAGS.heal_instance_info_cache_interval:
             return
-        self._last_info_cache_heal = curr_time
 
         instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
         instance = None
@@ -2250,43 +2276,31 @@ class ComputeManager(manager.SchedulerDependentManager):
         if FLAGS.resize_confirm_window > 0:
             self.driver.poll_unconfirmed_resizes(FLAGS.resize_confirm_window)
 
-    @manager.periodic_task
+    @manager.periodic_task(spacing='bandwith_poll_interval')
     def _poll_bandwidth_usage(self, context, start_time=None, stop_time=None):
         if not start_time:
             start_time = utils.last_completed_audit_period()[1]
 
-        curr_time = time.time()
-        if curr_time - self._last_bw_usage_poll > FLAGS.bandwith_poll_interval:
-            self._last_bw_usage_poll = curr_time
-            LOG.info(_("Updating bandwidth usage cache"))
+        LOG.info(_("Updating bandwidth usage cache"))
+        try:
+            bw_usage = self.driver.get_all_bw_usage(start_time, stop_time)
+        except NotImplementedError:
+            # NOTE(mdragon): Not all hypervisors have bandwidth polling
+            # implemented yet.  If they don't it doesn't break anything,
+            # they just don't get the info in the usage events.
+            return
 
-            try:
-                bw_usage = self.driver.get_all_bw_usage(start_time, stop_time)
-            except NotImplementedError:
-                # NOTE(mdragon): Not all hypervisors have bandwidth polling
-                # implemented yet.  If they don't it doesn't break anything,
-                # they just don't get the info in the usage events.
-                return
-
-            for usage in bw_usage:
-                mac = usage['mac_address']
-                self.db.bw_usage_update(context,
-                                        mac,
-                                        start_time,
-                                        usage['bw_in'], usage['bw_out'])
+        self.db.bw_usage_update_bulk(context, start_time, bw_usage)
 
-    @manager.periodic_task
+    @manager.periodic_task(spacing='host_state_interval')
     def _report_driver_status(self, context):
-        curr_time = time.time()
-        if curr_time - self._last_host_check > FLAGS.host_state_interval:
-            self._last_host_check = curr_time
-            LOG.info(_("Updating host status"))
-            # This will grab info about the host and queue it
-            # to be sent to the Schedulers.
-            self.update_service_capabilities(
-                self.driver.get_host_stats(refresh=True))
-
-    @manager.periodic_task(ticks_between_runs=10)
+        LOG.info(_("Updating host status"))
+        # This will grab info about the host and queue it
+        # to be sent to the Schedulers.
+        self.update_service_capabilities(
+            self.driver.get_host_stats(refresh=True))
+
+    @manager.periodic_task(spacing='sync_power_state_interval')
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
@@ -18,8 +18,6 @@
 
 """Auth Components for Consoles."""
 
-import os
-import sys
 import time
 
 from nova import flags
@@ -43,39 +41,34 @@ consoleauth_opts = [
 FLAGS = flags.FLAGS
 FLAGS.register_opts(consoleauth_opts)
 
+if FLAGS.memcached_servers:
+    import memcache
+else:
+    from nova.common import memorycache as memcache
+
 
 class ConsoleAuthManager(manager.Manager):
     """Manages token based authentication."""
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         super(ConsoleAuthManager, self).__init__(*args, **kwargs)
-        self.tokens = {}
-        utils.LoopingCall(self._delete_expired_tokens).start(1)
-
-    def _delete_expired_tokens(self):
-        now = time.time()
-        to_delete = []
-        for k, v in self.tokens.items():
-            if now - v['last_activity_at'] > FLAGS.console_token_ttl:
-                to_delete.append(k)
-
-        for k in to_delete:
-            LOG.audit(_("Deleting Expired Token: (%s)"), k)
-            del self.tokens[k]
+        # Tokens expire after console_token_ttl seconds in the cache.
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
 
     def authorize_console(self, context, token, console_type, host, port,
                           internal_access_path):
-        self.tokens[token] = {'token': token,
-                              'console_type': console_type,
-                              'host': host,
-                              'port': port,
-                              'internal_access_path': internal_access_path,
-                              'last_activity_at': time.time()}
-        token_dict = self.tokens[token]
+        token_dict = {'token': token,
+                      'console_type': console_type,
+                      'host': host,
+                      'port': port,
+                      'internal_access_path': internal_access_path,
+                      'last_activity_at': time.time()}
+        self.mc.set(token, token_dict, FLAGS.console_token_ttl)
         LOG.audit(_("Received Token: %(token)s, %(token_dict)s)"), locals())
 
     def check_token(self, context, token):
-        token_valid = token in self.tokens
+        token_dict = self.mc.get(token)
+        token_valid = token_dict is not None
         LOG.audit(_("Checking Token: %(token)s, %(token_valid)s)"), locals())
         if token_valid:
-            return self.tokens[token]
+            return token_dict
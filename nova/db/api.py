@@ -150,6 +150,14 @@ def service_create(context, values):
     return IMPL.service_create(context, values)
 
 
+def service_heartbeat(context, service_id):
+    """Bump the report count and update time of a service.
+
+    Returns False if the service does not exist.
+    """
+    return IMPL.service_heartbeat(context, service_id)
+
+
 def service_update(context, service_id, values):
     """Set the given properties on an service and update it.
 
@@ -402,13 +410,31 @@ def fixed_ip_associate_pool(context, network_id, instance_id=None, host=None):
                                         instance_id, host)
 
 
+def fixed_ip_reserve_block(context, network_id, host, count):
+    """Reserve up to count free ips in network for host to allocate.
+
+    Returns the reserved addresses, which fixed_ip_associate_pool only
+    takes once no unreserved ip is left.
+
+    """
+    return IMPL.fixed_ip_reserve_block(context, network_id, host, count)
+
+
+def fixed_ip_unreserve_block(context, host, addresses=None):
+    """Unreserve addresses, or all ips reserved for host if None."""
+    return IMPL.fixed_ip_unreserve_block(context, host, addresses)
+
+
 def fixed_ip_create(context, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_create(context, values)
 
 
 def fixed_ip_bulk_create(context, ips):
-    """Create a lot of fixed ips from the values dictionary."""
+    """Create a lot of fixed ips from an iterable of values dictionaries.
+
+    Returns the number of fixed ips created.
+    """
     return IMPL.fixed_ip_bulk_create(context, ips)
 
 
@@ -417,9 +443,14 @@ def fixed_ip_disassociate(context, address):
     return IMPL.fixed_ip_disassociate(context, address)
 
 
-def fixed_ip_disassociate_all_by_timeout(context, host, time):
-    """Disassociate old fixed ips from host."""
-    return IMPL.fixed_ip_disassociate_all_by_timeout(context, host, time)
+def fixed_ip_disassociate_all_by_timeout(context, host, time, reserve=False):
+    """Disassociate old fixed ips from host.
+
+    With reserve, the fixed ips are reserved for host to allocate again.
+
+    """
+    return IMPL.fixed_ip_disassociate_all_by_timeout(context, host, time,
+                                                     reserve)
 
 
 def fixed_ip_get(context, id):
@@ -452,6 +483,14 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return IMPL.fixed_ips_by_virtual_interface(context, vif_id)
 
 
+def fixed_ip_get_all_by_address_prefix(context, prefix):
+    """Get the fixed ips of instances starting with prefix.
+
+    Fixed ips with a floating ip starting with prefix are included as well.
+    """
+    return IMPL.fixed_ip_get_all_by_address_prefix(context, prefix)
+
+
 def fixed_ip_get_network(context, address):
     """Get a network for a fixed ip by address."""
     return IMPL.fixed_ip_get_network(context, address)
@@ -546,10 +585,15 @@ def instance_get_all(context):
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc'):
-    """Get all instances that match all filters."""
+                                sort_dir='desc', limit=None, marker=None):
+    """Get all instances that match all filters.
+
+    If limit is set, return at most limit instances, starting after the
+    instance with uuid marker.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
-                                            sort_dir)
+                                            sort_dir, limit=limit,
+                                            marker=marker)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None):
@@ -658,6 +702,15 @@ def instance_info_cache_get(context, instance_uuid):
     return IMPL.instance_info_cache_get(context, instance_uuid)
 
 
+def instance_info_cache_get_all_by_instances(context, instance_uuids):
+    """Gets the info caches of many instances at once.
+
+    :param instance_uuids: = uuids of the info caches' instances
+    """
+    return IMPL.instance_info_cache_get_all_by_instances(context,
+                                                         instance_uuids)
+
+
 def instance_info_cache_update(context, instance_uuid, values):
     """Update an instance info cache record in the table.
 
@@ -1091,6 +1144,12 @@ def block_device_mapping_get_all_by_instance(context, instance_id):
     return IMPL.block_device_mapping_get_all_by_instance(context, instance_id)
 
 
+def block_device_mapping_get_all_by_instances(context, instance_ids):
+    """Get all block device mappings belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instances(context,
+                                                          instance_ids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1504,6 +1563,15 @@ def bw_usage_update(context,
                                 bw_in, bw_out)
 
 
+def bw_usage_update_bulk(context, start_period, usages):
+    """Update the cached bw usage of many macs in one transaction.
+
+    usages is an iterable of dicts with mac_address, bw_in and bw_out
+    keys.  Creates new records if needed and returns the number of macs.
+    """
+    return IMPL.bw_usage_update_bulk(context, start_period, usages)
+
+
 ####################
 
 
@@ -1605,6 +1673,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by a list of uuids"""
+    return IMPL.s3_image_get_all_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     return IMPL.s3_image_create(context, image_uuid)
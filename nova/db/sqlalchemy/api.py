@@ -21,6 +21,7 @@
 
 import datetime
 import functools
+import itertools
 import re
 import warnings
 
@@ -36,11 +37,13 @@ from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy.session import get_session
 from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy import String
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import literal_column
 
@@ -399,6 +402,19 @@ def service_create(context, values):
     return service_ref
 
 
+@require_admin_context
+def service_heartbeat(context, service_id):
+    session = get_session()
+    with session.begin():
+        values = {'report_count': models.Service.report_count + 1,
+                  'updated_at': utils.utcnow()}
+        count = model_query(context, models.Service, session=session,
+                            read_deleted="no").\
+                        filter_by(id=service_id).\
+                        update(values, synchronize_session=False)
+    return count > 0
+
+
 @require_admin_context
 def service_update(context, service_id, values):
     session = get_session()
@@ -928,6 +944,7 @@ def fixed_ip_associate(context, address, instance_id, network_id=None,
         if not fixed_ip_ref.network_id:
             fixed_ip_ref.network_id = network_id
         fixed_ip_ref.instance_id = instance_id
+        fixed_ip_ref.pool_host = None
         session.add(fixed_ip_ref)
     return fixed_ip_ref['address']
 
@@ -938,19 +955,27 @@ def fixed_ip_associate_pool(context, network_id, instance_id=None, host=None):
     with session.begin():
         network_or_none = or_(models.FixedIp.network_id == network_id,
                               models.FixedIp.network_id == None)
-        fixed_ip_ref = model_query(context, models.FixedIp, session=session,
-                                   read_deleted="no").\
-                               filter(network_or_none).\
-                               filter_by(reserved=False).\
-                               filter_by(instance_id=None).\
-                               filter_by(host=None).\
-                               with_lockmode('update').\
-                               first()
+        query = model_query(context, models.FixedIp, session=session,
+                            read_deleted="no").\
+                        filter(network_or_none).\
+                        filter_by(reserved=False).\
+                        filter_by(instance_id=None).\
+                        filter_by(host=None)
+        fixed_ip_ref = query.filter_by(pool_host=None).\
+                             with_lockmode('update').\
+                             first()
+        if not fixed_ip_ref:
+            # Take one of the fixed ips reserved by a network host, which
+            # skips it once it finds it associated.  Those of hosts that
+            # are gone are reclaimed this way too.
+            fixed_ip_ref = query.with_lockmode('update').first()
         # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
         #             then this has concurrency issues
         if not fixed_ip_ref:
             raise exception.NoMoreFixedIps()
 
+        fixed_ip_ref.pool_host = None
+
         if fixed_ip_ref['network_id'] is None:
             fixed_ip_ref['network'] = network_id
 
@@ -963,6 +988,54 @@ def fixed_ip_associate_pool(context, network_id, instance_id=None, host=None):
     return fixed_ip_ref['address']
 
 
+@require_admin_context
+def fixed_ip_reserve_block(context, network_id, host, count):
+    """Reserve up to count free fixed ips of a network for host.
+
+    Free fixed ips already reserved for host are returned again, such as
+    those fixed_ip_disassociate_all_by_timeout gave back to it.
+    """
+    session = get_session()
+    with session.begin():
+        network_or_none = or_(models.FixedIp.network_id == network_id,
+                              models.FixedIp.network_id == None)
+        unreserved_or_host = or_(models.FixedIp.pool_host == None,
+                                 models.FixedIp.pool_host == host)
+        fixed_ip_refs = model_query(context, models.FixedIp,
+                                    session=session, read_deleted="no").\
+                               filter(network_or_none).\
+                               filter_by(reserved=False).\
+                               filter_by(instance_id=None).\
+                               filter_by(host=None).\
+                               filter(unreserved_or_host).\
+                               order_by(models.FixedIp.id).\
+                               limit(count).\
+                               with_lockmode('update').\
+                               all()
+        # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
+        #             then this has concurrency issues
+        for fixed_ip_ref in fixed_ip_refs:
+            if fixed_ip_ref.network_id is None:
+                fixed_ip_ref.network_id = network_id
+            fixed_ip_ref.pool_host = host
+    return [fixed_ip_ref['address'] for fixed_ip_ref in fixed_ip_refs]
+
+
+@require_admin_context
+def fixed_ip_unreserve_block(context, host, addresses=None):
+    """Give back the fixed ips host reserved and didn't allocate."""
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.FixedIp, session=session,
+                            read_deleted="no").\
+                        filter_by(pool_host=host)
+        if addresses is not None:
+            if not addresses:
+                return
+            query = query.filter(models.FixedIp.address.in_(addresses))
+        query.update({'pool_host': None}, synchronize_session=False)
+
+
 @require_context
 def fixed_ip_create(context, values):
     fixed_ip_ref = models.FixedIp()
@@ -972,13 +1045,28 @@ def fixed_ip_create(context, values):
 
 
 @require_context
-def fixed_ip_bulk_create(context, ips):
+def fixed_ip_bulk_create(context, ips, chunk_size=1000):
+    """Insert the fixed ips chunk_size rows per statement.
+
+    ips can be any iterable of values, only one chunk is in memory at
+    a time.  All rows are created in one transaction.
+    """
+    insert = models.FixedIp.__table__.insert()
+    ips = iter(ips)
+    count = 0
     session = get_session()
     with session.begin():
-        for ip in ips:
-            model = models.FixedIp()
-            model.update(ip)
-            session.add(model)
+        while True:
+            chunk = list(itertools.islice(ips, chunk_size))
+            if not chunk:
+                break
+            now = utils.utcnow()
+            for values in chunk:
+                values.setdefault('created_at', now)
+            session.execute(insert, chunk)
+            count += len(chunk)
+            LOG.debug(_('Created %(count)d fixed ips'), locals())
+    return count
 
 
 @require_context
@@ -993,7 +1081,7 @@ def fixed_ip_disassociate(context, address):
 
 
 @require_admin_context
-def fixed_ip_disassociate_all_by_timeout(context, host, time):
+def fixed_ip_disassociate_all_by_timeout(context, host, time, reserve=False):
     session = get_session()
     # NOTE(vish): only update fixed ips that "belong" to this
     #             host; i.e. the network host or the instance
@@ -1015,12 +1103,14 @@ def fixed_ip_disassociate_all_by_timeout(context, host, time):
     fixed_ip_ids = [fip[0] for fip in result]
     if not fixed_ip_ids:
         return 0
+    values = {'instance_id': None,
+              'leased': False,
+              'updated_at': utils.utcnow()}
+    if reserve:
+        values['pool_host'] = host
     result = model_query(context, models.FixedIp, session=session).\
                      filter(models.FixedIp.id.in_(fixed_ip_ids)).\
-                     update({'instance_id': None,
-                             'leased': False,
-                             'updated_at': utils.utcnow()},
-                             synchronize_session='fetch')
+                     update(values, synchronize_session='fetch')
     return result
 
 
@@ -1104,6 +1194,46 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return result
 
 
+@require_context
+def fixed_ip_get_all_by_address_prefix(context, prefix):
+    """Get the fixed ips of instances starting with prefix.
+
+    Fixed ips with a floating ip starting with prefix are included as well.
+    Returns dicts of the instance_id, address and floating_ips of each
+    fixed ip, ordered by virtual interface.
+    """
+    session = get_session()
+    query = session.query(models.FixedIp.id,
+                          models.FixedIp.instance_id,
+                          models.FixedIp.address,
+                          models.FloatingIp.address).\
+                    outerjoin(models.FloatingIp,
+                              and_(models.FloatingIp.fixed_ip_id ==
+                                   models.FixedIp.id,
+                                   models.FloatingIp.deleted == False)).\
+                    filter(models.FixedIp.deleted == False).\
+                    filter(models.FixedIp.instance_id != None).\
+                    filter(models.FixedIp.virtual_interface_id != None).\
+                    order_by(models.FixedIp.virtual_interface_id,
+                             models.FixedIp.id)
+    if prefix:
+        query = query.filter(or_(
+                _starts_with(models.FixedIp.address, prefix),
+                _starts_with(models.FloatingIp.address, prefix)))
+
+    fixed_ips = []
+    for fixed_ip_id, instance_id, address, floating_address in query:
+        if not fixed_ips or fixed_ips[-1]['id'] != fixed_ip_id:
+            fixed_ips.append({'id': fixed_ip_id,
+                              'instance_id': instance_id,
+                              'address': address,
+                              'floating_ips': []})
+        if floating_address:
+            fixed_ips[-1]['floating_ips'].append(
+                    {'address': floating_address})
+    return fixed_ips
+
+
 @require_admin_context
 def fixed_ip_get_network(context, address):
     fixed_ip_ref = fixed_ip_get_by_address(context, address)
@@ -1371,11 +1501,57 @@ def instance_get_all(context):
                    all()
 
 
+def _starts_with(column, prefix):
+    """Return a LIKE clause matching values of column starting with prefix."""
+    for char in ('\\', '%', '_'):
+        prefix = prefix.replace(char, '\\' + char)
+    return column.like(prefix + '%', escape='\\')
+
+
+def _regexp_filter_to_sql(query, model, filter_name, regexp):
+    """Narrow down query with an indexable predicate implied by regexp.
+
+    The predicate may be looser than the regexp (LIKE can be case
+    insensitive), so matches still need to be checked against the regexp.
+    """
+    column = model.__table__.columns.get(filter_name)
+    if column is None or not isinstance(column.type, String):
+        return query
+    prefix = utils.regexp_literal_prefix(regexp)
+    if not prefix:
+        return query
+    return query.filter(_starts_with(getattr(model, filter_name), prefix))
+
+
+def _after_marker(query, model, sort_key, sort_dir, marker_ref):
+    """Restrict query to rows sorted after marker_ref.
+
+    Rows are expected to be sorted by sort_key, then id.
+    """
+    sort_column = getattr(model, sort_key)
+    marker_value = marker_ref[sort_key]
+    if sort_dir == 'desc':
+        after = or_(sort_column < marker_value,
+                    and_(sort_column == marker_value,
+                         model.id < marker_ref['id']))
+    else:
+        after = or_(sort_column > marker_value,
+                    and_(sort_column == marker_value,
+                         model.id > marker_ref['id']))
+    return query.filter(after)
+
+
 @require_context
-def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
+def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
+                                limit=None, marker=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
-    otherwise"""
+    otherwise.
+
+    If limit is set, at most limit instances sorted after the instance
+    with uuid marker are returned.  Pages are found from the position of
+    the marker rather than by skipping rows, so their cost doesn't grow
+    with the number of instances."""
 
     def _regexp_filter_by_metadata(instance, meta):
         inst_metadata = [{node['key']: node['value']}
@@ -1407,7 +1583,8 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
             options(joinedload('security_groups')).\
             options(joinedload('metadata')).\
             options(joinedload('instance_type')).\
-            order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key)))
+            order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key))).\
+            order_by(sort_fn[sort_dir](models.Instance.id))
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1446,31 +1623,63 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
     query_prefix = exact_filter(query_prefix, models.Instance,
                                 filters, exact_match_filter_names)
 
-    instances = query_prefix.all()
-    if not instances:
-        return []
-
     # Now filter on everything else for regexp matching..
     # For filters not in the list, we'll attempt to use the filter_name
     # as a column name in Instance..
     regexp_filter_funcs = {}
+    filter_fns = []
 
     for filter_name in filters.iterkeys():
         filter_func = regexp_filter_funcs.get(filter_name, None)
+        if filter_name != 'metadata':
+            query_prefix = _regexp_filter_to_sql(query_prefix,
+                    models.Instance, filter_name, str(filters[filter_name]))
         filter_re = re.compile(str(filters[filter_name]))
         if filter_func:
-            filter_l = lambda instance: filter_func(instance, filter_re)
+            filter_l = functools.partial(filter_func, filter_re=filter_re)
         elif filter_name == 'metadata':
-            filter_l = lambda instance: _regexp_filter_by_metadata(instance,
-                    filters[filter_name])
+            filter_l = functools.partial(_regexp_filter_by_metadata,
+                                         meta=filters[filter_name])
         else:
-            filter_l = lambda instance: _regexp_filter_by_column(instance,
-                    filter_name, filter_re)
-        instances = filter(filter_l, instances)
-        if not instances:
+            filter_l = functools.partial(_regexp_filter_by_column,
+                                         filter_name=filter_name,
+                                         filter_re=filter_re)
+        filter_fns.append(filter_l)
+
+    def _filter_instances(instances):
+        for filter_l in filter_fns:
+            instances = filter(filter_l, instances)
+        return instances
+
+    marker_ref = None
+    if marker is not None:
+        marker_ref = session.query(models.Instance).\
+                             filter_by(uuid=marker).\
+                             first()
+        if marker_ref is None:
+            raise exception.MarkerNotFound(marker=marker)
+
+    if not limit:
+        query = query_prefix
+        if marker_ref is not None:
+            query = _after_marker(query, models.Instance, sort_key, sort_dir,
+                                  marker_ref)
+        return _filter_instances(query.all())
+
+    # Read pages until enough instances match the filters which couldn't
+    # be done in SQL.
+    instances = []
+    while len(instances) < limit:
+        query = query_prefix
+        if marker_ref is not None:
+            query = _after_marker(query, models.Instance, sort_key, sort_dir,
+                                  marker_ref)
+        page = query.limit(limit).all()
+        instances.extend(_filter_instances(page))
+        if len(page) < limit:
             break
-
-    return instances
+        marker_ref = page[-1]
+    return instances[:limit]
 
 
 @require_context
@@ -1725,6 +1934,20 @@ def instance_info_cache_get(context, instance_uuid, session=None):
     return info_cache
 
 
+@require_context
+def instance_info_cache_get_all_by_instances(context, instance_uuids):
+    """Gets the info caches of many instances at once.
+
+    :param instance_uuids: = uuids of the info caches' instances
+    """
+    if not instance_uuids:
+        return []
+    return model_query(context, models.InstanceInfoCache, read_deleted="no").\
+                   filter(models.InstanceInfoCache.instance_id.in_(
+                           instance_uuids)).\
+                   all()
+
+
 @require_context
 def instance_info_cache_update(context, instance_uuid, values,
                                session=None):
@@ -2758,6 +2981,16 @@ def block_device_mapping_get_all_by_instance(context, instance_id):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instances(context, instance_ids):
+    if not instance_ids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_id.in_(
+                        instance_ids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     session = get_session()
@@ -3737,6 +3970,57 @@ def bw_usage_update(context,
         bwusage.save(session=session)
 
 
+@require_context
+def bw_usage_update_bulk(context, start_period, usages, chunk_size=500):
+    """Create or update the cached bw usage of all the given macs.
+
+    The existing rows are looked up chunk_size macs per query, then all
+    rows are updated with one statement and the others inserted with
+    another, in one transaction.
+    """
+    usages = dict((usage['mac_address'], usage) for usage in usages)
+    if not usages:
+        return 0
+    table = models.BandwidthUsage.__table__
+    now = utils.utcnow()
+    session = get_session()
+    with session.begin():
+        existing = set()
+        macs = usages.keys()
+        for i in xrange(0, len(macs), chunk_size):
+            query = model_query(context, models.BandwidthUsage.mac,
+                                session=session, read_deleted="yes").\
+                        filter_by(start_period=start_period).\
+                        filter(models.BandwidthUsage.mac.in_(
+                                macs[i:i + chunk_size]))
+            existing.update(mac for mac, in query)
+
+        updates = [{'b_mac': mac,
+                    'bw_in': usages[mac]['bw_in'],
+                    'bw_out': usages[mac]['bw_out']}
+                   for mac in existing]
+        if updates:
+            update = table.update().\
+                        where(and_(table.c.mac == bindparam('b_mac'),
+                                   table.c.start_period == start_period)).\
+                        values(bw_in=bindparam('bw_in'),
+                               bw_out=bindparam('bw_out'),
+                               last_refreshed=now)
+            session.execute(update, updates)
+
+        inserts = [{'mac': mac,
+                    'start_period': start_period,
+                    'bw_in': usage['bw_in'],
+                    'bw_out': usage['bw_out'],
+                    'last_refreshed': now,
+                    'created_at': now}
+                   for mac, usage in usages.iteritems()
+                   if mac not in existing]
+        if inserts:
+            session.execute(table.insert(), inserts)
+    return len(usages)
+
+
 ####################
 
 
@@ -3994,6 +4278,15 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by a list of uuids"""
+    if not image_uuids:
+        return []
+    return model_query(context, models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     try:
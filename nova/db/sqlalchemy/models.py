@@ -699,6 +699,8 @@ class FixedIp(BASE, NovaBase):
     leased = Column(Boolean, default=False)
     reserved = Column(Boolean, default=False)
     host = Column(String(255))
+    # host which reserved the free fixed_ip to allocate it without locking
+    pool_host = Column(String(255))
 
 
 class FloatingIp(BASE, NovaBase):
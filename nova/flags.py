@@ -399,6 +399,13 @@ global_opts = [
     cfg.StrOpt('root_helper',
                default='sudo',
                help='Command prefix to use for running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run commands as root through a long-lived '
+                     'nova-rootwrap instead of starting root_helper for '
+                     'every command. When the daemon isn\'t running it is '
+                     'started through root_helper, which must then be '
+                     'nova-rootwrap.'),
     cfg.StrOpt('network_driver',
                default='nova.network.linux_net',
                help='Driver to use for network creation'),
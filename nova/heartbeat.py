@@ -0,0 +1,136 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Service heartbeats.
+
+Every report_interval services report to the heartbeat driver that they
+are alive, and the same driver tells whether a service is up.
+
+DbDriver, the default, keeps the heartbeats in the services table.
+SchedulerDriver sends them to the schedulers along with the service
+capabilities instead, and only writes to the database as often as the
+other processes need to see the services up.
+"""
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova.scheduler import api as scheduler_api
+from nova import utils
+
+
+heartbeat_opts = [
+    cfg.StrOpt('heartbeat_driver',
+               default='nova.heartbeat.DbDriver',
+               help='Driver services report their heartbeats to and which '
+                    'tells whether services are up'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(heartbeat_opts)
+
+LOG = logging.getLogger(__name__)
+
+_DRIVER = None
+
+
+def get_driver():
+    """Return the heartbeat driver of this process."""
+    global _DRIVER
+    if _DRIVER is None:
+        _DRIVER = utils.import_object(FLAGS.heartbeat_driver)
+    return _DRIVER
+
+
+class DbDriver(object):
+    """Keeps the last heartbeat of services in the services table.
+
+    A heartbeat bumps report_count and updated_at without reading the
+    service first, and is only written once a third of service_down_time
+    passed since the previous one.
+    """
+
+    def __init__(self):
+        self._last_write = {}  # { service id : time of the last write }
+
+    def report(self, context, service):
+        """Record that service is alive.
+
+        Returns False if the service record no longer exists.
+        """
+        now = utils.utcnow()
+        last_write = self._last_write.get(service.service_id)
+        if (last_write is not None and
+            utils.total_seconds(now - last_write) < self._write_interval()):
+            return True
+        if not db.service_heartbeat(context, service.service_id):
+            return False
+        self._last_write[service.service_id] = now
+        return True
+
+    def _write_interval(self):
+        """Seconds between two writes of the heartbeat of a service."""
+        return FLAGS.service_down_time / 3.0
+
+    def capabilities_received(self, service_name, host):
+        """Called by the schedulers on capability updates."""
+        pass
+
+    def is_up(self, service_ref):
+        """Check whether a service is up based on last heartbeat."""
+        last_heartbeat = (service_ref['updated_at'] or
+                          service_ref['created_at'])
+        # Timestamps in DB are UTC.
+        elapsed = utils.total_seconds(utils.utcnow() - last_heartbeat)
+        return abs(elapsed) <= FLAGS.service_down_time
+
+
+class SchedulerDriver(DbDriver):
+    """Sends the heartbeats to the schedulers as capability updates.
+
+    The schedulers already receive the capabilities of services through
+    a fanout, so they remember when they last heard from each service.
+    Other processes, and schedulers which haven't heard from a service
+    yet, fall back to the services table, which is still written every
+    half of service_down_time for them.
+    """
+
+    def __init__(self):
+        super(SchedulerDriver, self).__init__()
+        self._last_seen = {}  # { (service name, host) : time }
+
+    def report(self, context, service):
+        capabilities = getattr(service.manager, 'last_capabilities', None)
+        scheduler_api.update_service_capabilities(context, service.topic,
+                                                  service.host,
+                                                  capabilities or {})
+        return super(SchedulerDriver, self).report(context, service)
+
+    def _write_interval(self):
+        return FLAGS.service_down_time / 2.0
+
+    def capabilities_received(self, service_name, host):
+        self._last_seen[(service_name, host)] = utils.utcnow()
+
+    def is_up(self, service_ref):
+        last_seen = self._last_seen.get((service_ref['topic'],
+                                         service_ref['host']))
+        if last_seen is None:
+            return super(SchedulerDriver, self).is_up(service_ref)
+        elapsed = utils.total_seconds(utils.utcnow() - last_seen)
+        return abs(elapsed) <= FLAGS.service_down_time
@@ -100,6 +100,11 @@ FLAGS.register_opts(log_opts)
 logging.AUDIT = logging.INFO + 1
 logging.addLevelName(logging.AUDIT, 'AUDIT')
 
+# Levels to check with isEnabledFor() before building costly log messages
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+AUDIT = logging.AUDIT
+
 
 try:
     NullHandler = logging.NullHandler
@@ -151,6 +156,10 @@ class NovaContextAdapter(logging.LoggerAdapter):
     def audit(self, msg, *args, **kwargs):
         self.log(logging.AUDIT, msg, *args, **kwargs)
 
+    def isEnabledFor(self, level):
+        # NOTE: LoggerAdapter only delegates this itself from python 2.7
+        return self.logger.isEnabledFor(level)
+
     def process(self, msg, kwargs):
         if 'extra' not in kwargs:
             kwargs['extra'] = {}
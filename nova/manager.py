@@ -53,14 +53,30 @@ This module provides Manager, a base class for managers.
 
 """
 
+import random
+import time
+
+import eventlet
+
 from nova.db import base
 from nova import flags
 from nova import log as logging
+from nova.openstack.common import cfg
 from nova.scheduler import api
 from nova import version
 
 
+manager_opts = [
+    cfg.IntOpt('periodic_task_concurrency',
+               default=4,
+               help='Number of periodic tasks of a service which run at the '
+                    'same time. A task still running when it is due again '
+                    'is skipped. 0 runs the tasks one after the other in '
+                    'the periodic task loop.'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(manager_opts)
 
 
 LOG = logging.getLogger(__name__)
@@ -76,10 +92,19 @@ def periodic_task(*args, **kwargs):
 
         2. With arguments, @periodic_task(ticks_between_runs=N), this will be
            run on every N ticks of the periodic scheduler.
+
+        3. With arguments, @periodic_task(spacing=N), this will be run on
+           the first tick at least N seconds after its previous run.  The
+           first run happens on a random tick within the first N seconds,
+           so services started together don't all run it at once.  N may
+           also be the name of a flag holding the number of seconds, which
+           is looked up on every tick; a value of 0 or less from the flag
+           runs the task on every tick.
     """
     def decorator(f):
         f._periodic_task = True
         f._ticks_between_runs = kwargs.pop('ticks_between_runs', 0)
+        f._periodic_spacing = kwargs.pop('spacing', 0)
         return f
 
     # NOTE(sirp): The `if` is necessary to allow the decorator to be used with
@@ -134,10 +159,20 @@ class Manager(base.Base):
         if not host:
             host = FLAGS.host
         self.host = host
+        self._periodic_pool = None
+        self._periodic_running = set()
+        self._periodic_last_run = {}
+        self._periodic_stats = {}
         super(Manager, self).__init__(db_driver)
 
     def periodic_tasks(self, context, raise_on_error=False):
-        """Tasks to be run at a periodic interval."""
+        """Tasks to be run at a periodic interval.
+
+        Unless periodic_task_concurrency is 0 or raise_on_error is set, the
+        tasks due run in greenthreads of their own and this returns without
+        waiting for them to finish.
+        """
+        now = time.time()
         for task_name, task in self._periodic_tasks:
             full_task_name = '.'.join([self.__class__.__name__, task_name])
 
@@ -148,16 +183,77 @@ class Manager(base.Base):
                 self._ticks_to_skip[task_name] -= 1
                 continue
 
+            spacing = task._periodic_spacing
+            if isinstance(spacing, basestring):
+                spacing = getattr(FLAGS, spacing)
+            if spacing > 0:
+                last_run = self._periodic_last_run.get(task_name)
+                if last_run is None:
+                    # Spread the first runs of services started together
+                    last_run = now - random.uniform(0, spacing)
+                    self._periodic_last_run[task_name] = last_run
+                if last_run + spacing > now:
+                    continue
+
+            stats = self._periodic_stats.setdefault(task_name, {
+                    'runs': 0, 'errors': 0, 'overruns': 0, 'running': False,
+                    'last_start': None, 'last_duration': None,
+                    'max_duration': 0.0, 'total_duration': 0.0})
+            if task_name in self._periodic_running:
+                stats['overruns'] += 1
+                LOG.warn(_("Skipping %(full_task_name)s, its previous run "
+                           "is still running"), locals())
+                continue
+
             self._ticks_to_skip[task_name] = task._ticks_between_runs
+            self._periodic_last_run[task_name] = now
+            self._periodic_running.add(task_name)
             LOG.debug(_("Running periodic task %(full_task_name)s"), locals())
 
-            try:
-                task(self, context)
-            except Exception as e:
-                if raise_on_error:
-                    raise
-                LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
-                              locals())
+            if raise_on_error or FLAGS.periodic_task_concurrency <= 0:
+                self._run_periodic_task(context, task_name, task,
+                                        raise_on_error)
+            else:
+                if self._periodic_pool is None:
+                    self._periodic_pool = eventlet.GreenPool(
+                            FLAGS.periodic_task_concurrency)
+                # NOTE: blocks until one of the running tasks is done when
+                #       periodic_task_concurrency tasks are running already
+                self._periodic_pool.spawn_n(self._run_periodic_task,
+                                            context, task_name, task, False)
+
+    def _run_periodic_task(self, context, task_name, task, raise_on_error):
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        stats = self._periodic_stats[task_name]
+        stats['running'] = True
+        stats['last_start'] = start = time.time()
+        try:
+            task(self, context)
+        except Exception as e:
+            stats['errors'] += 1
+            if raise_on_error:
+                raise
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          locals())
+        finally:
+            duration = time.time() - start
+            stats['runs'] += 1
+            stats['running'] = False
+            stats['last_duration'] = duration
+            stats['max_duration'] = max(stats['max_duration'], duration)
+            stats['total_duration'] += duration
+            self._periodic_running.discard(task_name)
+            LOG.debug(_("Periodic task %(full_task_name)s took "
+                        "%(duration).2f seconds"), locals())
+
+    def periodic_task_stats(self, context):
+        """Return the run counts and durations of the periodic tasks.
+
+        Tasks which haven't been due yet are left out.  overruns counts the
+        runs skipped because the previous run was still going on.
+        """
+        return dict((task_name, stats.copy())
+                    for task_name, stats in self._periodic_stats.iteritems())
 
     def init_host(self):
         """Handle initialization if this is a standalone service.
@@ -23,6 +23,10 @@ import calendar
 import inspect
 import netaddr
 import os
+import time
+
+from eventlet import event
+from eventlet import greenthread
 
 from nova import db
 from nova import exception
@@ -79,6 +83,22 @@ linux_net_opts = [
                 default=False,
                 help='Use single default gateway. Only first nic of vm will '
                      'get default gateway from dhcp server'),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Only rewrite the chains changed since the last apply '
+                     'when possible, instead of saving and restoring every '
+                     'table each time'),
+    cfg.FloatOpt('iptables_apply_window',
+                 default=0.0,
+                 help='Number of seconds to wait for more changes before '
+                      'applying iptables rules, so that changes made close '
+                      'together are applied at once. 0 applies immediately'),
+    cfg.FloatOpt('dhcp_update_window',
+                 default=0.0,
+                 help='Number of seconds to wait for more fixed ips to be '
+                      'added or removed before rewriting the dnsmasq hosts '
+                      'file, so that changes made close together cause a '
+                      'single reload. 0 updates immediately'),
     ]
 
 FLAGS = flags.FLAGS
@@ -130,6 +150,22 @@ class IptablesTable(object):
         self.rules = []
         self.chains = set()
         self.unwrapped_chains = set()
+        # Changes since the last apply: wrapped chains whose rules have
+        # changed, and whether anything else has changed, in which case
+        # the whole table has to be rewritten.
+        self.dirty_chains = set()
+        self.dirty = True
+
+    def _mark_dirty(self, chain, wrap):
+        if wrap:
+            self.dirty_chains.add(chain)
+        else:
+            self.dirty = True
+
+    def clear_dirty(self):
+        """Forget about the changes made up to now."""
+        self.dirty_chains = set()
+        self.dirty = False
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -144,9 +180,12 @@ class IptablesTable(object):
 
         """
         if wrap:
-            self.chains.add(name)
+            chain_set = self.chains
         else:
-            self.unwrapped_chains.add(name)
+            chain_set = self.unwrapped_chains
+        if name not in chain_set:
+            chain_set.add(name)
+            self._mark_dirty(name, wrap)
 
     def remove_chain(self, name, wrap=True):
         """Remove named chain.
@@ -169,6 +208,8 @@ class IptablesTable(object):
 
         chain_set.remove(name)
         self.rules = filter(lambda r: r.chain != name, self.rules)
+        # The chain itself has to go, which needs a full rewrite.
+        self.dirty = True
 
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
@@ -195,6 +236,7 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         self.rules.append(IptablesRule(chain, rule, wrap, top))
+        self._mark_dirty(chain, wrap)
 
     def _wrap_target_chain(self, s):
         if s.startswith('$'):
@@ -211,6 +253,7 @@ class IptablesTable(object):
         """
         try:
             self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self._mark_dirty(chain, wrap)
         except ValueError:
             LOG.warn(_('Tried to remove rule that was not there:'
                        ' %(chain)r %(rule)r %(wrap)r %(top)r'),
@@ -219,10 +262,11 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        kept_rules = [rule for rule in self.rules
+                      if rule.chain != chain or rule.wrap != wrap]
+        if len(kept_rules) != len(self.rules):
+            self.rules = kept_rules
+            self._mark_dirty(chain, wrap)
 
 
 class IptablesManager(object):
@@ -254,6 +298,8 @@ class IptablesManager(object):
         else:
             self.execute = execute
 
+        self._pending_apply = None
+
         self.ipv4 = {'filter': IptablesTable(),
                      'nat': IptablesTable()}
         self.ipv6 = {'filter': IptablesTable()}
@@ -307,7 +353,6 @@ class IptablesManager(object):
         self.ipv4['nat'].add_chain('float-snat')
         self.ipv4['nat'].add_rule('snat', '-j $float-snat')
 
-    @utils.synchronized('iptables', external=True)
     def apply(self):
         """Apply the current in-memory set of iptables rules.
 
@@ -315,13 +360,44 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        If FLAGS.iptables_apply_window is set, calls made within that many
+        seconds of each other are applied together.
+
         """
+        if FLAGS.iptables_apply_window <= 0:
+            self._apply()
+            return
+
+        pending = self._pending_apply
+        if pending is not None:
+            # Someone is already waiting to apply, piggyback on them.
+            pending.wait()
+            return
+
+        pending = self._pending_apply = event.Event()
+        greenthread.sleep(FLAGS.iptables_apply_window)
+        # Calls from now on may have missed the rules being applied.
+        self._pending_apply = None
+        try:
+            self._apply()
+        except Exception as e:
+            pending.send_exception(e)
+            raise
+        pending.send()
+
+    @utils.synchronized('iptables', external=True)
+    def _apply(self):
+        start = time.time()
         s = [('iptables', self.ipv4)]
         if FLAGS.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
             for table in tables:
+                if (FLAGS.iptables_incremental_apply and
+                    not tables[table].dirty):
+                    self._apply_chains(cmd, table, tables[table])
+                    continue
                 current_table, _err = self.execute('%s-save' % (cmd,),
                                                    '-t', '%s' % (table,),
                                                    run_as_root=True,
@@ -332,7 +408,31 @@ class IptablesManager(object):
                 self.execute('%s-restore' % (cmd,), run_as_root=True,
                              process_input='\n'.join(new_filter),
                              attempts=5)
-        LOG.debug(_("IPTablesManager.apply completed with success"))
+                tables[table].clear_dirty()
+        LOG.debug(_("IPTablesManager.apply completed with success "
+                    "in %.3f seconds"), time.time() - start)
+
+    def _apply_chains(self, cmd, table_name, table):
+        """Rewrite only the wrapped chains of a table which have changed.
+
+        Declaring an existing chain to iptables-restore --noflush empties
+        it, leaving the rest of the table alone.
+
+        """
+        chains = table.dirty_chains & table.chains
+        if not chains:
+            table.clear_dirty()
+            return
+        lines = ['*%s' % (table_name,)]
+        lines += [':%s-%s - [0:0]' % (binary_name, name)
+                  for name in chains]
+        lines += self._weed_out_duplicates([str(rule) for rule in table.rules
+                                            if rule.wrap and
+                                               rule.chain in chains])
+        lines += ['COMMIT', '']
+        self.execute('%s-restore' % (cmd,), '--noflush', run_as_root=True,
+                     process_input='\n'.join(lines), attempts=5)
+        table.clear_dirty()
 
     def _modify_rules(self, current_lines, table, binary=None):
         unwrapped_chains = table.unwrapped_chains
@@ -353,16 +453,14 @@ class IptablesManager(object):
                 if not rule.startswith(':'):
                     break
 
-        our_rules = []
-        for rule in rules:
-            rule_str = str(rule)
-            if rule.top:
-                # rule.top == True means we want this rule to be at the top.
-                # Further down, we weed out duplicates from the bottom of the
-                # list, so here we remove the dupes ahead of time.
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
-            our_rules += [rule_str]
+        our_rules = [str(rule) for rule in rules]
+        # rule.top == True means we want this rule to be at the top.
+        # Further down, we weed out duplicates from the bottom of the
+        # list, so here we remove the dupes ahead of time.
+        top_rules = set(str(rule).strip() for rule in rules if rule.top)
+        if top_rules:
+            new_filter = [line for line in new_filter
+                          if line.strip() not in top_rules]
 
         new_filter[rules_index:rules_index] = our_rules
 
@@ -372,22 +470,20 @@ class IptablesManager(object):
                                                (binary_name, name,)
                                                for name in chains]
 
-        seen_lines = set()
+        return self._weed_out_duplicates(new_filter)
 
-        def _weed_out_duplicates(line):
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
-
-        # We filter duplicates, letting the *last* occurrence take
-        # precedence.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter.reverse()
-        return new_filter
+    def _weed_out_duplicates(self, lines):
+        """Filter duplicates, letting the *last* occurrence take precedence.
+        """
+        seen_lines = set()
+        new_lines = []
+        for line in reversed(lines):
+            stripped = line.strip()
+            if stripped not in seen_lines:
+                seen_lines.add(stripped)
+                new_lines.append(line)
+        new_lines.reverse()
+        return new_lines
 
 
 # NOTE(jkoelker) This is just a nice little stub point since mocking
@@ -581,8 +677,8 @@ def get_dhcp_leases(context, network_ref):
     return '\n'.join(hosts)
 
 
-def get_dhcp_hosts(context, network_ref):
-    """Get network's hosts config in dhcp-host format."""
+def _get_dhcp_host_lines(context, network_ref):
+    """Return the address and dhcp-host line of each of network's hosts."""
     hosts = []
     host = None
     if network_ref['multi_host']:
@@ -590,8 +686,14 @@ def get_dhcp_hosts(context, network_ref):
     for data in db.network_get_associated_fixed_ips(context,
                                                     network_ref['id'],
                                                     host=host):
-        hosts.append(_host_dhcp(data))
-    return '\n'.join(hosts)
+        hosts.append((data['address'], _host_dhcp(data)))
+    return hosts
+
+
+def get_dhcp_hosts(context, network_ref):
+    """Get network's hosts config in dhcp-host format."""
+    return '\n'.join(line for _address, line in
+                     _get_dhcp_host_lines(context, network_ref))
 
 
 def _add_dnsmasq_accept_rules(dev):
@@ -638,9 +740,80 @@ def release_dhcp(dev, address, mac_address):
     utils.execute('dhcp_release', dev, address, mac_address, run_as_root=True)
 
 
+# The dhcp-host lines served by the dnsmasq of each device, loaded by
+# update_dhcp() and kept up to date by add_dhcp_host() and
+# remove_dhcp_host(): { dev : { address : line } }
+_dhcp_hosts = {}
+# { dev : event.Event() } of the hosts file updates waiting to be written
+_pending_dhcp_updates = {}
+
+
 def update_dhcp(context, dev, network_ref):
+    hosts = _get_dhcp_host_lines(context, network_ref)
+    _dhcp_hosts[dev] = dict(hosts)
+    conffile = _dhcp_file(dev, 'conf')
+    write_to_file(conffile, '\n'.join(line for _address, line in hosts))
+    restart_dhcp(context, dev, network_ref)
+
+
+def add_dhcp_host(context, dev, network_ref, data):
+    """Serve a fixed ip, given as in network_get_associated_fixed_ips().
+
+    Only the hosts file of dev is rewritten, without looking up all the
+    other fixed ips of the network, once update_dhcp() loaded them.
+    """
+    hosts = _dhcp_hosts.get(dev)
+    if hosts is None:
+        update_dhcp(context, dev, network_ref)
+        return
+    hosts[data['address']] = _host_dhcp(data)
+    _update_dhcp_hostsfile(context, dev, network_ref)
+
+
+def remove_dhcp_host(context, dev, network_ref, address):
+    """Stop serving a fixed ip, see add_dhcp_host()."""
+    hosts = _dhcp_hosts.get(dev)
+    if hosts is None:
+        update_dhcp(context, dev, network_ref)
+        return
+    if hosts.pop(address, None) is not None:
+        _update_dhcp_hostsfile(context, dev, network_ref)
+
+
+def _update_dhcp_hostsfile(context, dev, network_ref):
+    """Write the hosts of dev and have dnsmasq reload them.
+
+    If FLAGS.dhcp_update_window is set, updates made within that many
+    seconds of each other are written together.
+    """
+    if FLAGS.dhcp_update_window <= 0:
+        _write_dhcp_hostsfile(context, dev, network_ref)
+        return
+
+    pending = _pending_dhcp_updates.get(dev)
+    if pending is not None:
+        # Someone is already waiting to write, piggyback on them.
+        pending.wait()
+        return
+
+    pending = _pending_dhcp_updates[dev] = event.Event()
+    greenthread.sleep(FLAGS.dhcp_update_window)
+    # Updates from now on may have missed the file being written.
+    del _pending_dhcp_updates[dev]
+    try:
+        _write_dhcp_hostsfile(context, dev, network_ref)
+    except Exception as e:
+        pending.send_exception(e)
+        raise
+    pending.send()
+
+
+def _write_dhcp_hostsfile(context, dev, network_ref):
     conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
+    # Replace the file at once, dnsmasq may read it at any time.
+    tmpfile = '%s.tmp' % conffile
+    write_to_file(tmpfile, '\n'.join(_dhcp_hosts[dev].itervalues()))
+    os.rename(tmpfile, conffile)
     restart_dhcp(context, dev, network_ref)
 
 
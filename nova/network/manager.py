@@ -47,12 +47,14 @@ import datetime
 import functools
 import itertools
 import math
+import os
 import re
 import socket
 
 from eventlet import greenpool
 import netaddr
 
+from nova.common import metadatacache
 from nova.compute import api as compute_api
 from nova import context
 from nova import exception
@@ -129,6 +131,12 @@ network_opts = [
     cfg.IntOpt('fixed_ip_disassociate_timeout',
                default=600,
                help='Seconds after which a deallocated ip is disassociated'),
+    cfg.IntOpt('fixed_ip_block_size',
+               default=0,
+               help='Number of free fixed ips a network host reserves at '
+                    'once and allocates from without locking the fixed ips '
+                    'of the network in the database. 0 locks the first free '
+                    'fixed ip for every allocation'),
     cfg.IntOpt('create_unique_mac_address_attempts',
                default=5,
                help='Number of attempts to create unique mac address'),
@@ -483,6 +491,7 @@ class FloatingIP(object):
                                                floating_address,
                                                fixed_address,
                                                self.host)
+        metadatacache.invalidate_address(fixed_address)
         try:
             # gogo driver time
             self.l3driver.add_floating_ip(floating_address, fixed_address,
@@ -542,6 +551,7 @@ class FloatingIP(object):
         """Performs db and driver calls to disassociate floating ip"""
         # disassociate floating ip
         fixed_address = self.db.floating_ip_disassociate(context, address)
+        metadatacache.invalidate_address(fixed_address)
 
         # go go driver time
         self.l3driver.remove_floating_ip(address, fixed_address, interface)
@@ -720,6 +730,10 @@ class NetworkManager(manager.SchedulerDependentManager):
             self._import_ipam_lib('nova.network.quantum.nova_ipam_lib')
         l3_lib = kwargs.get("l3_lib", FLAGS.l3_lib)
         self.l3driver = utils.import_object(l3_lib)
+        # ids of the networks with dhcp set up on this host
+        self._dhcp_networks = set()
+        # free fixed ips reserved by this host, { network id : [address] }
+        self._fixed_ip_blocks = {}
 
         super(NetworkManager, self).__init__(service_name='network',
                                                 *args, **kwargs)
@@ -759,6 +773,8 @@ class NetworkManager(manager.SchedulerDependentManager):
         # NOTE(vish): Set up networks for which this host already has
         #             an ip address.
         ctxt = context.get_admin_context()
+        # Give back the fixed ips reserved before the service restarted.
+        self.db.fixed_ip_unreserve_block(ctxt, self.host)
         for network in self.db.network_get_all_by_host(ctxt, self.host):
             self._setup_network_on_host(ctxt, network)
 
@@ -768,9 +784,12 @@ class NetworkManager(manager.SchedulerDependentManager):
             now = utils.utcnow()
             timeout = FLAGS.fixed_ip_disassociate_timeout
             time = now - datetime.timedelta(seconds=timeout)
+            # Put the fixed ips back in the block of this host at once
+            reserve = FLAGS.fixed_ip_block_size > 0
             num = self.db.fixed_ip_disassociate_all_by_timeout(context,
                                                                self.host,
-                                                               time)
+                                                               time,
+                                                               reserve)
             if num:
                 LOG.debug(_('Disassociated %s stale fixed ip(s)'), num)
 
@@ -805,51 +824,61 @@ class NetworkManager(manager.SchedulerDependentManager):
         fixed_ip_filter = filters.get('fixed_ip')
         ip_filter = re.compile(str(filters.get('ip')))
         ipv6_filter = re.compile(str(filters.get('ip6')))
-
-        # NOTE(jkoelker) Should probably figure out a better way to do
-        #                this. But for now it "works", this could suck on
-        #                large installs.
-
-        vifs = self.db.virtual_interface_get_all(context)
         results = []
 
-        for vif in vifs:
-            if vif['instance_id'] is None:
-                continue
+        if 'ip6' in filters:
+            # NOTE(jkoelker) Should probably figure out a better way to do
+            #                this. But for now it "works", this could suck on
+            #                large installs.
+            vifs = self.db.virtual_interface_get_all(context)
+            networks = {}
+            for vif in vifs:
+                if vif['instance_id'] is None:
+                    continue
 
-            network = self._get_network_by_id(context, vif['network_id'])
-            fixed_ipv6 = None
-            if network['cidr_v6'] is not None:
+                network_id = vif['network_id']
+                if network_id not in networks:
+                    networks[network_id] = self._get_network_by_id(context,
+                                                                   network_id)
+                network = networks[network_id]
+                if network['cidr_v6'] is None:
+                    continue
                 fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
                                             vif['address'],
                                             context.project_id)
-
-            if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
-                # NOTE(jkoelker) Will need to update for the UUID flip
-                results.append({'instance_id': vif['instance_id'],
-                                'ip': fixed_ipv6})
-
-            vif_id = vif['id']
-            fixed_ips = self.db.fixed_ips_by_virtual_interface(context,
-                                                               vif_id)
-            for fixed_ip in fixed_ips:
-                if not fixed_ip or not fixed_ip['address']:
-                    continue
-                if fixed_ip['address'] == fixed_ip_filter:
-                    results.append({'instance_id': vif['instance_id'],
-                                    'ip': fixed_ip['address']})
-                    continue
-                if ip_filter.match(fixed_ip['address']):
+                if ipv6_filter.match(fixed_ipv6):
+                    # NOTE(jkoelker) Will need to update for the UUID flip
                     results.append({'instance_id': vif['instance_id'],
-                                    'ip': fixed_ip['address']})
-                    continue
-                for floating_ip in fixed_ip.get('floating_ips', []):
-                    if not floating_ip or not floating_ip['address']:
-                        continue
-                    if ip_filter.match(floating_ip['address']):
-                        results.append({'instance_id': vif['instance_id'],
-                                        'ip': floating_ip['address']})
-                        continue
+                                    'ip': fixed_ipv6})
+
+        # Only look at the addresses starting like the ones searched for.
+        prefixes = []
+        if fixed_ip_filter:
+            prefixes.append(fixed_ip_filter)
+        if 'ip' in filters:
+            prefixes.append(utils.regexp_literal_prefix(str(filters['ip'])))
+        if prefixes:
+            prefix = os.path.commonprefix(prefixes)
+            fixed_ips = self.db.fixed_ip_get_all_by_address_prefix(context,
+                                                                   prefix)
+        else:
+            fixed_ips = []
+
+        for fixed_ip in fixed_ips:
+            if not fixed_ip['address']:
+                continue
+            if fixed_ip['address'] == fixed_ip_filter:
+                results.append({'instance_id': fixed_ip['instance_id'],
+                                'ip': fixed_ip['address']})
+                continue
+            if ip_filter.match(fixed_ip['address']):
+                results.append({'instance_id': fixed_ip['instance_id'],
+                                'ip': fixed_ip['address']})
+                continue
+            for floating_ip in fixed_ip['floating_ips']:
+                if ip_filter.match(floating_ip['address']):
+                    results.append({'instance_id': fixed_ip['instance_id'],
+                                    'ip': floating_ip['address']})
 
         # NOTE(jkoelker) Until we switch over to instance_uuid ;)
         ids = [res['instance_id'] for res in results]
@@ -1156,6 +1185,36 @@ class NetworkManager(manager.SchedulerDependentManager):
         else:
             return True
 
+    def _associate_pool_fixed_ip(self, context, network_id, instance_id):
+        """Associate a free fixed ip of the network to the instance.
+
+        With fixed_ip_block_size set, free fixed ips are reserved for this
+        host that many at a time, and then associated one by one without
+        contending with other hosts for the first free fixed ip.  Once none
+        are left to reserve, the fixed ips reserved by other hosts are
+        taken from the pool.
+        """
+        if FLAGS.fixed_ip_block_size <= 0:
+            return self.db.fixed_ip_associate_pool(context, network_id,
+                                                   instance_id)
+        block = self._fixed_ip_blocks.setdefault(network_id, [])
+        while True:
+            if not block:
+                block.extend(self.db.fixed_ip_reserve_block(context,
+                        network_id, self.host, FLAGS.fixed_ip_block_size))
+                if not block:
+                    return self.db.fixed_ip_associate_pool(context,
+                                                           network_id,
+                                                           instance_id)
+            address = block.pop(0)
+            try:
+                return self.db.fixed_ip_associate(context, address,
+                                                  instance_id, network_id)
+            except (exception.FixedIpAlreadyInUse,
+                    exception.FixedIpNotFoundForNetwork):
+                # Asked for by address or reserved since we reserved it.
+                continue
+
     def allocate_fixed_ip(self, context, instance_id, network, **kwargs):
         """Gets a fixed ip from the pool."""
         # TODO(vish): when this is called by compute, we can associate compute
@@ -1163,6 +1222,7 @@ class NetworkManager(manager.SchedulerDependentManager):
         #             and use that network here with a method like
         #             network_get_by_compute_host
         address = None
+        vif = None
         if network['cidr']:
             address = kwargs.get('address', None)
             if address:
@@ -1170,9 +1230,9 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                      address, instance_id,
                                                      network['id'])
             else:
-                address = self.db.fixed_ip_associate_pool(context.elevated(),
-                                                          network['id'],
-                                                          instance_id)
+                address = self._associate_pool_fixed_ip(context.elevated(),
+                                                        network['id'],
+                                                        instance_id)
             self._do_trigger_security_group_members_refresh_for_instance(
                                                                    instance_id)
             get_vif = self.db.virtual_interface_get_by_instance_and_network
@@ -1192,7 +1252,7 @@ class NetworkManager(manager.SchedulerDependentManager):
             self.instance_dns_manager.create_entry(uuid, address,
                                                    "A",
                                                    self.instance_dns_domain)
-        self._setup_network_on_host(context, network)
+        self._setup_fixed_ip_on_host(context, network, address, vif)
         return address
 
     def deallocate_fixed_ip(self, context, address, **kwargs):
@@ -1213,7 +1273,7 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                       self.instance_dns_domain)
 
         network = self._get_network_by_id(context, fixed_ip_ref['network_id'])
-        self._teardown_network_on_host(context, network)
+        self._teardown_fixed_ip_on_host(context, network, address)
 
         if FLAGS.force_dhcp_release:
             dev = self.driver.get_dev(network)
@@ -1435,25 +1495,25 @@ class NetworkManager(manager.SchedulerDependentManager):
     def _create_fixed_ips(self, context, network_id, fixed_cidr=None):
         """Create all fixed ips for network."""
         network = self._get_network_by_id(context, network_id)
+        if not fixed_cidr:
+            fixed_cidr = netaddr.IPNetwork(network['cidr'])
+        LOG.info(_('Creating %(size)d fixed ips for network %(network_id)s'),
+                 {'size': fixed_cidr.size, 'network_id': network_id})
+        self.db.fixed_ip_bulk_create(context,
+                                     self._generate_fixed_ips(network_id,
+                                                              fixed_cidr))
+
+    def _generate_fixed_ips(self, network_id, fixed_cidr):
+        """Yield the values of every fixed ip of fixed_cidr in order."""
         # NOTE(vish): Should these be properties of the network as opposed
         #             to properties of the manager class?
         bottom_reserved = self._bottom_reserved_ips
-        top_reserved = self._top_reserved_ips
-        if not fixed_cidr:
-            fixed_cidr = netaddr.IPNetwork(network['cidr'])
-        num_ips = len(fixed_cidr)
-        ips = []
-        for index in range(num_ips):
-            address = str(fixed_cidr[index])
-            if index < bottom_reserved or num_ips - index <= top_reserved:
-                reserved = True
-            else:
-                reserved = False
-
-            ips.append({'network_id': network_id,
-                        'address': address,
-                        'reserved': reserved})
-        self.db.fixed_ip_bulk_create(context, ips)
+        top_reserved = fixed_cidr.size - self._top_reserved_ips
+        for index, address in enumerate(fixed_cidr):
+            reserved = index < bottom_reserved or index >= top_reserved
+            yield {'network_id': network_id,
+                   'address': str(address),
+                   'reserved': reserved}
 
     def _allocate_fixed_ips(self, context, instance_id, host, networks,
                             **kwargs):
@@ -1514,6 +1574,36 @@ class NetworkManager(manager.SchedulerDependentManager):
         """Sets up network on this host."""
         raise NotImplementedError()
 
+    def _setup_fixed_ip_on_host(self, context, network, address, vif):
+        """Sets up a fixed ip allocated to vif on this host.
+
+        Once dhcp is set up for the network on this host only the new
+        host is added to it, instead of setting up the network again.
+        """
+        if (not address or not vif or FLAGS.fake_network or
+            network['id'] not in self._dhcp_networks):
+            self._setup_network_on_host(context, network)
+            return
+        instance_ref = self.db.instance_get(context, vif['instance_id'])
+        data = {'address': address,
+                'instance_id': vif['instance_id'],
+                'network_id': network['id'],
+                'vif_id': vif['id'],
+                'vif_address': vif['address'],
+                'instance_hostname': instance_ref['hostname']}
+        network['dhcp_server'] = self._get_dhcp_ip(context, network)
+        dev = self.driver.get_dev(network)
+        self.driver.add_dhcp_host(context, dev, network, data)
+
+    def _teardown_fixed_ip_on_host(self, context, network, address):
+        """Tears down a fixed ip deallocated on this host."""
+        if FLAGS.fake_network or network['id'] not in self._dhcp_networks:
+            self._teardown_network_on_host(context, network)
+            return
+        network['dhcp_server'] = self._get_dhcp_ip(context, network)
+        dev = self.driver.get_dev(network)
+        self.driver.remove_dhcp_host(context, dev, network, address)
+
     @wrap_check_policy
     def validate_networks(self, context, networks):
         """check if the networks exists and host
@@ -1709,6 +1799,7 @@ class FlatDHCPManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         if not FLAGS.fake_network:
             dev = self.driver.get_dev(network)
             self.driver.update_dhcp(context, dev, network)
+            self._dhcp_networks.add(network['id'])
             if(FLAGS.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
@@ -1786,9 +1877,9 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
                                                      instance_id,
                                                      network['id'])
             else:
-                address = self.db.fixed_ip_associate_pool(context,
-                                                          network['id'],
-                                                          instance_id)
+                address = self._associate_pool_fixed_ip(context,
+                                                        network['id'],
+                                                        instance_id)
             self._do_trigger_security_group_members_refresh_for_instance(
                                                                    instance_id)
         vif = self.db.virtual_interface_get_by_instance_and_network(context,
@@ -1797,7 +1888,7 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         values = {'allocated': True,
                   'virtual_interface_id': vif['id']}
         self.db.fixed_ip_update(context, address, values)
-        self._setup_network_on_host(context, network)
+        self._setup_fixed_ip_on_host(context, network, address, vif)
         return address
 
     @wrap_check_policy
@@ -1858,6 +1949,7 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         if not FLAGS.fake_network:
             dev = self.driver.get_dev(network)
             self.driver.update_dhcp(context, dev, network)
+            self._dhcp_networks.add(network['id'])
             if(FLAGS.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
@@ -40,6 +40,7 @@ import hashlib
 import os
 import os.path
 import urllib
+import uuid
 
 import routes
 import webob
@@ -57,6 +58,28 @@ buckets_path_opt = cfg.StrOpt('buckets_path', default='$state_path/buckets',
 FLAGS = flags.FLAGS
 FLAGS.register_opt(buckets_path_opt)
 
+# Objects are read and written in chunks of this size, so their size is not
+# bounded by memory.
+CHUNK_SIZE = 65536
+
+# Prefix of the files objects are uploaded to before being renamed.
+TEMP_PREFIX = '.s3server-upload-'
+
+
+def _file_iter(object_file, start, stop):
+    """Yield the bytes [start, stop) of a file and close it."""
+    try:
+        object_file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = object_file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        object_file.close()
+
 
 def get_wsgi_server():
     return wsgi.Server("S3 Objectstore",
@@ -150,6 +173,18 @@ class BaseRequestHandler(object):
     def finish(self, body=''):
         self.response.body = utils.utf8(body)
 
+    def finish_file(self, object_file, start, stop, size):
+        """Respond with the bytes [start, stop) of an open file.
+
+        The file is streamed in chunks and closed once sent.
+        """
+        file_wrapper = self.request.environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and start == 0 and stop == size:
+            self.response.app_iter = file_wrapper(object_file, CHUNK_SIZE)
+        else:
+            self.response.app_iter = _file_iter(object_file, start, stop)
+        self.response.content_length = stop - start
+
     def invalid(self, **kwargs):
         pass
 
@@ -230,6 +265,9 @@ class BucketHandler(BaseRequestHandler):
         object_names = []
         for root, dirs, files in os.walk(path):
             for file_name in files:
+                if file_name.startswith(TEMP_PREFIX):
+                    # An upload in progress
+                    continue
                 object_names.append(os.path.join(root, file_name))
         skip = len(path) + 1
         for i in range(self.application.bucket_depth):
@@ -305,14 +343,25 @@ class ObjectHandler(BaseRequestHandler):
             self.set_status(404)
             return
         info = os.stat(path)
+        size = info.st_size
+        start, stop = 0, size
+        byte_range = self.request.range
+        # Multiple ranges are answered with the whole object, which HTTP
+        # allows, rather than a multipart body.
+        if byte_range is not None and len(byte_range.ranges) == 1:
+            content_range = byte_range.content_range(size)
+            if content_range is None:
+                self.set_status(416)
+                self.set_header("Content-Range", "bytes */%d" % size)
+                return
+            start, stop = content_range.start, content_range.stop
+            self.set_status(206)
+            self.set_header("Content-Range", str(content_range))
+        self.set_header("Accept-Ranges", "bytes")
         self.set_header("Content-Type", "application/unknown")
         self.set_header("Last-Modified", datetime.datetime.utcfromtimestamp(
             info.st_mtime))
-        object_file = open(path, "r")
-        try:
-            self.finish(object_file.read())
-        finally:
-            object_file.close()
+        self.finish_file(open(path, "rb"), start, stop, size)
 
     def put(self, bucket, object_name):
         object_name = urllib.unquote(object_name)
@@ -329,11 +378,31 @@ class ObjectHandler(BaseRequestHandler):
         directory = os.path.dirname(path)
         if not os.path.exists(directory):
             os.makedirs(directory)
-        object_file = open(path, "w")
-        object_file.write(self.request.body)
-        object_file.close()
-        self.set_header('ETag',
-                        '"%s"' % hashlib.md5(self.request.body).hexdigest())
+        # Write to a temporary file first, so a failed upload doesn't
+        # leave a partial object behind, and hash the body on the way.
+        temp_path = os.path.join(directory, TEMP_PREFIX + str(uuid.uuid4()))
+        md5 = hashlib.md5()
+        body_file = self.request.body_file
+        remaining = self.request.content_length
+        try:
+            with open(temp_path, "wb") as object_file:
+                while remaining is None or remaining > 0:
+                    size = CHUNK_SIZE
+                    if remaining is not None:
+                        size = min(size, remaining)
+                    chunk = body_file.read(size)
+                    if not chunk:
+                        break
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    md5.update(chunk)
+                    object_file.write(chunk)
+            os.rename(temp_path, path)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+        self.set_header('ETag', '"%s"' % md5.hexdigest())
         self.finish()
 
     def delete(self, bucket, object_name):
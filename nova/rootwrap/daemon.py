@@ -0,0 +1,187 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-lived nova-rootwrap serving commands over a Unix socket.
+
+Started as "nova-rootwrap --daemon", the filters are loaded once and every
+command sent over the socket is checked against them and run in its own
+thread, instead of sudo starting nova-rootwrap for each command.
+
+The socket is SOCKET_DIR/<uid>.sock, uid being the user which started the
+daemon through sudo, and only that user can access it.  The caller of
+nova-rootwrap has no say in where the socket goes: SOCKET_DIR must only be
+writable by root, so every socket in there was made by a daemon.
+
+Every message is a 4 byte length followed by that many bytes.  A request
+is the JSON list of the command and its arguments, then the input of the
+command.  The reply is the JSON exit code of the command, then its output
+and its error output.
+"""
+
+import errno
+import json
+import os
+import SocketServer
+import stat
+import struct
+import subprocess
+
+from nova.rootwrap import wrapper
+
+
+# Same exit codes as nova-rootwrap
+RC_UNAUTHORIZED = 99
+RC_NOCOMMAND = 98
+
+_HEADER = struct.Struct('!I')
+
+SOCKET_DIR = '/var/run/nova-rootwrap'
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def socket_path(uid):
+    """Return the socket of the daemon serving the user uid."""
+    return os.path.join(SOCKET_DIR, '%d.sock' % uid)
+
+
+def _check_socket_dir(path):
+    """Create path, or make sure only we can add sockets to it."""
+    try:
+        os.mkdir(path, 0755)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+    st = os.lstat(path)
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid() or
+        st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+        raise OSError(errno.EPERM,
+                      '%s must be a directory only writable by uid %d' %
+                      (path, os.geteuid()))
+
+
+def send_message(sock, data):
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    size, = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return _recv_exactly(sock, size)
+
+
+def run_command(filters, userargs, process_input):
+    """Run userargs if a filter allows it, like nova-rootwrap does.
+
+    Returns the exit code, output and error output of the command.
+    """
+    if not userargs:
+        return RC_NOCOMMAND, 'No command specified\n', ''
+    filtermatch = wrapper.match_filter(filters, userargs)
+    if not filtermatch:
+        return (RC_UNAUTHORIZED,
+                'Unauthorized command: %s\n' % ' '.join(userargs), '')
+    try:
+        obj = subprocess.Popen(filtermatch.get_command(userargs),
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               close_fds=True,
+                               env=filtermatch.get_environment(userargs))
+    except OSError, e:
+        return 1, '', '%s\n' % e
+    stdout, stderr = obj.communicate(process_input)
+    return obj.returncode, stdout, stderr
+
+
+class RootwrapRequestHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        try:
+            userargs = json.loads(recv_message(self.request))
+            process_input = recv_message(self.request)
+        except (EOFError, ValueError):
+            return
+        if (not isinstance(userargs, list) or
+            not all(isinstance(arg, basestring) for arg in userargs)):
+            return
+        userargs = [arg.encode('utf-8') for arg in userargs]
+        returncode, stdout, stderr = run_command(self.server.filters,
+                                                 userargs,
+                                                 process_input or None)
+        send_message(self.request, json.dumps(returncode))
+        send_message(self.request, stdout)
+        send_message(self.request, stderr)
+
+
+class RootwrapServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    """Runs the commands of each connection in a thread of its own."""
+
+    daemon_threads = True
+
+    def __init__(self, path, filters, uid=None, gid=None):
+        self.filters = filters
+        self.uid = uid
+        self.gid = gid
+        SocketServer.UnixStreamServer.__init__(self, path,
+                                               RootwrapRequestHandler)
+
+    def server_bind(self):
+        _check_socket_dir(os.path.dirname(self.server_address))
+        # Nobody else can write to the directory, so a socket in there is
+        # the one of a previous daemon.
+        try:
+            if stat.S_ISSOCK(os.lstat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except OSError:
+            pass
+        SocketServer.UnixStreamServer.server_bind(self)
+        os.chmod(self.server_address, 0600)
+        if self.uid is not None:
+            os.chown(self.server_address, self.uid, self.gid)
+
+
+def start():
+    """Serve commands on the socket of the sudo user in the background.
+
+    Returns once the socket accepts connections, so the caller knows
+    the daemon is ready when nova-rootwrap exits.
+    """
+    uid = int(os.environ.get('SUDO_UID', os.getuid()))
+    gid = int(os.environ.get('SUDO_GID', os.getgid()))
+    server = RootwrapServer(socket_path(uid), wrapper.load_filters(),
+                            uid, gid)
+    if os.fork():
+        return
+    os.setsid()
+    # Let the caller see the end of our output.
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(1)
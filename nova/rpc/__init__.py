@@ -160,6 +160,16 @@ def cleanup():
     return _get_impl().cleanup()
 
 
+def dispatch_stats():
+    """Return the load of the pools running the methods called by RPC.
+
+    :returns: A dict of the consumers of this process, each a dict of its
+              worker pools with their 'size', the number of methods
+              'running' and the number of messages 'waiting' for a worker.
+    """
+    return _get_impl().dispatch_stats()
+
+
 def cast_to_server(context, server_params, topic, msg):
     """Invoke a remote method that does not return anything.
 
@@ -25,24 +25,68 @@ Specifically, this includes impl_kombu and impl_qpid.  impl_carrot also uses
 AMQP, but is deprecated and predates this code.
 """
 
+import bisect
+import collections
 import inspect
 import sys
+import time
 import uuid
+import weakref
 
-from eventlet import greenpool
+from eventlet import greenthread
 from eventlet import pools
+from eventlet import queue
+from eventlet import semaphore
 
 from nova import context
 from nova import exception
 from nova import flags
 from nova import log as logging
+from nova.openstack.common import cfg
 from nova.openstack.common import local
 import nova.rpc.common as rpc_common
 
 LOG = logging.getLogger(__name__)
 
+amqp_opts = [
+    cfg.BoolOpt('amqp_rpc_single_reply_queue',
+                default=False,
+                help='Receive the replies to all calls of a process on one '
+                     'long-lived queue instead of declaring a queue for '
+                     'each call. Only enable once every service replying '
+                     'to calls supports it.'),
+    cfg.IntOpt('rpc_prefetch_count',
+               default=0,
+               help='Maximum number of unacknowledged messages the broker '
+                    'sends to each kombu consumer, 0 for no limit. Messages '
+                    'past the backlog of a busy worker pool stay '
+                    'unacknowledged until a worker takes them, so this '
+                    'leaves the rest on the broker'),
+    cfg.ListOpt('rpc_method_pools',
+                default=[],
+                help='method:pool pairs, the methods listed run in the '
+                     'named worker pools instead of the pool of their '
+                     'topic, e.g. refresh_security_group_members:secgroups'),
+    cfg.IntOpt('rpc_method_pool_size',
+               default=64,
+               help='Size of each pool named in rpc_method_pools'),
+    cfg.IntOpt('rpc_pool_backlog',
+               default=0,
+               help='Number of messages which are acknowledged while they '
+                    'wait for a free worker in each pool. Messages past that '
+                    'are acknowledged when a worker takes them'),
+    ]
 
 FLAGS = flags.FLAGS
+FLAGS.register_opts(amqp_opts)
+
+# Upper bounds, in seconds, of the buckets of the method duration histograms
+METHOD_DURATION_BUCKETS = (0.01, 0.1, 1.0, 10.0, 60.0)
+
+_method_stats = {}
+
+# Names of the consumers of the ProxyCallbacks, for dispatch_stats()
+_proxy_callbacks = weakref.WeakKeyDictionary()
 
 
 class Pool(pools.Pool):
@@ -52,6 +96,8 @@ class Pool(pools.Pool):
         kwargs.setdefault("max_size", FLAGS.rpc_conn_pool_size)
         kwargs.setdefault("order_as_stack", True)
         super(Pool, self).__init__(*args, **kwargs)
+        self.reply_proxy = None
+        self.reply_proxy_lock = semaphore.Semaphore()
 
     # TODO(comstud): Timeout connections not used in a while
     def create(self):
@@ -61,6 +107,11 @@ class Pool(pools.Pool):
     def empty(self):
         while self.free_items:
             self.get().close()
+            # The closed connection no longer counts towards max_size
+            self.current_size -= 1
+        if self.reply_proxy:
+            self.reply_proxy.close()
+            self.reply_proxy = None
 
 
 class ConnectionContext(rpc_common.Connection):
@@ -132,10 +183,12 @@ class ConnectionContext(rpc_common.Connection):
             raise exception.InvalidRPCConnectionReuse()
 
 
-def msg_reply(msg_id, connection_pool, reply=None, failure=None, ending=False):
+def msg_reply(msg_id, connection_pool, reply=None, failure=None, ending=False,
+              reply_q=None):
     """Sends a reply or an error on the channel signified by msg_id.
 
-    Failure should be a sys.exc_info() tuple.
+    Failure should be a sys.exc_info() tuple.  If reply_q is given, the
+    reply is sent to that queue and tagged with msg_id instead.
 
     """
     with ConnectionContext(connection_pool) as conn:
@@ -150,20 +203,25 @@ def msg_reply(msg_id, connection_pool, reply=None, failure=None, ending=False):
                     'failure': failure}
         if ending:
             msg['ending'] = True
-        conn.direct_send(msg_id, msg)
+        if reply_q:
+            msg['_msg_id'] = msg_id
+            conn.direct_send(reply_q, msg)
+        else:
+            conn.direct_send(msg_id, msg)
 
 
 class RpcContext(context.RequestContext):
     """Context that supports replying to a rpc.call"""
     def __init__(self, *args, **kwargs):
         self.msg_id = kwargs.pop('msg_id', None)
+        self.reply_q = kwargs.pop('reply_q', None)
         super(RpcContext, self).__init__(*args, **kwargs)
 
     def reply(self, reply=None, failure=None, ending=False,
               connection_pool=None):
         if self.msg_id:
             msg_reply(self.msg_id, connection_pool, reply, failure,
-                      ending)
+                      ending, self.reply_q)
             if ending:
                 self.msg_id = None
 
@@ -179,8 +237,11 @@ def unpack_context(msg):
             value = msg.pop(key)
             context_dict[key[9:]] = value
     context_dict['msg_id'] = msg.pop('_msg_id', None)
+    context_dict['reply_q'] = msg.pop('_reply_q', None)
     ctx = RpcContext.from_dict(context_dict)
-    rpc_common._safe_log(LOG.debug, _('unpacked context: %s'), ctx.to_dict())
+    if LOG.isEnabledFor(logging.DEBUG):
+        rpc_common._safe_log(LOG.debug, _('unpacked context: %s'),
+                             ctx.to_dict())
     return ctx
 
 
@@ -198,19 +259,105 @@ def pack_context(msg, context):
     msg.update(context_d)
 
 
+class DispatchPool(object):
+    """Runs the methods called through a consumer in greenthreads.
+
+    Up to size methods run at the same time, the others wait in the queue
+    of the pool.  spawn() never blocks: the topic, topic.host and fanout
+    consumers of a service share one greenthread, so waiting on a busy
+    pool would hold up the messages of all the others.  Instead, only the
+    first backlog waiting messages are acknowledged right away, the ack of
+    the others is deferred until a worker takes them.  The broker stops
+    sending once rpc_prefetch_count messages are unacknowledged, so a busy
+    pool leaves the messages it can't take on the broker.
+    """
+
+    def __init__(self, size, backlog=0):
+        self.size = size
+        self.backlog = backlog
+        self.running = 0
+        self._queue = collections.deque()
+
+    @property
+    def waiting(self):
+        return len(self._queue)
+
+    def spawn(self, func, *args, **kwargs):
+        """Queue func(*args), calling ack() once the pool takes it on."""
+        ack = kwargs.get('ack')
+        if self.running < self.size:
+            if ack:
+                ack()
+            self.running += 1
+            greenthread.spawn_n(self._worker, func, args)
+            return
+        if ack and self.waiting < self.backlog:
+            ack()
+            ack = None
+        self._queue.append((func, args, ack))
+
+    def _worker(self, func, args):
+        try:
+            self._run(func, args)
+            while self._queue:
+                func, args, ack = self._queue.popleft()
+                if ack:
+                    try:
+                        ack()
+                    except Exception:
+                        # NOTE: the broker redelivers unacknowledged
+                        #       messages, don't run them twice.
+                        LOG.exception(_('Failed to acknowledge message, '
+                                        'skipping it'))
+                        continue
+                self._run(func, args)
+        finally:
+            self.running -= 1
+
+    def _run(self, func, args):
+        try:
+            func(*args)
+        except Exception:
+            LOG.exception(_('Exception in RPC worker'))
+
+    def stats(self):
+        return {'size': self.size,
+                'running': self.running,
+                'waiting': self.waiting}
+
+
 class ProxyCallback(object):
-    """Calls methods on a proxy object based on method and args."""
+    """Calls methods on a proxy object based on method and args.
 
-    def __init__(self, proxy, connection_pool):
+    The methods listed in rpc_method_pools run in pools of their own, so a
+    flood of one of them doesn't hold up the other methods.  The messages
+    acknowledged while they wait in a pool, up to rpc_pool_backlog of them,
+    are lost if the service stops.
+    """
+
+    def __init__(self, proxy, connection_pool, name=None):
         self.proxy = proxy
-        self.pool = greenpool.GreenPool(FLAGS.rpc_thread_pool_size)
+        self.pools = {'default': DispatchPool(FLAGS.rpc_thread_pool_size,
+                                              FLAGS.rpc_pool_backlog)}
+        self.method_pools = {}
+        for method_pool in FLAGS.rpc_method_pools:
+            method, _sep, pool_name = method_pool.partition(':')
+            pool_name = pool_name or method
+            if pool_name not in self.pools:
+                self.pools[pool_name] = DispatchPool(
+                        FLAGS.rpc_method_pool_size, FLAGS.rpc_pool_backlog)
+            self.method_pools[method] = self.pools[pool_name]
         self.connection_pool = connection_pool
+        if name:
+            _proxy_callbacks[self] = name
 
-    def __call__(self, message_data):
+    def __call__(self, message_data, ack=None):
         """Consumer callback to call a method on a proxy object.
 
         Parses the message for validity and fires off a thread to call the
-        proxy object method.
+        proxy object method.  If ack is given, it is called to acknowledge
+        the message once a pool takes it on, otherwise the consumer
+        acknowledges it when this returns.
 
         Message data should be a dictionary with two keys:
             method: string representing the method to call
@@ -223,16 +370,21 @@ class ProxyCallback(object):
         # the previous context is stored in local.store.context
         if hasattr(local.store, 'context'):
             del local.store.context
-        rpc_common._safe_log(LOG.debug, _('received %s'), message_data)
+        if LOG.isEnabledFor(logging.DEBUG):
+            rpc_common._safe_log(LOG.debug, _('received %s'), message_data)
         ctxt = unpack_context(message_data)
         method = message_data.get('method')
         args = message_data.get('args', {})
         if not method:
-            LOG.warn(_('no method for message: %s') % message_data)
+            rpc_common._safe_log(LOG.warn, _('no method for message: %s'),
+                                 message_data)
             ctxt.reply(_('No method for message: %s') % message_data,
                        connection_pool=self.connection_pool)
+            if ack:
+                ack()
             return
-        self.pool.spawn_n(self._process_data, ctxt, method, args)
+        pool = self.method_pools.get(method, self.pools['default'])
+        pool.spawn(self._process_data, ctxt, method, args, ack=ack)
 
     @exception.wrap_exception()
     def _process_data(self, ctxt, method, args):
@@ -240,6 +392,8 @@ class ProxyCallback(object):
         object and calls it.
         """
         ctxt.update_store()
+        start = time.time()
+        recorded = False
         try:
             node_func = getattr(self.proxy, str(method))
             node_args = dict((str(k), v) for k, v in args.iteritems())
@@ -249,11 +403,24 @@ class ProxyCallback(object):
             if inspect.isgenerator(rval):
                 for x in rval:
                     ctxt.reply(x, None, connection_pool=self.connection_pool)
+            elif ctxt.reply_q and rval is not None:
+                # Callers using a reply queue take the result along with
+                # the end of the replies.
+                _record_method_call(method, start)
+                recorded = True
+                ctxt.reply(rval, None, ending=True,
+                           connection_pool=self.connection_pool)
+                return
             else:
                 ctxt.reply(rval, None, connection_pool=self.connection_pool)
+            # Recorded before the caller hears that the call is over.
+            _record_method_call(method, start)
+            recorded = True
             # This final None tells multicall that it is done.
             ctxt.reply(ending=True, connection_pool=self.connection_pool)
         except Exception as e:
+            if not recorded:
+                _record_method_call(method, start, failed=True)
             LOG.exception('Exception during message handling')
             ctxt.reply(None, sys.exc_info(),
                        connection_pool=self.connection_pool)
@@ -304,6 +471,135 @@ class MulticallWaiter(object):
             yield result
 
 
+class ReplyProxy(object):
+    """Receives the replies to all calls made through a connection pool.
+
+    The replies arrive on one queue consumed in a thread of its own and
+    are handed to the waiter of the call whose msg_id they carry.
+    """
+
+    def __init__(self, connection_pool):
+        self.reply_q = 'reply_%s' % uuid.uuid4().hex
+        self._waiters = {}
+        self._conn = ConnectionContext(connection_pool, pooled=False)
+        self._conn.declare_direct_consumer(self.reply_q, self._process_data)
+        self._conn.consume_in_thread()
+
+    def _process_data(self, message_data):
+        msg_id = message_data.pop('_msg_id', None)
+        waiter = self._waiters.get(msg_id)
+        if waiter is None:
+            LOG.warn(_('No call waiting for reply to %(msg_id)s, dropping '
+                       'it'), locals())
+            return
+        waiter.put(message_data)
+
+    def add_waiter(self, msg_id):
+        waiter = self._waiters[msg_id] = queue.LightQueue()
+        return waiter
+
+    def remove_waiter(self, msg_id):
+        self._waiters.pop(msg_id, None)
+
+    def close(self):
+        self._conn.close()
+
+
+def get_reply_proxy(connection_pool):
+    """Return the reply proxy of connection_pool, creating it if needed."""
+    with connection_pool.reply_proxy_lock:
+        if connection_pool.reply_proxy is None:
+            connection_pool.reply_proxy = ReplyProxy(connection_pool)
+    return connection_pool.reply_proxy
+
+
+class ReplyWaiter(object):
+    """Iterates over the replies to one call received by a ReplyProxy."""
+
+    def __init__(self, reply_proxy, msg_id, timeout):
+        self._reply_proxy = reply_proxy
+        self._msg_id = msg_id
+        self._queue = reply_proxy.add_waiter(msg_id)
+        self._timeout = timeout or FLAGS.rpc_response_timeout
+        self._done = False
+
+    def done(self):
+        if self._done:
+            return
+        self._done = True
+        self._reply_proxy.remove_waiter(self._msg_id)
+
+    def __iter__(self):
+        """Return the results until the reply which ends the call"""
+        if self._done:
+            raise StopIteration
+        while True:
+            try:
+                data = self._queue.get(timeout=self._timeout)
+            except queue.Empty:
+                self.done()
+                LOG.error(_('Timed out waiting for RPC response to '
+                            '%s'), self._msg_id)
+                raise rpc_common.Timeout()
+            if data['failure']:
+                self.done()
+                raise rpc_common.deserialize_remote_exception(
+                        data['failure'])
+            if data.get('ending', False):
+                self.done()
+                if data.get('result') is not None:
+                    yield data['result']
+                raise StopIteration
+            yield data['result']
+
+
+def _record_method_call(method, start, failed=False):
+    """Count a call of method which started at start in its stats."""
+    duration = time.time() - start
+    stats = _method_stats.get(method)
+    if stats is None:
+        stats = _method_stats[method] = {
+                'calls': 0, 'errors': 0, 'total_duration': 0.0,
+                'max_duration': 0.0,
+                'histogram': [0] * (len(METHOD_DURATION_BUCKETS) + 1)}
+    stats['calls'] += 1
+    if failed:
+        stats['errors'] += 1
+    stats['total_duration'] += duration
+    stats['max_duration'] = max(stats['max_duration'], duration)
+    stats['histogram'][bisect.bisect_left(METHOD_DURATION_BUCKETS,
+                                          duration)] += 1
+
+
+def get_method_stats():
+    """Return the call counts and durations of the methods called by RPC.
+
+    The stats of each method are the calls and errors counts, the total
+    and max durations and a histogram of the durations: histogram[i] counts
+    the calls which took up to METHOD_DURATION_BUCKETS[i] seconds and the
+    last item those which took longer.
+    """
+    return dict((method, dict(stats, histogram=list(stats['histogram'])))
+                for method, stats in _method_stats.iteritems())
+
+
+def dispatch_stats():
+    """Return the running and waiting counts of the consumer pools.
+
+    The stats are keyed by consumer, then by pool name.  Pools of the
+    consumers of the same topic are added up.
+    """
+    consumers = {}
+    for callback, name in _proxy_callbacks.items():
+        pools = consumers.setdefault(name, {})
+        for pool_name, pool in callback.pools.iteritems():
+            stats = pools.setdefault(pool_name,
+                                     {'size': 0, 'running': 0, 'waiting': 0})
+            for key, value in pool.stats().iteritems():
+                stats[key] += value
+    return consumers
+
+
 def create_connection(new, connection_pool):
     """Create a connection"""
     return ConnectionContext(connection_pool, pooled=not new)
@@ -321,6 +617,18 @@ def multicall(context, topic, msg, timeout, connection_pool):
     LOG.debug(_('MSG_ID is %s') % (msg_id))
     pack_context(msg, context)
 
+    if FLAGS.amqp_rpc_single_reply_queue:
+        reply_proxy = get_reply_proxy(connection_pool)
+        msg['_reply_q'] = reply_proxy.reply_q
+        wait_msg = ReplyWaiter(reply_proxy, msg_id, timeout)
+        try:
+            with ConnectionContext(connection_pool) as conn:
+                conn.topic_send(topic, msg)
+        except Exception:
+            wait_msg.done()
+            raise
+        return wait_msg
+
     conn = ConnectionContext(connection_pool)
     wait_msg = MulticallWaiter(conn, timeout)
     conn.declare_direct_consumer(msg_id, wait_msg)
@@ -17,7 +17,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import copy
 import sys
 import traceback
 
@@ -133,39 +132,48 @@ class Connection(object):
         raise NotImplementedError()
 
 
+_SANITIZE = {
+    'set_admin_password': ('new_pass',),
+    'run_instance': ('admin_password',),
+}
+
+
+def _sanitize(msg_data):
+    """Return a copy of msg_data without its passwords and auth tokens.
+
+    Only the dicts holding sanitized values are copied.
+    """
+    msg_data = dict(msg_data)
+    args_to_sanitize = _SANITIZE.get(msg_data.get('method'), ())
+    if args_to_sanitize and isinstance(msg_data.get('args'), dict):
+        args = msg_data['args'] = dict(msg_data['args'])
+        for arg in args_to_sanitize:
+            if arg in args:
+                args[arg] = '<SANITIZED>'
+    for key in ('_context_auth_token', 'auth_token'):
+        if key in msg_data:
+            msg_data[key] = '<SANITIZED>'
+    return msg_data
+
+
+class _SanitizedMessage(object):
+    """Sanitizes message data when a log record is formatted."""
+
+    def __init__(self, msg_data):
+        self.msg_data = msg_data
+
+    def __str__(self):
+        return str(_sanitize(self.msg_data))
+
+
 def _safe_log(log_func, msg, msg_data):
-    """Sanitizes the msg_data field before logging."""
-    SANITIZE = {
-                'set_admin_password': ('new_pass',),
-                'run_instance': ('admin_password',),
-               }
-
-    has_method = 'method' in msg_data and msg_data['method'] in SANITIZE
-    has_context_token = '_context_auth_token' in msg_data
-    has_token = 'auth_token' in msg_data
-
-    if not any([has_method, has_context_token, has_token]):
-        return log_func(msg, msg_data)
-
-    msg_data = copy.deepcopy(msg_data)
-
-    if has_method:
-        method = msg_data['method']
-        if method in SANITIZE:
-            args_to_sanitize = SANITIZE[method]
-            for arg in args_to_sanitize:
-                try:
-                    msg_data['args'][arg] = "<SANITIZED>"
-                except KeyError:
-                    pass
-
-    if has_context_token:
-        msg_data['_context_auth_token'] = '<SANITIZED>'
-
-    if has_token:
-        msg_data['auth_token'] = '<SANITIZED>'
-
-    return log_func(msg, msg_data)
+    """Sanitizes the msg_data field before logging.
+
+    The message data is only copied and sanitized if the record is
+    emitted.  Callers logging every message should still check the level
+    with isEnabledFor() first, building the record isn't free.
+    """
+    return log_func(msg, _SanitizedMessage(msg_data))
 
 
 def serialize_remote_exception(failure_info):
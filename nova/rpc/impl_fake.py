@@ -169,6 +169,10 @@ def cleanup():
     pass
 
 
+def dispatch_stats():
+    return {}
+
+
 def fanout_cast(context, topic, msg):
     """Cast to all consumers of a topic"""
     check_serialize(msg)
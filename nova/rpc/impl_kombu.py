@@ -93,7 +93,8 @@ class ConsumerBase(object):
         a message is read.
 
         Messages will automatically be acked if the callback doesn't
-        raise an exception
+        raise an exception.  A ProxyCallback is handed the ack instead, and
+        acks the message once one of its pools takes it on.
         """
 
         options = {'consumer_tag': self.tag}
@@ -105,8 +106,11 @@ class ConsumerBase(object):
         def _callback(raw_message):
             message = self.channel.message_to_python(raw_message)
             try:
-                callback(message.payload)
-                message.ack()
+                if isinstance(callback, rpc_amqp.ProxyCallback):
+                    callback(message.payload, ack=message.ack)
+                else:
+                    callback(message.payload)
+                    message.ack()
             except Exception:
                 LOG.exception(_("Failed to process message... skipping it."))
 
@@ -421,15 +425,20 @@ class Connection(object):
             self.connection.transport.polling_interval = 0.0
         self.consumer_num = itertools.count(1)
         self.connection.connect()
-        self.channel = self.connection.channel()
-        # work around 'memory' transport bug in 1.1.3
-        if self.memory_transport:
-            self.channel._new_queue('ae.undeliver')
+        self._new_channel()
         for consumer in self.consumers:
             consumer.reconnect(self.channel)
         LOG.info(_('Connected to AMQP server on %(hostname)s:%(port)d'),
                  self.params)
 
+    def _new_channel(self):
+        self.channel = self.connection.channel()
+        if FLAGS.rpc_prefetch_count:
+            self.channel.basic_qos(0, FLAGS.rpc_prefetch_count, False)
+        # work around 'memory' transport bug in 1.1.3
+        if self.memory_transport:
+            self.channel._new_queue('ae.undeliver')
+
     def reconnect(self):
         """Handles reconnecting and re-establishing queues.
         Will retry up to self.max_retries number of times.
@@ -517,10 +526,7 @@ class Connection(object):
         """Reset a connection so it can be used again"""
         self.cancel_consumer_thread()
         self.channel.close()
-        self.channel = self.connection.channel()
-        # work around 'memory' transport bug in 1.1.3
-        if self.memory_transport:
-            self.channel._new_queue('ae.undeliver')
+        self._new_channel()
         self.consumers = []
 
     def declare_consumer(self, consumer_cls, topic, callback):
@@ -650,10 +656,11 @@ class Connection(object):
         """Create a consumer that calls a method in a proxy object"""
         if fanout:
             self.declare_fanout_consumer(topic,
-                    rpc_amqp.ProxyCallback(proxy, Connection.pool))
+                    rpc_amqp.ProxyCallback(proxy, Connection.pool,
+                                           '%s_fanout' % topic))
         else:
             self.declare_topic_consumer(topic,
-                    rpc_amqp.ProxyCallback(proxy, Connection.pool))
+                    rpc_amqp.ProxyCallback(proxy, Connection.pool, topic))
 
 
 Connection.pool = rpc_amqp.Pool(connection_cls=Connection)
@@ -703,3 +710,7 @@ def notify(context, topic, msg):
 
 def cleanup():
     return rpc_amqp.cleanup(Connection.pool)
+
+
+def dispatch_stats():
+    return rpc_amqp.dispatch_stats()
@@ -495,10 +495,11 @@ class Connection(object):
         """Create a consumer that calls a method in a proxy object"""
         if fanout:
             consumer = FanoutConsumer(self.session, topic,
-                    rpc_amqp.ProxyCallback(proxy, Connection.pool))
+                    rpc_amqp.ProxyCallback(proxy, Connection.pool,
+                                           '%s_fanout' % topic))
         else:
             consumer = TopicConsumer(self.session, topic,
-                    rpc_amqp.ProxyCallback(proxy, Connection.pool))
+                    rpc_amqp.ProxyCallback(proxy, Connection.pool, topic))
         self._register_consumer(consumer)
         return consumer
 
@@ -550,3 +551,7 @@ def notify(context, topic, msg):
 
 def cleanup():
     return rpc_amqp.cleanup(Connection.pool)
+
+
+def dispatch_stats():
+    return rpc_amqp.dispatch_stats()
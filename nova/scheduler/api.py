@@ -19,9 +19,22 @@ Handles all requests relating to schedulers.
 
 from nova import flags
 from nova import log as logging
+from nova.openstack.common import cfg
 from nova import rpc
 
+
+scheduler_api_opts = [
+    cfg.BoolOpt('scheduler_host_state_cache',
+                default=False,
+                help='Keep the per-host resource usage of instances cached '
+                     'in the scheduler and update it from instance events '
+                     'instead of reading every instance on each request. '
+                     'Must be set on compute nodes as well so that they '
+                     'report instance changes to the schedulers.'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(scheduler_api_opts)
 LOG = logging.getLogger(__name__)
 
 
@@ -59,6 +72,31 @@ def update_service_capabilities(context, service_name, host, capabilities):
     return rpc.fanout_cast(context, 'scheduler', kwargs)
 
 
+def update_instance_info(context, host_name, instance):
+    """Send an update to all the scheduler services informing them
+       of the resources an instance consumes on host_name."""
+    if not FLAGS.scheduler_host_state_cache:
+        return
+    instance_info = dict((key, instance[key])
+                         for key in ('uuid', 'memory_mb', 'vcpus',
+                                     'root_gb', 'ephemeral_gb'))
+    kwargs = dict(method='update_instance_info',
+                  args=dict(host_name=host_name,
+                            instance_info=instance_info))
+    return rpc.fanout_cast(context, 'scheduler', kwargs)
+
+
+def delete_instance_info(context, host_name, instance_uuid):
+    """Send an update to all the scheduler services informing them
+       that an instance no longer consumes resources on host_name."""
+    if not FLAGS.scheduler_host_state_cache:
+        return
+    kwargs = dict(method='delete_instance_info',
+                  args=dict(host_name=host_name,
+                            instance_uuid=instance_uuid))
+    return rpc.fanout_cast(context, 'scheduler', kwargs)
+
+
 def live_migration(context, block_migration, disk_over_commit,
                    instance_id, dest, topic):
     """Migrate a server to a new host"""
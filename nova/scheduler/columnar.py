@@ -0,0 +1,172 @@
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar filtering and weighing of host states.
+
+The consumable resources of all hosts are kept in NumPy arrays so that
+filters and cost functions can be evaluated for every host at once instead
+of one host at a time.  Filters opt in by implementing host_columns_pass(),
+cost functions by being registered in COST_FNS.  Anything else falls back
+to being called once per (still passing) host.
+"""
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova.scheduler import least_cost
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+LOG = logging.getLogger(__name__)
+
+columnar_opts = [
+    cfg.BoolOpt('scheduler_use_columnar_engine',
+                default=False,
+                help='Filter and weigh hosts as NumPy arrays instead of one '
+                     'host at a time. Requires NumPy.'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(columnar_opts)
+
+# HostState attributes kept as arrays.
+RESOURCE_ATTRS = ('free_ram_mb', 'free_disk_mb', 'vcpus_total', 'vcpus_used')
+
+
+def is_enabled():
+    """Return whether the columnar engine should be used."""
+    if not FLAGS.scheduler_use_columnar_engine:
+        return False
+    if numpy is None:
+        LOG.warn(_("scheduler_use_columnar_engine is set but NumPy could "
+                   "not be loaded. Filtering hosts one at a time."))
+        return False
+    return True
+
+
+class HostColumns(object):
+    """The host states of a single scheduling request as arrays."""
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        self.hosts = [host_state.host for host_state in self.host_states]
+        self._index = dict((host, idx) for idx, host in enumerate(self.hosts))
+        self.is_compute = numpy.array(
+                [host_state.topic == 'compute'
+                 for host_state in self.host_states], dtype=bool)
+        for attr in RESOURCE_ATTRS:
+            setattr(self, attr, numpy.array(
+                    [getattr(host_state, attr)
+                     for host_state in self.host_states], dtype=float))
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def column(self, name, fn):
+        """Return a named array of fn(host_state) for all hosts.
+
+        The array is computed once and cached for the lifetime of these
+        columns, so fn must not depend on consumable resources.
+        """
+        if name not in self._columns:
+            self._columns[name] = numpy.array(
+                    [fn(host_state) for host_state in self.host_states])
+        return self._columns[name]
+
+    def consume_from_instance(self, host_state, instance):
+        """Consume resources on a host and update its row."""
+        host_state.consume_from_instance(instance)
+        idx = self._index[host_state.host]
+        for attr in RESOURCE_ATTRS:
+            getattr(self, attr)[idx] = getattr(host_state, attr)
+
+
+def filter_hosts(columns, filter_fns, filter_properties, mask=None):
+    """Return a boolean array of the hosts passing all filters.
+
+    Same semantics as HostState.passes_filters().  Pass in the mask of a
+    previous call to only re-check the hosts which passed it.
+    """
+    force_hosts = filter_properties.get('force_hosts', [])
+    if mask is None:
+        ignore_hosts = filter_properties.get('ignore_hosts', [])
+        mask = numpy.array([host not in ignore_hosts
+                            for host in columns.hosts], dtype=bool)
+        if force_hosts:
+            mask &= numpy.array([host in force_hosts
+                                 for host in columns.hosts], dtype=bool)
+    else:
+        mask = mask.copy()
+    if force_hosts:
+        return mask
+
+    for filter_fn in filter_fns:
+        if not mask.any():
+            break
+        filter_obj = getattr(filter_fn, '__self__', None)
+        columns_pass = getattr(filter_obj, 'host_columns_pass', None)
+        if columns_pass is not None:
+            mask &= columns_pass(columns, filter_properties)
+            continue
+        for idx in numpy.flatnonzero(mask):
+            if not filter_fn(columns.host_states[idx], filter_properties):
+                mask[idx] = False
+    return mask
+
+
+def noop_cost_fn(columns, weighing_properties):
+    """Columnar least_cost.noop_cost_fn()."""
+    return numpy.ones(len(columns))
+
+
+def compute_fill_first_cost_fn(columns, weighing_properties):
+    """Columnar least_cost.compute_fill_first_cost_fn()."""
+    return columns.free_ram_mb
+
+
+# Cost functions with a columnar implementation.
+COST_FNS = {
+    least_cost.noop_cost_fn: noop_cost_fn,
+    least_cost.compute_fill_first_cost_fn: compute_fill_first_cost_fn,
+}
+
+
+def weighted_sum(weighted_fns, columns, mask, weighing_properties):
+    """Columnar least_cost.weighted_sum() over the hosts in mask.
+
+    :returns: a single WeightedHost object which represents the best
+              candidate.
+    """
+    indices = numpy.flatnonzero(mask)
+    final_scores = numpy.zeros(len(indices))
+    for weight, fn in weighted_fns:
+        columns_fn = COST_FNS.get(fn)
+        if columns_fn is not None:
+            scores = columns_fn(columns, weighing_properties)[indices]
+        else:
+            scores = numpy.array([fn(columns.host_states[idx],
+                                     weighing_properties)
+                                  for idx in indices], dtype=float)
+        final_scores += weight * scores
+
+    best = final_scores.argmin()  # Lowest score is the winner!
+    return least_cost.WeightedHost(float(final_scores[best]),
+            host_state=columns.host_states[indices[best]])
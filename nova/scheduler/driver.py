@@ -148,6 +148,18 @@ class Scheduler(object):
         self.host_manager.update_service_capabilities(service_name,
                 host, capabilities)
 
+    def update_instance_info(self, host_name, instance_info):
+        """Process an instance usage update from a service node."""
+        self.host_manager.update_instance_info(host_name, instance_info)
+
+    def delete_instance_info(self, host_name, instance_uuid):
+        """Process an instance deletion from a service node."""
+        self.host_manager.delete_instance_info(host_name, instance_uuid)
+
+    def sync_host_states(self, context):
+        """Resync the cached host states with the db if needed."""
+        self.host_manager.sync_host_states(context)
+
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
 
@@ -19,19 +19,35 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import operator
 
+from nova import db
 from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.notifier import api as notifier
+from nova.openstack.common import cfg
+from nova.scheduler import api as scheduler_api
+from nova.scheduler import columnar
 from nova.scheduler import driver
 from nova.scheduler import least_cost
 from nova.scheduler import scheduler_options
 from nova import utils
 
 
+filter_scheduler_opts = [
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='Place all instances of a multi-instance request in a '
+                     'single pass over a heap of weighed hosts and send one '
+                     'run_instances cast per compute host instead of one '
+                     'run_instance cast per instance. Compute nodes must '
+                     'support run_instances.'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(filter_scheduler_opts)
 LOG = logging.getLogger(__name__)
 
 
@@ -78,6 +94,14 @@ class FilterScheduler(driver.Scheduler):
         # contains an instance of RpcContext that cannot be serialized.
         kwargs.pop('filter_properties', None)
 
+        if FLAGS.scheduler_batch_placement:
+            instances = self._provision_resources(elevated,
+                    weighted_hosts[:num_instances], request_spec, kwargs)
+            notifier.notify(notifier.publisher_id("scheduler"),
+                            'scheduler.run_instance.end', notifier.INFO,
+                            payload)
+            return instances
+
         instances = []
         for num in xrange(num_instances):
             if not weighted_hosts:
@@ -129,8 +153,13 @@ class FilterScheduler(driver.Scheduler):
                         'scheduler.run_instance.scheduled', notifier.INFO,
                         payload)
 
-        driver.cast_to_compute_host(context, weighted_host.host_state.host,
+        host = weighted_host.host_state.host
+        driver.cast_to_compute_host(context, host,
                 'run_instance', instance_uuid=instance['uuid'], **kwargs)
+        # Account for the instance right away, and let any other
+        # schedulers know about it as well.
+        self.host_manager.update_instance_info(host, instance)
+        scheduler_api.update_instance_info(context, host, instance)
         inst = driver.encode_instance(instance, local=True)
         # So if another instance is created, create_instance_db_entry will
         # actually create a new entry, instead of assume it's been created
@@ -138,6 +167,40 @@ class FilterScheduler(driver.Scheduler):
         del request_spec['instance_properties']['uuid']
         return inst
 
+    def _provision_resources(self, context, weighted_hosts, request_spec,
+            kwargs):
+        """Create the requested resources in this Zone, casting once per
+        compute host rather than once per instance.
+        """
+        instances = []
+        instance_uuids_by_host = {}
+        for num, weighted_host in enumerate(weighted_hosts):
+            request_spec['instance_properties']['launch_index'] = num
+            instance = self.create_instance_db_entry(context, request_spec)
+
+            payload = dict(request_spec=request_spec,
+                           weighted_host=weighted_host.to_dict(),
+                           instance_id=instance['uuid'])
+            notifier.notify(notifier.publisher_id("scheduler"),
+                            'scheduler.run_instance.scheduled', notifier.INFO,
+                            payload)
+
+            host = weighted_host.host_state.host
+            db.instance_update(context, instance['uuid'],
+                    {'host': host, 'scheduled_at': utils.utcnow()})
+            instance_uuids_by_host.setdefault(host, []).append(
+                    instance['uuid'])
+            self.host_manager.update_instance_info(host, instance)
+            scheduler_api.update_instance_info(context, host, instance)
+            instances.append(driver.encode_instance(instance, local=True))
+            # See _provision_resource()
+            del request_spec['instance_properties']['uuid']
+
+        for host, instance_uuids in instance_uuids_by_host.iteritems():
+            driver.cast_to_compute_host(context, host, 'run_instances',
+                    update_db=False, instance_uuids=instance_uuids, **kwargs)
+        return instances
+
     def _get_configuration_options(self):
         """Fetch options dictionary. Broken out for testing."""
         return self.options.get_configuration()
@@ -181,12 +244,21 @@ class FilterScheduler(driver.Scheduler):
         unfiltered_hosts_dict = self.host_manager.get_all_host_states(
                 elevated, topic)
 
+        num_instances = request_spec.get('num_instances', 1)
+        if columnar.is_enabled():
+            return self._schedule_columns(unfiltered_hosts_dict.values(),
+                    cost_functions, filter_properties, instance_properties,
+                    num_instances)
+        if FLAGS.scheduler_batch_placement:
+            return self._schedule_heap(unfiltered_hosts_dict.values(),
+                    cost_functions, filter_properties, instance_properties,
+                    num_instances)
+
         # Note: remember, we are using an iterator here. So only
         # traverse this list once. This can bite you if the hosts
         # are being scanned in a filter or weighing function.
         hosts = unfiltered_hosts_dict.itervalues()
 
-        num_instances = request_spec.get('num_instances', 1)
         selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
@@ -217,6 +289,73 @@ class FilterScheduler(driver.Scheduler):
         selected_hosts.sort(key=operator.attrgetter('weight'))
         return selected_hosts[:num_instances]
 
+    def _schedule_heap(self, host_states, cost_functions, filter_properties,
+            instance_properties, num_instances):
+        """Same as the host by host loop in _schedule(), but filtering and
+        weighing all hosts only once.
+
+        Consuming resources only changes the chosen host, so the hosts are
+        kept in a heap and only the chosen one is filtered and weighed
+        again before going back in.
+        """
+        hosts = self.host_manager.filter_hosts(host_states,
+                filter_properties)
+        LOG.debug(_("Filtered %(hosts)s") % locals())
+
+        # The index breaks ties without comparing host states.
+        heap = []
+        for idx, host_state in enumerate(hosts):
+            weighted_host = least_cost.weigh_host(cost_functions,
+                    host_state, filter_properties)
+            heap.append((weighted_host.weight, idx, weighted_host))
+        heapq.heapify(heap)
+
+        selected_hosts = []
+        while heap and len(selected_hosts) < num_instances:
+            weight, idx, weighted_host = heapq.heappop(heap)
+            selected_hosts.append(weighted_host)
+
+            host_state = weighted_host.host_state
+            host_state.consume_from_instance(instance_properties)
+            if self.host_manager.filter_hosts([host_state],
+                                              filter_properties):
+                weighted_host = least_cost.weigh_host(cost_functions,
+                        host_state, filter_properties)
+                heapq.heappush(heap, (weighted_host.weight, idx,
+                                      weighted_host))
+
+        selected_hosts.sort(key=operator.attrgetter('weight'))
+        return selected_hosts
+
+    def _schedule_columns(self, host_states, cost_functions,
+            filter_properties, instance_properties, num_instances):
+        """Same as the host by host loop in _schedule(), but filtering
+        and weighing all hosts at once with the columnar engine.
+        """
+        columns = columnar.HostColumns(host_states)
+        mask = None
+        selected_hosts = []
+        for num in xrange(num_instances):
+            # Only hosts which passed before need to be re-checked.
+            mask = self.host_manager.filter_host_columns(columns,
+                    filter_properties, mask=mask)
+            if not mask.any():
+                # Can't get any more locally.
+                break
+
+            weighted_host = columnar.weighted_sum(cost_functions, columns,
+                    mask, filter_properties)
+            LOG.debug(_("Weighted %(weighted_host)s") % locals())
+            selected_hosts.append(weighted_host)
+
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            columns.consume_from_instance(weighted_host.host_state,
+                    instance_properties)
+
+        selected_hosts.sort(key=operator.attrgetter('weight'))
+        return selected_hosts[:num_instances]
+
     def get_cost_functions(self, topic=None):
         """Returns a list of tuples containing weights and cost functions to
         use for weighing hosts
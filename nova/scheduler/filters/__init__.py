@@ -25,7 +25,12 @@ from nova import utils
 
 
 class BaseHostFilter(object):
-    """Base class for host filters."""
+    """Base class for host filters.
+
+    Filters may also implement host_columns_pass(columns, filter_properties)
+    returning a boolean array for all hosts in a columnar.HostColumns, which
+    the columnar engine will use instead of calling host_passes() per host.
+    """
 
     def host_passes(self, host_state, filter_properties):
         raise NotImplemented()
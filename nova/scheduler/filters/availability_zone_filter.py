@@ -28,3 +28,15 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
         if availability_zone:
             return availability_zone == host_state.service['availability_zone']
         return True
+
+    def host_columns_pass(self, columns, filter_properties):
+        """Columnar host_passes()."""
+        spec = filter_properties.get('request_spec', {})
+        props = spec.get('instance_properties', {})
+        availability_zone = props.get('availability_zone')
+
+        if availability_zone:
+            zones = columns.column('availability_zone',
+                    lambda host_state: host_state.service['availability_zone'])
+            return zones == availability_zone
+        return True
@@ -38,18 +38,39 @@ class ComputeFilter(filters.BaseHostFilter):
                 return False
         return True
 
+    def _host_enabled(self, host_state):
+        """Check that the service is up and enabled on the host."""
+        service = host_state.service
+        if not utils.service_is_up(service) or service['disabled']:
+            return False
+        return bool(host_state.capabilities.get("enabled", True))
+
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create instance_type."""
         instance_type = filter_properties.get('instance_type')
         if host_state.topic != 'compute' or not instance_type:
             return True
         capabilities = host_state.capabilities
-        service = host_state.service
 
-        if not utils.service_is_up(service) or service['disabled']:
-            return False
-        if not capabilities.get("enabled", True):
+        if not self._host_enabled(host_state):
             return False
         if not self._satisfies_extra_specs(capabilities, instance_type):
             return False
         return True
+
+    def host_columns_pass(self, columns, filter_properties):
+        """Columnar host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return True
+
+        # Neither depends on consumed resources, so they are only
+        # computed once per request.
+        enabled = columns.column('compute_enabled', self._host_enabled)
+        mask = ~columns.is_compute | enabled
+        if instance_type.get('extra_specs'):
+            mask &= ~columns.is_compute | columns.column(
+                    'compute_extra_specs',
+                    lambda host_state: self._satisfies_extra_specs(
+                            host_state.capabilities, instance_type))
+        return mask
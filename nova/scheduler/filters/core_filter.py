@@ -48,3 +48,15 @@ class CoreFilter(filters.BaseHostFilter):
         instance_vcpus = instance_type['vcpus']
         vcpus_total = host_state.vcpus_total * FLAGS.cpu_allocation_ratio
         return (vcpus_total - host_state.vcpus_used) >= instance_vcpus
+
+    def host_columns_pass(self, columns, filter_properties):
+        """Columnar host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return True
+
+        instance_vcpus = instance_type['vcpus']
+        vcpus_total = columns.vcpus_total * FLAGS.cpu_allocation_ratio
+        # Hosts without VCPUs set pass, see host_passes()
+        return (~columns.is_compute | (columns.vcpus_total == 0) |
+                ((vcpus_total - columns.vcpus_used) >= instance_vcpus))
@@ -25,6 +25,7 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
+from nova.scheduler import columnar
 from nova.scheduler import filters
 from nova import utils
 
@@ -50,14 +51,35 @@ host_manager_opts = [
                   ],
                 help='Which filter class names to use for filtering hosts '
                       'when not specified in the request.'),
+    cfg.IntOpt('scheduler_host_state_resync_interval',
+               default=600,
+               help='Interval in seconds between full resyncs of the cached '
+                    'instance usage against the database when '
+                    'scheduler_host_state_cache is enabled'),
     ]
 
 FLAGS = flags.FLAGS
 FLAGS.register_opts(host_manager_opts)
+flags.DECLARE('scheduler_host_state_cache', 'nova.scheduler.api')
 
 LOG = logging.getLogger(__name__)
 
 
+# Instance fields that consume resources on a host.
+INSTANCE_USAGE_KEYS = ('memory_mb', 'vcpus', 'root_gb', 'ephemeral_gb')
+
+
+def _usage_from_instance(instance):
+    """Return the resources an instance consumes as a dict."""
+    return dict((key, instance[key] or 0) for key in INSTANCE_USAGE_KEYS)
+
+
+def _add_usage(total, usage, sign=1):
+    """Add (or subtract, with sign=-1) usage into the total dict."""
+    for key in INSTANCE_USAGE_KEYS:
+        total[key] = total.get(key, 0) + sign * usage[key]
+
+
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
     def __init__(self, source=None):
@@ -176,6 +198,10 @@ class HostManager(object):
 
     def __init__(self):
         self.service_states = {}  # { <host> : { <service> : { cap k : v }}}
+        # Cached resource usage, see scheduler_host_state_cache
+        self.instance_usage = {}  # { <uuid> : (<host>, { usage k : v }) }
+        self.host_usage = {}  # { <host> : { usage k : v }}
+        self.instance_usage_synced_at = None
         self.filter_classes = filters.get_filter_classes(
                 FLAGS.scheduler_available_filters)
 
@@ -219,6 +245,15 @@ class HostManager(object):
                 filtered_hosts.append(host)
         return filtered_hosts
 
+    def filter_host_columns(self, columns, filter_properties, filters=None,
+                            mask=None):
+        """Filter columnar hosts and return a boolean array of the ones
+        passing all filters.
+        """
+        filter_fns = self._choose_host_filters(filters)
+        return columnar.filter_hosts(columns, filter_fns, filter_properties,
+                                     mask=mask)
+
     def get_host_list(self):
         """Returns a list of dicts for each host that the Zone Manager
         knows about. Each dict contains the host_name and the service
@@ -296,6 +331,67 @@ class HostManager(object):
                 if len(service_caps) == 0:  # Delete host if no services
                     del self.service_states[host]
 
+    def instance_usage_stale(self):
+        """Check if the cached instance usage needs a full resync."""
+        if self.instance_usage_synced_at is None:
+            return True
+        resync_interval = datetime.timedelta(
+                seconds=FLAGS.scheduler_host_state_resync_interval)
+        return (utils.utcnow() - self.instance_usage_synced_at >
+                resync_interval)
+
+    def sync_instance_usage(self, context):
+        """Rebuild the cached per-host instance usage from the db.
+
+        Instance events keep the cache current between resyncs, this
+        corrects any drift caused by lost or unreported events.
+        """
+        instance_usage = {}
+        host_usage = {}
+        for instance in db.instance_get_all(context):
+            host = instance['host']
+            if not host:
+                continue
+            usage = _usage_from_instance(instance)
+            instance_usage[instance['uuid']] = (host, usage)
+            _add_usage(host_usage.setdefault(host, {}), usage)
+        self.instance_usage = instance_usage
+        self.host_usage = host_usage
+        self.instance_usage_synced_at = utils.utcnow()
+        LOG.debug(_("Synced cached usage of %d instance(s)"),
+                  len(instance_usage))
+
+    def sync_host_states(self, context):
+        """Resync the cached instance usage if it is enabled and stale."""
+        if FLAGS.scheduler_host_state_cache and self.instance_usage_stale():
+            self.sync_instance_usage(context)
+
+    def update_instance_info(self, host_name, instance_info):
+        """Account for an instance created on or moved/resized to a host.
+
+        Updates are idempotent, the previous usage of the instance is
+        released before the new usage is recorded.
+        """
+        if self.instance_usage_synced_at is None:
+            # Nothing cached yet, the first sync will pick it up.
+            return
+        self.delete_instance_info(host_name, instance_info['uuid'])
+        if not host_name:
+            return
+        usage = _usage_from_instance(instance_info)
+        self.instance_usage[instance_info['uuid']] = (host_name, usage)
+        _add_usage(self.host_usage.setdefault(host_name, {}), usage)
+
+    def delete_instance_info(self, host_name, instance_uuid):
+        """Release the resources an instance consumed on its host."""
+        entry = self.instance_usage.pop(instance_uuid, None)
+        if entry is None:
+            return
+        host, usage = entry
+        host_usage = self.host_usage.get(host)
+        if host_usage is not None:
+            _add_usage(host_usage, usage, sign=-1)
+
     def get_all_host_states(self, context, topic):
         """Returns a dict of all the hosts the HostManager
         knows about. Also, each of the consumable resources in HostState
@@ -304,7 +400,9 @@ class HostManager(object):
         For example:
         {'192.168.1.100': HostState(), ...}
 
-        Note: this can be very slow with a lot of instances.
+        Note: this can be very slow with a lot of instances unless
+        scheduler_host_state_cache is enabled, in which case the usage
+        of instances is taken from the cache instead of the db.
         InstanceType table isn't required since a copy is stored
         with the instance (in case the InstanceType changed since the
         instance was created)."""
@@ -330,6 +428,16 @@ class HostManager(object):
             host_state.update_from_compute_node(compute)
             host_state_map[host] = host_state
 
+        if FLAGS.scheduler_host_state_cache:
+            self.sync_host_states(context)
+            # Usage sums are consumed like a single instance.
+            for host, usage in self.host_usage.iteritems():
+                host_state = host_state_map.get(host, None)
+                if not host_state:
+                    continue
+                host_state.consume_from_instance(usage)
+            return host_state_map
+
         # "Consume" resources from the host the instance resides on.
         instances = db.instance_get_all(context)
         for instance in instances:
@@ -79,6 +79,20 @@ def compute_fill_first_cost_fn(host_state, weighing_properties):
     return host_state.free_ram_mb
 
 
+def weigh_host(weighted_fns, host_state, weighing_properties):
+    """Compute the weighted-sum score for a single host.
+
+    Gives the same weight as weighted_sum() for that host, for callers
+    that keep hosts ordered themselves.
+
+    :returns: a WeightedHost object for host_state.
+    """
+    weight = 0.0
+    for fn_weight, fn in weighted_fns:
+        weight += fn_weight * fn(host_state, weighing_properties)
+    return WeightedHost(weight, host_state=host_state)
+
+
 def weighted_sum(weighted_fns, host_states, weighing_properties):
     """Use the weighted-sum method to compute a score for an array of objects.
 
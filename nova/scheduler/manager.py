@@ -27,6 +27,7 @@ from nova.compute import vm_states
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova import manager
 from nova.notifier import api as notifier
@@ -70,9 +71,25 @@ class SchedulerManager(manager.Manager):
         """Process a capability update from a service node."""
         if capabilities is None:
             capabilities = {}
+        heartbeat.get_driver().capabilities_received(service_name, host)
         self.driver.update_service_capabilities(service_name, host,
                 capabilities)
 
+    def update_instance_info(self, context, host_name=None,
+            instance_info=None):
+        """Process an instance usage update from a service node."""
+        self.driver.update_instance_info(host_name, instance_info)
+
+    def delete_instance_info(self, context, host_name=None,
+            instance_uuid=None):
+        """Process an instance deletion from a service node."""
+        self.driver.delete_instance_info(host_name, instance_uuid)
+
+    @manager.periodic_task
+    def _sync_host_states(self, context):
+        """Periodically resync cached host states to correct drift."""
+        self.driver.sync_host_states(context)
+
     def _schedule(self, method, context, topic, *args, **kwargs):
         """Tries to call schedule_* method on the driver to retrieve host.
         Falls back to schedule(context, topic) if method doesn't exist.
@@ -79,3 +79,12 @@ class MultiScheduler(driver.Scheduler):
 
     def schedule_prep_resize(self, *args, **kwargs):
         return self.drivers['compute'].schedule_prep_resize(*args, **kwargs)
+
+    def update_instance_info(self, *args, **kwargs):
+        return self.drivers['compute'].update_instance_info(*args, **kwargs)
+
+    def delete_instance_info(self, *args, **kwargs):
+        return self.drivers['compute'].delete_instance_info(*args, **kwargs)
+
+    def sync_host_states(self, *args, **kwargs):
+        return self.drivers['compute'].sync_host_states(*args, **kwargs)
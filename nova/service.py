@@ -31,6 +31,7 @@ from nova import context
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova.openstack.common import cfg
 from nova import rpc
@@ -185,6 +186,10 @@ class Service(object):
                                                  self.host,
                                                  self.binary)
             self.service_id = service_ref['id']
+            zone = FLAGS.node_availability_zone
+            if zone != service_ref['availability_zone']:
+                db.service_update(ctxt, self.service_id,
+                                  {'availability_zone': zone})
         except exception.NotFound:
             self._create_service_ref(ctxt)
 
@@ -307,26 +312,22 @@ class Service(object):
         ctxt = context.get_admin_context()
         self.manager.periodic_tasks(ctxt, raise_on_error=raise_on_error)
 
+    def rpc_dispatch_stats(self, context):
+        """Return the running and waiting messages of the RPC consumers.
+
+        Can be called over RPC on the topic of the service, see
+        nova.rpc.dispatch_stats().
+        """
+        return rpc.dispatch_stats()
+
     def report_state(self):
-        """Update the state of this service in the datastore."""
+        """Report to the heartbeat driver that this service is alive."""
         ctxt = context.get_admin_context()
-        zone = FLAGS.node_availability_zone
-        state_catalog = {}
         try:
-            try:
-                service_ref = db.service_get(ctxt, self.service_id)
-            except exception.NotFound:
+            if not heartbeat.get_driver().report(ctxt, self):
                 LOG.debug(_('The service database object disappeared, '
                             'Recreating it.'))
                 self._create_service_ref(ctxt)
-                service_ref = db.service_get(ctxt, self.service_id)
-
-            state_catalog['report_count'] = service_ref['report_count'] + 1
-            if zone != service_ref['availability_zone']:
-                state_catalog['availability_zone'] = zone
-
-            db.service_update(ctxt,
-                             self.service_id, state_catalog)
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(self, 'model_disconnected', False):
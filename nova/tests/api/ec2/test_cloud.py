@@ -21,6 +21,7 @@ import base64
 import copy
 import datetime
 import functools
+import inspect
 import os
 import string
 import tempfile
@@ -715,6 +716,49 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, comp1['id'])
         db.service_destroy(self.context, comp2['id'])
 
+    def _count_db_calls(self):
+        """Record the names of the db api functions called from now on."""
+        calls = []
+
+        def _counted(name, func):
+            def wrapper(*args, **kwargs):
+                calls.append(name)
+                return func(*args, **kwargs)
+            return wrapper
+
+        for name, func in inspect.getmembers(db, inspect.isfunction):
+            self.stubs.Set(db, name, _counted(name, func))
+        return calls
+
+    def test_describe_instances_db_calls(self):
+        """Makes sure describe_instances does not query per instance."""
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        kernel_uuid = '76fa36fc-c930-4bf3-8c8a-ea2a2420deb6'
+        calls = self._count_db_calls()
+        instances = []
+
+        def _describe_instances(count):
+            """Add count instances and return the db calls to describe all."""
+            for i in xrange(count):
+                instances.append(db.instance_create(self.context,
+                        {'reservation_id': 'a',
+                         'image_ref': image_uuid,
+                         'kernel_id': kernel_uuid,
+                         'instance_type_id': 1,
+                         'host': 'host%d' % i,
+                         'vm_state': 'active'}))
+            del calls[:]
+            result = self.cloud.describe_instances(self.context)
+            self.assertEqual(len(result['reservationSet'][0]['instancesSet']),
+                             len(instances))
+            return list(calls)
+
+        # The first call maps the image ids
+        _describe_instances(1)
+        self.assertEqual(_describe_instances(1), _describe_instances(8))
+        for instance in instances:
+            db.instance_destroy(self.context, instance['id'])
+
     def test_describe_instances_sorting(self):
         """Makes sure describe_instances works and is sorted as expected."""
         self.flags(use_ipv6=True)
@@ -871,6 +915,33 @@ class CloudTestCase(test.TestCase):
         result = self.cloud.describe_instances(self.context)
         self.assertEqual(len(result['reservationSet']), 2)
 
+    def test_describe_instances_with_empty_image_ref(self):
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        inst1 = db.instance_create(self.context,
+                                   {'reservation_id': 'a',
+                                    'image_ref': '',
+                                    'instance_type_id': 1,
+                                    'host': 'host1',
+                                    'vm_state': 'active'})
+        inst2 = db.instance_create(self.context,
+                                   {'reservation_id': 'b',
+                                    'image_ref': image_uuid,
+                                    'instance_type_id': 1,
+                                    'host': 'host1',
+                                    'vm_state': 'active'})
+        result = self.cloud.describe_instances(self.context)
+        self.assertEqual(len(result['reservationSet']), 2)
+        image_ids = dict((r['instancesSet'][0]['instanceId'],
+                          r['instancesSet'][0]['imageId'])
+                         for r in result['reservationSet'])
+        self.assertEqual(image_ids[ec2utils.id_to_ec2_id(inst1['id'])],
+                         ec2utils.glance_id_to_ec2_id(self.context, ''))
+        self.assertEqual(image_ids[ec2utils.id_to_ec2_id(inst2['id'])],
+                         ec2utils.glance_id_to_ec2_id(self.context,
+                                                      image_uuid))
+        db.instance_destroy(self.context, inst1['id'])
+        db.instance_destroy(self.context, inst2['id'])
+
     def _block_device_mapping_create(self, instance_id, mappings):
         volumes = []
         for bdm in mappings:
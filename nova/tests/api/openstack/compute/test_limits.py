@@ -19,10 +19,14 @@ Tests dealing with HTTP rate-limiting.
 
 import httplib
 import json
+import os
+import shutil
 import StringIO
+import tempfile
 import unittest
 from xml.dom import minidom
 
+import eventlet
 from lxml import etree
 import stubout
 import webob
@@ -590,6 +594,39 @@ class LimiterTest(BaseLimitTestSuite):
         results = list(self._check(5, "PUT", "/anything", "user2"))
         self.assertEqual(expected, results)
 
+    def test_idle_users_are_forgotten(self):
+        """
+        Users whose limits have drained are dropped on the next sweep.
+        """
+        self.stubs.Set(self.limiter, "_get_time", self._get_time)
+        list(self._check(10, "PUT", "/anything", "user1"))
+        list(self._check(1, "PUT", "/anything", "user2"))
+        self.assertTrue('user1' in self.limiter.levels)
+        self.assertTrue('user2' in self.limiter.levels)
+
+        self.time += limits.IDLE_SWEEP_INTERVAL
+        self.limiter.check_for_delay("GET", "/anything")
+        self.assertFalse('user1' in self.limiter.levels)
+        self.assertFalse('user2' in self.limiter.levels)
+
+        # A forgotten user starts over with fresh limits
+        expected = [None] * 10 + [6.0]
+        results = list(self._check(11, "PUT", "/anything", "user1"))
+        self.assertEqual(expected, results)
+
+    def test_busy_users_are_kept(self):
+        """
+        Users which have not drained yet survive the sweep.
+        """
+        self.stubs.Set(self.limiter, "_get_time", self._get_time)
+        list(self._check(20, "PUT", "/anything", "user1"))
+        self.time += 5.0
+        self.stubs.Set(limits, "IDLE_SWEEP_INTERVAL", 5.0)
+        self.limiter.check_for_delay("GET", "/anything")
+        self.assertTrue('user1' in self.limiter.levels)
+        self.assertEqual(self._check_sum(1, "PUT", "/anything", "user1"),
+                         1.0)
+
 
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
@@ -626,13 +663,23 @@ class WsgiLimiterTest(BaseLimitTestSuite):
         self.assertEqual(response.status_int, 204)
 
     def test_invalid_methods(self):
-        """Only POSTs should work."""
+        """Only POSTs and GETs should work."""
         requests = []
-        for method in ["GET", "PUT", "DELETE", "HEAD", "OPTIONS"]:
+        for method in ["PUT", "DELETE", "HEAD", "OPTIONS"]:
             request = webob.Request.blank("/", method=method)
             response = request.get_response(self.app)
             self.assertEqual(response.status_int, 405)
 
+    def test_get_limits(self):
+        self._request("GET", "/delayed", "user1")
+        request = webob.Request.blank("/user1")
+        response = request.get_response(self.app)
+        self.assertEqual(response.status_int, 200)
+        user_limits = json.loads(response.body)["limits"]
+        self.assertEqual(len(user_limits), len(TEST_LIMITS))
+        self.assertEqual(user_limits[0]["URI"], "/delayed")
+        self.assertEqual(user_limits[0]["remaining"], 0)
+
     def test_good_url(self):
         delay = self._request("GET", "/something")
         self.assertEqual(delay, None)
@@ -779,6 +826,86 @@ class WsgiLimiterProxyTest(BaseLimitTestSuite):
 
         self.assertEqual((delay, error), expected)
 
+    def test_get_limits(self):
+        self.proxy.check_for_delay("GET", "/delayed")
+        proxy_limits = self.proxy.get_limits()
+        self.assertEqual(len(proxy_limits), len(TEST_LIMITS))
+        self.assertEqual(proxy_limits[0]["remaining"], 0)
+
+
+class LocalLimiterProxyTest(BaseLimitTestSuite):
+    """
+    Tests for a `limits.WsgiLimiterProxy` talking over a unix socket.
+    """
+
+    def setUp(self):
+        super(LocalLimiterProxyTest, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'limiter.sock')
+        user_limits = {'user:user3': '(GET, *, .*, 2, MINUTE)'}
+        self.server = eventlet.spawn(limits.serve_local, self.path,
+                                     TEST_LIMITS, **user_limits)
+        # Let the server start listening
+        eventlet.sleep(0)
+        self.proxy = limits.WsgiLimiterProxy('unix:%s' % self.path)
+
+    def tearDown(self):
+        self.server.kill()
+        shutil.rmtree(self.tempdir)
+        super(LocalLimiterProxyTest, self).tearDown()
+
+    def test_403(self):
+        delay = self.proxy.check_for_delay("GET", "/delayed", "user1")
+        self.assertEqual(delay, (None, None))
+
+        delay, error = self.proxy.check_for_delay("GET", "/delayed", "user1")
+        self.assertEqual(delay, "60.00")
+        self.assertTrue("Only 1 GET request(s) can be made to /delayed every "
+                        "minute." in error)
+        # The connection is kept for the next request
+        self.assertEqual(len(self.proxy._free_connections), 1)
+
+    def test_rate_limiting_middleware(self):
+        self.flags(api_limiter_socket=self.path)
+
+        @webob.dec.wsgify
+        def app(request):
+            pass
+
+        middleware = limits.RateLimitingMiddleware(app)
+        self.assertTrue(isinstance(middleware._limiter,
+                                   limits.WsgiLimiterProxy))
+        for i in xrange(7):
+            request = webob.Request.blank("/", method="POST")
+            self.assertEqual(request.get_response(middleware).status_int,
+                             200)
+        request = webob.Request.blank("/", method="POST")
+        self.assertEqual(request.get_response(middleware).status_int, 413)
+
+    def test_user_limits(self):
+        self.proxy.check_for_delay("GET", "/anything", "user3")
+        user_limits = self.proxy.get_limits("user3")
+        self.assertEqual(len(user_limits), 1)
+        self.assertEqual(user_limits[0]["value"], 2)
+        self.assertEqual(user_limits[0]["remaining"], 1)
+
+    def test_limits_in_socket_mode(self):
+        self.flags(api_limiter_socket=self.path)
+        middleware = limits.RateLimitingMiddleware(limits.create_resource())
+        request = webob.Request.blank("/")
+        request.accept = "application/json"
+        request.environ["wsgiorg.routing_args"] = (None, {
+            "action": "index",
+            "controller": "",
+        })
+        context = nova.context.RequestContext('testuser', 'testproject')
+        request.environ["nova.context"] = context
+        response = request.get_response(middleware)
+        self.assertEqual(response.status_int, 200)
+        rates = json.loads(response.body)["limits"]["rate"]
+        verbs = [limit["verb"] for rate in rates for limit in rate["limit"]]
+        self.assertEqual(sorted(verbs), ["GET", "POST", "POST", "PUT", "PUT"])
+
 
 class LimitsViewBuilderTest(test.TestCase):
     def setUp(self):
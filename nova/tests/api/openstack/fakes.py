@@ -495,13 +495,20 @@ def fake_instance_get(**kwargs):
 
 
 def fake_instance_get_all_by_filters(num_servers=5, **kwargs):
-    def _return_servers(context, *args, **kwargs):
+    def _return_servers(context, filters=None, sort_key=None, sort_dir=None,
+                        limit=None, marker=None):
         servers_list = []
         for i in xrange(num_servers):
-            server = stub_instance(id=i + 1, uuid=get_fake_uuid(i),
+            uuid = get_fake_uuid(i)
+            server = stub_instance(id=i + 1, uuid=uuid,
                     **kwargs)
             servers_list.append(server)
-        return servers_list
+            if marker is not None and uuid == marker:
+                servers_list = []
+                marker = None
+        if marker is not None:
+            raise exc.MarkerNotFound(marker=marker)
+        return servers_list[:limit]
     return _return_servers
 
 
@@ -194,7 +194,8 @@ def stub_out_db_network_api(stubs):
             ips[0]['virtual_interface'] = None
             ips[0]['virtual_interface_id'] = None
 
-    def fake_fixed_ip_disassociate_all_by_timeout(context, host, time):
+    def fake_fixed_ip_disassociate_all_by_timeout(context, host, time,
+                                                  reserve=False):
         return 0
 
     def fake_fixed_ip_get_by_instance(context, instance_id):
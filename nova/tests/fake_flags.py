@@ -41,6 +41,8 @@ FLAGS.set_default('sql_connection', "sqlite://")
 FLAGS.set_default('use_ipv6', True)
 FLAGS.set_default('flat_network_bridge', 'br100')
 FLAGS.set_default('sqlite_synchronous', False)
+flags.DECLARE('periodic_task_concurrency', 'nova.manager')
+FLAGS.set_default('periodic_task_concurrency', 0)
 flags.DECLARE('policy_file', 'nova.policy')
 flags.DECLARE('compute_scheduler_driver', 'nova.scheduler.multi')
 FLAGS.set_default('policy_file', 'nova/tests/policy.json')
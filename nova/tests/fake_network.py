@@ -146,6 +146,23 @@ class FakeNetworkManager(network_manager.NetworkManager):
             return [ip for ip in self.fixed_ips
                     if ip['virtual_interface_id'] == vif_id]
 
+        def fixed_ip_get_all_by_address_prefix(self, context, prefix):
+            fixed_ips = []
+            for vif in self.vifs:
+                for ip in self.fixed_ips_by_virtual_interface(context,
+                                                              vif['id']):
+                    floating_ips = [floating_ip
+                                    for floating_ip in self.floating_ips
+                                    if floating_ip['fixed_ip_id'] == ip['id']]
+                    addresses = [ip['address']] + [floating_ip['address']
+                                 for floating_ip in floating_ips]
+                    if any(address.startswith(prefix)
+                           for address in addresses):
+                        fixed_ips.append(dict(ip,
+                                              instance_id=vif['instance_id'],
+                                              floating_ips=floating_ips))
+            return fixed_ips
+
     def __init__(self):
         self.db = self.FakeDB()
         self.deallocate_called = None
@@ -16,6 +16,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 import mox
+import netaddr
 import shutil
 import sys
 import tempfile
@@ -446,6 +447,88 @@ class VlanNetworkTestCase(test.TestCase):
         network['vpn_private_address'] = '192.168.0.2'
         self.network.allocate_fixed_ip(self.context, 0, network)
 
+    def test_allocate_fixed_ip_adds_dhcp_host(self):
+        self.flags(fake_network=False)
+        network = dict(networks[0])
+        self.network._dhcp_networks.add(network['id'])
+        self.stubs.Set(self.network, '_get_dhcp_ip',
+                       lambda context, network_ref: '192.168.0.1')
+        self.mox.StubOutWithMock(db, 'fixed_ip_associate_pool')
+        self.mox.StubOutWithMock(db, 'fixed_ip_update')
+        self.mox.StubOutWithMock(db,
+                              'virtual_interface_get_by_instance_and_network')
+        self.mox.StubOutWithMock(db, 'instance_get')
+        self.mox.StubOutWithMock(self.network.driver, 'update_dhcp')
+        self.mox.StubOutWithMock(self.network.driver, 'add_dhcp_host')
+
+        db.instance_get(mox.IgnoreArg(),
+                        mox.IgnoreArg()).AndReturn({'security_groups': []})
+        db.fixed_ip_associate_pool(mox.IgnoreArg(),
+                                   mox.IgnoreArg(),
+                                   mox.IgnoreArg()).AndReturn('192.168.0.3')
+        db.fixed_ip_update(mox.IgnoreArg(),
+                           mox.IgnoreArg(),
+                           mox.IgnoreArg())
+        vif = {'id': 4, 'address': 'DE:AD:BE:EF:00:04', 'instance_id': 0}
+        db.virtual_interface_get_by_instance_and_network(mox.IgnoreArg(),
+                mox.IgnoreArg(), mox.IgnoreArg()).AndReturn(vif)
+        db.instance_get(mox.IgnoreArg(), 0).AndReturn({'hostname': 'foo'})
+        self.network.driver.add_dhcp_host(self.context, network['bridge'],
+                network, {'address': '192.168.0.3',
+                          'instance_id': 0,
+                          'network_id': network['id'],
+                          'vif_id': 4,
+                          'vif_address': 'DE:AD:BE:EF:00:04',
+                          'instance_hostname': 'foo'})
+        self.mox.ReplayAll()
+
+        self.network.allocate_fixed_ip(self.context, 0, network)
+
+    def test_generate_fixed_ips(self):
+        self.flags(cnt_vpn_clients=1)
+        fixed_cidr = netaddr.IPNetwork('192.168.0.0/29')
+        ips = self.network._generate_fixed_ips(0, fixed_cidr)
+        self.assertFalse(isinstance(ips, list))
+        ips = list(ips)
+        self.assertEqual([ip['address'] for ip in ips],
+                         [str(address) for address in fixed_cidr])
+        # network, gateway and vpn at the bottom, vpn client and broadcast
+        # at the top
+        self.assertEqual([ip['reserved'] for ip in ips],
+                         [True, True, True, False, False, False, True, True])
+        self.assertTrue(all(ip['network_id'] == 0 for ip in ips))
+
+    def test_associate_pool_fixed_ip_from_block(self):
+        self.flags(fixed_ip_block_size=2)
+        self.mox.StubOutWithMock(db, 'fixed_ip_reserve_block')
+        self.mox.StubOutWithMock(db, 'fixed_ip_associate')
+
+        db.fixed_ip_reserve_block(self.context, 0, HOST, 2).AndReturn(
+                ['192.168.0.3', '192.168.0.4'])
+        db.fixed_ip_associate(self.context, '192.168.0.3', 1, 0).AndReturn(
+                '192.168.0.3')
+        db.fixed_ip_associate(self.context, '192.168.0.4', 2, 0).AndRaise(
+                exception.FixedIpAlreadyInUse(address='192.168.0.4'))
+        db.fixed_ip_reserve_block(self.context, 0, HOST, 2).AndReturn(
+                ['192.168.0.5'])
+        db.fixed_ip_associate(self.context, '192.168.0.5', 2, 0).AndReturn(
+                '192.168.0.5')
+        db.fixed_ip_reserve_block(self.context, 0, HOST, 2).AndReturn([])
+        self.mox.StubOutWithMock(db, 'fixed_ip_associate_pool')
+        db.fixed_ip_associate_pool(self.context, 0, 3).AndRaise(
+                exception.NoMoreFixedIps())
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.network._associate_pool_fixed_ip(self.context,
+                                                               0, 1),
+                         '192.168.0.3')
+        self.assertEqual(self.network._associate_pool_fixed_ip(self.context,
+                                                               0, 2),
+                         '192.168.0.5')
+        self.assertRaises(exception.NoMoreFixedIps,
+                          self.network._associate_pool_fixed_ip,
+                          self.context, 0, 3)
+
     def test_create_networks_too_big(self):
         self.assertRaises(ValueError, self.network.create_networks, None,
                           num_networks=4094, vlan_start=1)
@@ -1184,6 +1267,26 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertEqual(res[0]['instance_id'], _vifs[1]['instance_id'])
         self.assertEqual(res[1]['instance_id'], _vifs[2]['instance_id'])
 
+    def test_get_instance_uuids_by_floating_ip_regex(self):
+        manager = fake_network.FakeNetworkManager()
+        _vifs = manager.db.virtual_interface_get_all(None)
+        fake_context = context.RequestContext('user', 'project')
+
+        # Get instance 1 by its floating ip
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '172.16.1.2'})
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['instance_id'], _vifs[1]['instance_id'])
+        self.assertEqual(res[0]['ip'], '172.16.1.2')
+
+        # Get instance 0 and 1 by their floating ips
+        ip_regex = '172\\.16\\.1\\.'
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': ip_regex})
+        self.assertEqual(len(res), 2)
+        self.assertEqual(res[0]['instance_id'], _vifs[0]['instance_id'])
+        self.assertEqual(res[1]['instance_id'], _vifs[1]['instance_id'])
+
     def test_get_instance_uuids_by_ipv6_regex(self):
         manager = fake_network.FakeNetworkManager()
         _vifs = manager.db.virtual_interface_get_all(None)
@@ -190,6 +190,21 @@ class BaseRpcAMQPTestCase(BaseRpcTestCase):
                  "args": {"value": value}})
         self.assertEqual(value, result)
 
+    def test_method_stats(self):
+        self.stubs.Set(rpc_amqp, '_method_stats', {})
+        self.rpc.call(self.context, 'test', {"method": "echo",
+                                             "args": {"value": 42}})
+        self.assertRaises(rpc_common.RemoteError, self.rpc.call,
+                          self.context, 'test', {"method": "fail",
+                                                 "args": {"value": 42}})
+        stats = rpc_amqp.get_method_stats()
+        self.assertEqual(sorted(stats.keys()), ['echo', 'fail'])
+        self.assertEqual(stats['echo']['calls'], 1)
+        self.assertEqual(stats['echo']['errors'], 0)
+        self.assertEqual(sum(stats['echo']['histogram']), 1)
+        self.assertEqual(stats['fail']['calls'], 1)
+        self.assertEqual(stats['fail']['errors'], 1)
+
 
 class TestReceiver(object):
     """Simple Proxy class so the consumer has methods to call.
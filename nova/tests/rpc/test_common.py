@@ -17,8 +17,13 @@
 Unit Tests for 'common' functons used through rpc code.
 """
 
+import functools
 import json
 import sys
+import weakref
+
+from eventlet import event
+from eventlet import greenthread
 
 from nova import context
 from nova import exception
@@ -145,3 +150,79 @@ class RpcCommonTestCase(test.TestCase):
         self.assertTrue(isinstance(after_exc, rpc_common.RemoteError))
         #assure the traceback was added
         self.assertTrue('raise FakeIDontExistException' in unicode(after_exc))
+
+    def test_safe_log_sanitizes_when_formatted(self):
+        msg_data = {'method': 'set_admin_password',
+                    'args': {'new_pass': 'secret', 'instance_id': 1},
+                    '_context_auth_token': 'c0ffee'}
+        logged = []
+
+        def fake_log(msg, *args):
+            logged.append(msg % args)
+
+        rpc_common._safe_log(fake_log, 'received %s', msg_data)
+        self.assertFalse('secret' in logged[0])
+        self.assertFalse('c0ffee' in logged[0])
+        self.assertTrue("'instance_id': 1" in logged[0])
+        # The message itself is left untouched
+        self.assertEqual(msg_data['args']['new_pass'], 'secret')
+        self.assertEqual(msg_data['_context_auth_token'], 'c0ffee')
+
+    def test_safe_log_does_not_sanitize_unless_formatted(self):
+        self.mox.StubOutWithMock(rpc_common, '_sanitize')
+        self.mox.ReplayAll()
+        rpc_common._safe_log(lambda msg, *args: None, 'received %s',
+                             {'auth_token': 'token'})
+
+    def test_dispatch_pool_spawn_does_not_block(self):
+        pool = rpc_amqp.DispatchPool(1)
+        done = event.Event()
+        ran = []
+        for i in xrange(3):
+            pool.spawn(done.wait)
+        pool.spawn(ran.append, 'last')
+        greenthread.sleep(0)
+        self.assertEqual(pool.stats(),
+                         {'size': 1, 'running': 1, 'waiting': 3})
+        done.send()
+        greenthread.sleep(0)
+        self.assertEqual(ran, ['last'])
+        self.assertEqual(pool.stats(),
+                         {'size': 1, 'running': 0, 'waiting': 0})
+
+    def test_dispatch_pool_defers_ack_past_backlog(self):
+        pool = rpc_amqp.DispatchPool(1, backlog=1)
+        done = event.Event()
+        acked = []
+        for i in xrange(3):
+            pool.spawn(done.wait, ack=functools.partial(acked.append, i))
+        # The running and the backlog message are acknowledged
+        self.assertEqual(acked, [0, 1])
+        greenthread.sleep(0)
+        self.assertEqual(acked, [0, 1])
+        done.send()
+        greenthread.sleep(0)
+        self.assertEqual(acked, [0, 1, 2])
+        self.assertEqual(pool.stats(),
+                         {'size': 1, 'running': 0, 'waiting': 0})
+
+    def test_proxy_callback_method_pools(self):
+        self.flags(rpc_method_pools=['refresh_rules:secgroups',
+                                     'refresh_members:secgroups',
+                                     'resize'],
+                   rpc_method_pool_size=2)
+        self.stubs.Set(rpc_amqp, '_proxy_callbacks',
+                       weakref.WeakKeyDictionary())
+        callback = rpc_amqp.ProxyCallback(None, None, 'compute')
+        self.assertEqual(sorted(callback.pools),
+                         ['default', 'resize', 'secgroups'])
+        self.assertTrue(callback.method_pools['refresh_rules'] is
+                        callback.method_pools['refresh_members'])
+        self.assertEqual(callback.method_pools['resize'].size, 2)
+
+        stats = rpc_amqp.dispatch_stats()
+        self.assertEqual(stats.keys(), ['compute'])
+        self.assertEqual(stats['compute']['secgroups'],
+                         {'size': 2, 'running': 0, 'waiting': 0})
+        self.assertEqual(stats['compute']['default']['size'],
+                         FLAGS.rpc_thread_pool_size)
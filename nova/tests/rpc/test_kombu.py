@@ -19,6 +19,9 @@
 Unit Tests for remote procedure calls using kombu
 """
 
+from eventlet import event
+from eventlet import greenthread
+
 from nova import context
 from nova import exception
 from nova import flags
@@ -69,6 +72,51 @@ class RpcKombuTestCase(common.BaseRpcAMQPTestCase):
         conn_context.close()
         self.assertEqual(conn1, conn2)
 
+    def test_prefetch_count(self):
+        conn = self.rpc.create_connection()
+        self.assertEqual(conn.connection.channel.qos.prefetch_count, 0)
+        conn.close()
+        self.flags(rpc_prefetch_count=5)
+        conn = self.rpc.create_connection()
+        self.assertEqual(conn.connection.channel.qos.prefetch_count, 5)
+        conn.close()
+
+    def test_prefetch_leaves_messages_on_broker(self):
+        self.flags(rpc_prefetch_count=2, rpc_thread_pool_size=1,
+                   rpc_pool_backlog=0)
+        done = event.Event()
+        calls = []
+
+        class Proxy(object):
+            def wait(self, context):
+                calls.append('wait')
+                done.wait()
+
+        conn = self.rpc.create_connection()
+        conn.create_consumer('prefetch_topic', Proxy())
+        for i in xrange(4):
+            self.rpc.cast(context.get_admin_context(), 'prefetch_topic',
+                          {'method': 'wait', 'args': {}})
+        # The first message runs, the next two wait unacknowledged in the
+        # pool and use up the prefetch count
+        conn.consume(limit=3)
+        greenthread.sleep(0)
+        channel = conn.connection.channel
+        self.assertEqual(calls, ['wait'])
+        self.assertEqual(len(channel.qos._delivered), 2)
+        self.assertFalse(channel.qos.can_consume())
+        self.assertEqual(channel._size('prefetch_topic'), 1)
+
+        done.send()
+        greenthread.sleep(0)
+        self.assertEqual(calls, ['wait'] * 3)
+        self.assertEqual(len(channel.qos._delivered), 0)
+        conn.consume(limit=1)
+        greenthread.sleep(0)
+        self.assertEqual(calls, ['wait'] * 4)
+        self.assertEqual(channel._size('prefetch_topic'), 0)
+        conn.close()
+
     def test_topic_send_receive(self):
         """Test sending to a topic exchange/queue"""
 
@@ -344,3 +392,42 @@ class RpcKombuTestCase(common.BaseRpcAMQPTestCase):
             self.assertTrue(value in unicode(exc))
             #Traceback should be included in exception message
             self.assertTrue('exception.ConvertedException' in unicode(exc))
+
+
+class RpcKombuSingleReplyQueueTestCase(common.BaseRpcAMQPTestCase):
+    """Runs the common rpc tests receiving replies on one queue."""
+
+    def setUp(self):
+        self.rpc = impl_kombu
+        super(RpcKombuSingleReplyQueueTestCase, self).setUp()
+        self.flags(amqp_rpc_single_reply_queue=True)
+
+    def tearDown(self):
+        impl_kombu.cleanup()
+        super(RpcKombuSingleReplyQueueTestCase, self).tearDown()
+
+    def test_reply_queue_is_shared(self):
+        for value in (41, 42):
+            result = self.rpc.call(self.context, 'test',
+                                   {"method": "echo",
+                                    "args": {"value": value}})
+            self.assertEqual(value, result)
+        reply_proxy = impl_kombu.Connection.pool.reply_proxy
+        self.assertTrue(reply_proxy.reply_q.startswith('reply_'))
+        self.assertEqual(reply_proxy._waiters, {})
+
+    def test_single_reply_message(self):
+        info = {'sent': []}
+        orig_direct_send = impl_kombu.Connection.direct_send
+
+        def fake_direct_send(conn, msg_id, msg):
+            info['sent'].append(msg)
+            orig_direct_send(conn, msg_id, msg)
+
+        self.stubs.Set(impl_kombu.Connection, 'direct_send',
+                       fake_direct_send)
+        result = self.rpc.call(self.context, 'test',
+                               {"method": "echo", "args": {"value": 42}})
+        self.assertEqual(result, 42)
+        self.assertEqual(len(info['sent']), 1)
+        self.assertTrue(info['sent'][0]['ending'])
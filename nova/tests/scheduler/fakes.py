@@ -39,20 +39,20 @@ COMPUTE_NODES = [
 ]
 
 INSTANCES = [
-        dict(root_gb=512, ephemeral_gb=0, memory_mb=512, vcpus=1,
-             host='host1'),
-        dict(root_gb=512, ephemeral_gb=0, memory_mb=512, vcpus=1,
-             host='host2'),
-        dict(root_gb=512, ephemeral_gb=0, memory_mb=512, vcpus=1,
-             host='host2'),
-        dict(root_gb=1024, ephemeral_gb=0, memory_mb=1024, vcpus=1,
-             host='host3'),
+        dict(uuid='fake-uuid1', root_gb=512, ephemeral_gb=0, memory_mb=512,
+             vcpus=1, host='host1'),
+        dict(uuid='fake-uuid2', root_gb=512, ephemeral_gb=0, memory_mb=512,
+             vcpus=1, host='host2'),
+        dict(uuid='fake-uuid3', root_gb=512, ephemeral_gb=0, memory_mb=512,
+             vcpus=1, host='host2'),
+        dict(uuid='fake-uuid4', root_gb=1024, ephemeral_gb=0, memory_mb=1024,
+             vcpus=1, host='host3'),
         # Broken host
-        dict(root_gb=1024, ephemeral_gb=0, memory_mb=1024, vcpus=1,
-             host=None),
+        dict(uuid='fake-uuid5', root_gb=1024, ephemeral_gb=0, memory_mb=1024,
+             vcpus=1, host=None),
         # No matching host
-        dict(root_gb=1024, ephemeral_gb=0, memory_mb=1024, vcpus=1,
-             host='host5'),
+        dict(uuid='fake-uuid6', root_gb=1024, ephemeral_gb=0, memory_mb=1024,
+             vcpus=1, host='host5'),
 ]
 
 
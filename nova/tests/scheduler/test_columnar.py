@@ -0,0 +1,181 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the columnar filter and weigh engine.
+"""
+
+import mox
+
+from nova import context
+from nova import db
+from nova.scheduler import columnar
+from nova.scheduler import filters
+from nova.scheduler import least_cost
+from nova import test
+from nova.tests.scheduler import fakes
+from nova import utils
+
+
+class ColumnarTestCase(test.TestCase):
+    """Test case for the columnar engine."""
+
+    def setUp(self):
+        super(ColumnarTestCase, self).setUp()
+        self.stubs.Set(utils, 'service_is_up', lambda service: True)
+        classes = filters.get_filter_classes(
+                ['nova.scheduler.filters.standard_filters'])
+        self.class_map = dict((cls.__name__, cls) for cls in classes)
+        self.host_states = [
+            fakes.FakeHostState('host1', 'compute',
+                    {'free_ram_mb': 1024, 'vcpus_total': 4, 'vcpus_used': 4,
+                     'capabilities': {'enabled': True, 'opt1': 1},
+                     'service': {'disabled': False,
+                                 'availability_zone': 'zone1'}}),
+            fakes.FakeHostState('host2', 'compute',
+                    {'free_ram_mb': 512, 'vcpus_total': 0, 'vcpus_used': 2,
+                     'capabilities': {'enabled': True, 'opt1': 2},
+                     'service': {'disabled': False,
+                                 'availability_zone': 'zone2'}}),
+            fakes.FakeHostState('host3', 'compute',
+                    {'free_ram_mb': 4096, 'vcpus_total': 2, 'vcpus_used': 0,
+                     'capabilities': {'enabled': False, 'opt1': 1},
+                     'service': {'disabled': False,
+                                 'availability_zone': 'zone1'}}),
+            fakes.FakeHostState('host4', 'compute',
+                    {'free_ram_mb': 2048, 'vcpus_total': 8, 'vcpus_used': 1,
+                     'capabilities': {'enabled': True, 'opt1': 1},
+                     'service': {'disabled': True,
+                                 'availability_zone': 'zone1'}}),
+        ]
+        self.filter_properties = {
+            'instance_type': {'memory_mb': 1024, 'vcpus': 1,
+                              'extra_specs': {'opt1': 1}},
+            'request_spec': {'instance_properties':
+                                 {'availability_zone': 'zone1'}},
+        }
+
+    def _assert_same_as_host_passes(self, filter_name):
+        filt = self.class_map[filter_name]()
+        columns = columnar.HostColumns(self.host_states)
+        expected = [filt.host_passes(host_state, self.filter_properties)
+                    for host_state in self.host_states]
+        mask = columnar.filter_hosts(columns, [filt.host_passes],
+                self.filter_properties)
+        self.assertEqual(list(mask), expected)
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_ram_filter(self):
+        self.flags(ram_allocation_ratio=1.0)
+        self._assert_same_as_host_passes('RamFilter')
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_core_filter(self):
+        self.flags(cpu_allocation_ratio=1.0)
+        self._assert_same_as_host_passes('CoreFilter')
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_compute_filter(self):
+        self._assert_same_as_host_passes('ComputeFilter')
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_availability_zone_filter(self):
+        self._assert_same_as_host_passes('AvailabilityZoneFilter')
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_per_host_fallback(self):
+        def fake_filter(host_state, filter_properties):
+            return host_state.host != 'host1'
+
+        columns = columnar.HostColumns(self.host_states)
+        mask = columnar.filter_hosts(columns, [fake_filter], {})
+        self.assertEqual(list(mask), [False, True, True, True])
+        # Only the hosts which passed the mask are checked again
+        checked = []
+
+        def fake_filter2(host_state, filter_properties):
+            checked.append(host_state.host)
+            return True
+
+        mask = columnar.filter_hosts(columns, [fake_filter2], {}, mask=mask)
+        self.assertEqual(checked, ['host2', 'host3', 'host4'])
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_ignore_and_force_hosts(self):
+        columns = columnar.HostColumns(self.host_states)
+        mask = columnar.filter_hosts(columns, [], {'ignore_hosts': ['host2']})
+        self.assertEqual(list(mask), [True, False, True, True])
+        # Forced hosts skip the filters
+        mask = columnar.filter_hosts(columns, [lambda h, p: False],
+                {'force_hosts': ['host3']})
+        self.assertEqual(list(mask), [False, False, True, False])
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_weighted_sum(self):
+        def fake_cost_fn(host_state, weighing_properties):
+            return host_state.vcpus_used
+
+        weighted_fns = [(1.0, least_cost.compute_fill_first_cost_fn),
+                        (1000.0, fake_cost_fn),
+                        (1.0, least_cost.noop_cost_fn)]
+        columns = columnar.HostColumns(self.host_states)
+        mask = columnar.filter_hosts(columns, [], {'ignore_hosts': ['host3']})
+
+        expected = least_cost.weighted_sum(weighted_fns,
+                [self.host_states[idx] for idx in (0, 1, 3)], {})
+        weighted_host = columnar.weighted_sum(weighted_fns, columns, mask, {})
+        self.assertEqual(weighted_host.weight, expected.weight)
+        self.assertEqual(weighted_host.host_state.host, 'host2')
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_consume_from_instance(self):
+        columns = columnar.HostColumns(self.host_states)
+        columns.consume_from_instance(self.host_states[1],
+                {'root_gb': 1, 'ephemeral_gb': 0, 'memory_mb': 256,
+                 'vcpus': 2})
+        self.assertEqual(list(columns.free_ram_mb), [1024, 256, 4096, 2048])
+        self.assertEqual(list(columns.vcpus_used), [4, 4, 0, 1])
+        self.assertEqual(self.host_states[1].free_ram_mb, 256)
+
+    @test.skip_if(columnar.numpy is None, "Test requires NumPy")
+    def test_schedule_same_as_host_by_host(self):
+        self.flags(scheduler_default_filters=['RamFilter', 'CoreFilter',
+                                              'ComputeFilter'],
+                   ram_allocation_ratio=1.0)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        request_spec = {'num_instances': 10,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 512,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1}}
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'instance_get_all')
+        for i in xrange(2):
+            db.compute_node_get_all(mox.IgnoreArg()).AndReturn(
+                    fakes.COMPUTE_NODES)
+            db.instance_get_all(mox.IgnoreArg()).AndReturn(fakes.INSTANCES)
+        self.mox.ReplayAll()
+        expected = sched._schedule(fake_context, 'compute', request_spec)
+        self.flags(scheduler_use_columnar_engine=True)
+        result = sched._schedule(fake_context, 'compute', request_spec)
+
+        self.assertEqual([(h.weight, h.host_state.host) for h in result],
+                         [(h.weight, h.host_state.host) for h in expected])
@@ -19,7 +19,9 @@ Tests For Distributed Scheduler.
 import mox
 
 from nova import context
+from nova import db
 from nova import exception
+from nova.scheduler import driver
 from nova.scheduler import least_cost
 from nova.scheduler import host_manager
 from nova.scheduler import filter_scheduler
@@ -164,6 +166,80 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighted_host in weighted_hosts:
             self.assertTrue(weighted_host.host_state is not None)
 
+    def test_schedule_heap_same_as_host_by_host(self):
+        self.flags(scheduler_default_filters=['RamFilter'],
+                   ram_allocation_ratio=1.0)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        request_spec = {'num_instances': 12,
+                        'instance_type': {'memory_mb': 500, 'root_gb': 512,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 500,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1}}
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'instance_get_all')
+        for i in xrange(2):
+            db.compute_node_get_all(mox.IgnoreArg()).AndReturn(
+                    fakes.COMPUTE_NODES)
+            db.instance_get_all(mox.IgnoreArg()).AndReturn(fakes.INSTANCES)
+        self.mox.ReplayAll()
+        expected = sched._schedule(fake_context, 'compute', request_spec)
+        self.flags(scheduler_batch_placement=True)
+        result = sched._schedule(fake_context, 'compute', request_spec)
+
+        self.assertEqual(len(result), 12)
+        self.assertEqual([(h.weight, h.host_state.host) for h in result],
+                         [(h.weight, h.host_state.host) for h in expected])
+
+    def test_run_instance_batch_placement_casts_per_host(self):
+        self.flags(scheduler_batch_placement=True)
+        ctxt = context.RequestContext('user', 'project', is_admin=True)
+        request_spec = {'num_instances': 3,
+                        'instance_properties': {}}
+        weighted_hosts = [
+                least_cost.WeightedHost(1,
+                        host_manager.HostState('host1', 'compute')),
+                least_cost.WeightedHost(2,
+                        host_manager.HostState('host2', 'compute')),
+                least_cost.WeightedHost(3,
+                        host_manager.HostState('host1', 'compute'))]
+        self.uuids = ['fake-uuid1', 'fake-uuid2', 'fake-uuid3']
+
+        def fake_create_instance_db_entry(context, request_spec):
+            uuid = self.uuids.pop(0)
+            request_spec['instance_properties']['uuid'] = uuid
+            return {'id': uuid, 'uuid': uuid}
+
+        self.stubs.Set(self.driver, 'create_instance_db_entry',
+                       fake_create_instance_db_entry)
+        self.mox.StubOutWithMock(self.driver, '_schedule')
+        self.mox.StubOutWithMock(db, 'instance_update')
+        self.mox.StubOutWithMock(driver, 'cast_to_compute_host')
+
+        self.driver._schedule(ctxt, 'compute', request_spec).AndReturn(
+                weighted_hosts)
+        for uuid, host in (('fake-uuid1', 'host1'), ('fake-uuid2', 'host2'),
+                           ('fake-uuid3', 'host1')):
+            db.instance_update(mox.IgnoreArg(), uuid,
+                    {'host': host, 'scheduled_at': mox.IgnoreArg()})
+        driver.cast_to_compute_host(mox.IgnoreArg(), 'host1',
+                'run_instances', update_db=False,
+                instance_uuids=['fake-uuid1', 'fake-uuid3']).InAnyOrder()
+        driver.cast_to_compute_host(mox.IgnoreArg(), 'host2',
+                'run_instances', update_db=False,
+                instance_uuids=['fake-uuid2']).InAnyOrder()
+        self.mox.ReplayAll()
+
+        instances = self.driver.schedule_run_instance(ctxt, request_spec)
+        self.assertEqual([instance['id'] for instance in instances],
+                         ['fake-uuid1', 'fake-uuid2', 'fake-uuid3'])
+
     def test_get_cost_functions(self):
         self.flags(reserved_host_memory_mb=128)
         fixture = fakes.FakeFilterScheduler()
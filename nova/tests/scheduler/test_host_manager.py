@@ -275,6 +275,75 @@ class HostManagerTestCase(test.TestCase):
         # 8191GB
         self.assertEqual(host_states['host4'].free_disk_mb, 8387584)
 
+    def test_get_all_host_states_cached(self):
+        self.flags(reserved_host_memory_mb=512,
+                reserved_host_disk_mb=1024,
+                scheduler_host_state_cache=True)
+
+        context = 'fake_context'
+        topic = 'compute'
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'instance_get_all')
+
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.instance_get_all(context).AndReturn(fakes.INSTANCES)
+        # Second request must not read the instances again
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+
+        self.mox.ReplayAll()
+        host_states = self.host_manager.get_all_host_states(context, topic)
+        self.assertEqual(host_states['host1'].free_ram_mb, 0)
+        self.assertEqual(host_states['host2'].free_ram_mb, 512)
+        self.assertEqual(host_states['host2'].vcpus_used, 2)
+        self.assertEqual(host_states['host3'].free_ram_mb, 2560)
+
+        # Virtual consumption by the scheduler doesn't leak into the cache
+        host_states['host4'].consume_from_instance(fakes.INSTANCES[0])
+
+        # An instance moved from host2 to host4, one deleted from host1
+        instance = dict(fakes.INSTANCES[1], memory_mb=1024, vcpus=2)
+        self.host_manager.update_instance_info('host4', instance)
+        self.host_manager.delete_instance_info('host1', 'fake-uuid1')
+        # Deleting an unknown instance is a no-op
+        self.host_manager.delete_instance_info('host1', 'fake-uuid1')
+
+        host_states = self.host_manager.get_all_host_states(context, topic)
+        self.assertEqual(host_states['host1'].free_ram_mb, 512)
+        self.assertEqual(host_states['host1'].vcpus_used, 0)
+        self.assertEqual(host_states['host2'].free_ram_mb, 1024)
+        self.assertEqual(host_states['host2'].vcpus_used, 1)
+        self.assertEqual(host_states['host4'].free_ram_mb, 6656)
+        self.assertEqual(host_states['host4'].vcpus_used, 2)
+        # 8191GB - 512GB
+        self.assertEqual(host_states['host4'].free_disk_mb, 7863296)
+
+    def test_sync_host_states_when_stale(self):
+        self.flags(scheduler_host_state_cache=True,
+                scheduler_host_state_resync_interval=600)
+
+        context = 'fake_context'
+        self.mox.StubOutWithMock(db, 'instance_get_all')
+        self.mox.StubOutWithMock(utils, 'utcnow')
+
+        db.instance_get_all(context).AndReturn(fakes.INSTANCES)
+        utils.utcnow().AndReturn(datetime.datetime(2012, 1, 1, 0, 0, 0))
+        # Not stale yet
+        utils.utcnow().AndReturn(datetime.datetime(2012, 1, 1, 0, 10, 0))
+        # Stale
+        utils.utcnow().AndReturn(datetime.datetime(2012, 1, 1, 0, 10, 1))
+        db.instance_get_all(context).AndReturn([])
+        utils.utcnow().AndReturn(datetime.datetime(2012, 1, 1, 0, 10, 1))
+
+        self.mox.ReplayAll()
+        self.assertTrue(self.host_manager.instance_usage_stale())
+        self.host_manager.sync_host_states(context)
+        self.assertEqual(len(self.host_manager.instance_usage), 5)
+        self.host_manager.sync_host_states(context)
+        self.host_manager.sync_host_states(context)
+        self.assertEqual(self.host_manager.instance_usage, {})
+        self.assertEqual(self.host_manager.host_usage, {})
+
 
 class HostStateTestCase(test.TestCase):
     """Test case for HostState class"""
@@ -113,6 +113,24 @@ class SchedulerManagerTestCase(test.TestCase):
                 service_name=service_name, host=host,
                 capabilities=capabilities)
 
+    def test_update_instance_info(self):
+        instance_info = {'uuid': 'fake_uuid', 'memory_mb': 512}
+
+        self.mox.StubOutWithMock(self.manager.driver,
+                'update_instance_info')
+        self.manager.driver.update_instance_info('fake_host', instance_info)
+        self.mox.ReplayAll()
+        self.manager.update_instance_info(self.context,
+                host_name='fake_host', instance_info=instance_info)
+
+    def test_delete_instance_info(self):
+        self.mox.StubOutWithMock(self.manager.driver,
+                'delete_instance_info')
+        self.manager.driver.delete_instance_info('fake_host', 'fake_uuid')
+        self.mox.ReplayAll()
+        self.manager.delete_instance_info(self.context,
+                host_name='fake_host', instance_uuid='fake_uuid')
+
     def test_existing_method(self):
         def stub_method(self, *args, **kwargs):
             pass
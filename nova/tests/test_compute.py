@@ -370,6 +370,19 @@ class ComputeTestCase(BaseTestCase):
         LOG.info(_("After terminating instances: %s"), instances)
         self.assertEqual(len(instances), 0)
 
+    def test_run_instances(self):
+        """Make sure every instance of a batch is run"""
+        instance_uuids = [self._create_fake_instance()['uuid']
+                          for i in xrange(3)]
+        self.stubs.Set(compute_manager.greenthread, 'spawn_n',
+                       lambda func, *args: func(*args))
+
+        self.compute.run_instances(self.context, instance_uuids)
+
+        for instance_uuid in instance_uuids:
+            instance = db.instance_get_by_uuid(self.context, instance_uuid)
+            self.assertEqual(instance['vm_state'], vm_states.ACTIVE)
+
     def test_run_terminate_timestamps(self):
         """Make sure timestamps are set for launched and destroyed"""
         instance = self._create_fake_instance()
@@ -23,6 +23,7 @@ import datetime
 from nova import test
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
 from nova import exception
 from nova import flags
 from nova import utils
@@ -80,6 +81,52 @@ class DbApiTestCase(test.TestCase):
         else:
             self.assertTrue(result[1].deleted)
 
+    def test_instance_get_all_by_filters_paginated(self):
+        ctxt = context.get_admin_context()
+        created_at = datetime.datetime(2012, 1, 1)
+        uuids = []
+        for i in xrange(5):
+            instance = db.instance_create(ctxt, {'created_at': created_at})
+            uuids.append(instance['uuid'])
+        # Same created_at for all, so instances are ordered by id
+        uuids.reverse()
+
+        result = db.instance_get_all_by_filters(ctxt, {}, limit=2)
+        self.assertEqual([i['uuid'] for i in result], uuids[:2])
+        result = db.instance_get_all_by_filters(ctxt, {}, limit=2,
+                                                marker=uuids[1])
+        self.assertEqual([i['uuid'] for i in result], uuids[2:4])
+        result = db.instance_get_all_by_filters(ctxt, {}, limit=2,
+                                                marker=uuids[3])
+        self.assertEqual([i['uuid'] for i in result], uuids[4:])
+        result = db.instance_get_all_by_filters(ctxt, {}, marker=uuids[3])
+        self.assertEqual([i['uuid'] for i in result], uuids[4:])
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters, ctxt, {},
+                          limit=2, marker='does-not-exist')
+
+    def test_instance_get_all_by_filters_regexp_prefix(self):
+        ctxt = context.get_admin_context()
+        for name in ('foo.bar', 'fooXbar', 'FOO.bar', 'foo.baz', 'bar'):
+            db.instance_create(ctxt, {'display_name': name})
+
+        def _names(filters, **kwargs):
+            result = db.instance_get_all_by_filters(ctxt, filters, **kwargs)
+            return sorted(i['display_name'] for i in result)
+
+        self.assertEqual(_names({'display_name': 'foo'}),
+                         ['foo.bar', 'foo.baz', 'fooXbar'])
+        self.assertEqual(_names({'display_name': '^foo\\.ba'}),
+                         ['foo.bar', 'foo.baz'])
+        self.assertEqual(_names({'display_name': 'foo.bar$'}),
+                         ['foo.bar', 'fooXbar'])
+        self.assertEqual(_names({'display_name': 'fooX?bar'}), ['fooXbar'])
+        self.assertEqual(_names({'display_name': 'foo|bar'}),
+                         ['bar', 'foo.bar', 'foo.baz', 'fooXbar'])
+        # Pages are filled with instances matching the regexp
+        self.assertEqual(len(_names({'display_name': 'foo.ba[rz]$'},
+                                    limit=2)), 2)
+
     def test_migration_get_all_unconfirmed(self):
         ctxt = context.get_admin_context()
 
@@ -376,6 +423,43 @@ class DbApiTestCase(test.TestCase):
         result = db.fixed_ip_disassociate_all_by_timeout(ctxt, 'bar', now)
         self.assertEqual(result, 0)
 
+    def test_fixed_ip_disassociate_all_by_timeout_reserve(self):
+        now = utils.utcnow()
+        ctxt = context.get_admin_context()
+        self._timeout_test(ctxt, now, False)
+        result = db.fixed_ip_disassociate_all_by_timeout(ctxt, 'bar', now,
+                                                         reserve=True)
+        self.assertEqual(result, 1)
+        pool_hosts = [ip['pool_host'] for ip in db.fixed_ip_get_all(ctxt)]
+        self.assertEqual(pool_hosts.count('bar'), 1)
+
+    def test_bw_usage_update_bulk(self):
+        ctxt = context.get_admin_context()
+        start_period = datetime.datetime(2012, 6, 1, 0, 0, 0)
+        db.bw_usage_update(ctxt, 'fa:16:3e:00:00:01', start_period, 1, 2)
+        # Another audit period is left alone
+        db.bw_usage_update(ctxt, 'fa:16:3e:00:00:01',
+                           datetime.datetime(2012, 5, 1, 0, 0, 0), 5, 6)
+        usages = ({'mac_address': 'fa:16:3e:00:00:0%d' % i,
+                   'bw_in': i * 10, 'bw_out': i * 100} for i in xrange(1, 4))
+        count = sqlalchemy_api.bw_usage_update_bulk(ctxt, start_period,
+                                                    usages, chunk_size=2)
+        self.assertEqual(count, 3)
+        bw_usages = db.bw_usage_get_by_macs(ctxt,
+                ['fa:16:3e:00:00:0%d' % i for i in xrange(1, 4)],
+                start_period)
+        self.assertEqual(sorted((bw['mac'], bw['bw_in'], bw['bw_out'])
+                                for bw in bw_usages),
+                         [('fa:16:3e:00:00:01', 10, 100),
+                          ('fa:16:3e:00:00:02', 20, 200),
+                          ('fa:16:3e:00:00:03', 30, 300)])
+        for bw in bw_usages:
+            self.assertTrue(bw['last_refreshed'])
+        bw_usages = db.bw_usage_get_by_macs(ctxt, ['fa:16:3e:00:00:01'],
+                datetime.datetime(2012, 5, 1, 0, 0, 0))
+        self.assertEqual(bw_usages[0]['bw_in'], 5)
+        self.assertEqual(db.bw_usage_update_bulk(ctxt, start_period, []), 0)
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate',
@@ -816,3 +900,84 @@ class TestIpAllocation(test.TestCase):
         fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
         self.assertEqual(fixed_ip.instance_id, self.instance.id)
         self.assertEqual(fixed_ip.network_id, self.network.id)
+
+    def test_fixed_ip_get_all_by_address_prefix(self):
+        vif = db.virtual_interface_create(self.ctxt,
+                {'instance_id': self.instance.id, 'address': 'fake-mac',
+                 'network_id': self.network.id})
+        self.create_fixed_ip(address='10.0.0.1', instance_id=self.instance.id,
+                             virtual_interface_id=vif.id)
+        address = self.create_fixed_ip(address='10.0.1.1',
+                                       instance_id=self.instance.id,
+                                       virtual_interface_id=vif.id)
+        # Not in use by an instance
+        self.create_fixed_ip(address='10.0.0.2')
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        db.floating_ip_create(self.ctxt, {'address': '172.16.0.1',
+                                          'fixed_ip_id': fixed_ip['id']})
+
+        fixed_ips = db.fixed_ip_get_all_by_address_prefix(self.ctxt, '10.0.0')
+        self.assertEqual([ip['address'] for ip in fixed_ips], ['10.0.0.1'])
+        fixed_ips = db.fixed_ip_get_all_by_address_prefix(self.ctxt, '172.')
+        self.assertEqual(len(fixed_ips), 1)
+        self.assertEqual(fixed_ips[0]['address'], '10.0.1.1')
+        self.assertEqual(fixed_ips[0]['instance_id'], self.instance.id)
+        self.assertEqual(fixed_ips[0]['floating_ips'],
+                         [{'address': '172.16.0.1'}])
+        fixed_ips = db.fixed_ip_get_all_by_address_prefix(self.ctxt, '')
+        self.assertEqual(len(fixed_ips), 2)
+
+    def test_fixed_ip_bulk_create(self):
+        ips = ({'address': '10.0.1.%d' % i,
+                'network_id': self.network.id,
+                'reserved': i == 1} for i in xrange(1, 6))
+        count = sqlalchemy_api.fixed_ip_bulk_create(self.ctxt, ips,
+                                                    chunk_size=2)
+        self.assertEqual(count, 5)
+        for i in xrange(1, 6):
+            fixed_ip = db.fixed_ip_get_by_address(self.ctxt, '10.0.1.%d' % i)
+            self.assertEqual(fixed_ip['network_id'], self.network.id)
+            self.assertEqual(fixed_ip['reserved'],
+                             fixed_ip['address'] == '10.0.1.1')
+            self.assertFalse(fixed_ip['deleted'])
+            self.assertTrue(fixed_ip['created_at'])
+
+    def test_fixed_ip_reserve_block(self):
+        for i in xrange(1, 5):
+            self.create_fixed_ip(address='10.0.0.%d' % i,
+                                 network_id=self.network.id)
+        addresses = db.fixed_ip_reserve_block(self.ctxt, self.network.id,
+                                              'host1', 2)
+        self.assertEqual(addresses, ['10.0.0.1', '10.0.0.2'])
+        # Reserved fixed ips are skipped by other hosts
+        addresses = db.fixed_ip_reserve_block(self.ctxt, self.network.id,
+                                              'host2', 4)
+        self.assertEqual(addresses, ['10.0.0.3', '10.0.0.4'])
+
+        # Once all are reserved, the pool takes reserved fixed ips, which
+        # the host that reserved them then skips
+        address = db.fixed_ip_associate_pool(self.ctxt, self.network.id,
+                                             self.instance.id)
+        self.assertEqual(address, '10.0.0.1')
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(fixed_ip['pool_host'], None)
+        self.assertRaises(exception.FixedIpAlreadyInUse,
+                          db.fixed_ip_associate, self.ctxt, '10.0.0.1',
+                          self.instance.id, network_id=self.network.id)
+
+        # Associating a reserved fixed ip takes it out of the block
+        db.fixed_ip_associate(self.ctxt, '10.0.0.2', self.instance.id,
+                              network_id=self.network.id)
+        db.fixed_ip_unreserve_block(self.ctxt, 'host2', ['10.0.0.3'])
+        address = db.fixed_ip_associate_pool(self.ctxt, self.network.id,
+                                             self.instance.id)
+        self.assertEqual(address, '10.0.0.3')
+
+        db.fixed_ip_unreserve_block(self.ctxt, 'host2', ['10.0.0.4'])
+        addresses = db.fixed_ip_reserve_block(self.ctxt, self.network.id,
+                                              'host1', 4)
+        self.assertEqual(addresses, ['10.0.0.4'])
+        # Free fixed ips already reserved for the host are returned again
+        addresses = db.fixed_ip_reserve_block(self.ctxt, self.network.id,
+                                              'host1', 4)
+        self.assertEqual(addresses, ['10.0.0.4'])
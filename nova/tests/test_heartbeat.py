@@ -0,0 +1,150 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for service heartbeat drivers."""
+
+import datetime
+
+from nova import context
+from nova import db
+from nova import heartbeat
+from nova.scheduler import api as scheduler_api
+from nova import test
+from nova import utils
+
+
+class FakeManager(object):
+    last_capabilities = None
+
+
+class FakeService(object):
+    def __init__(self, service_id):
+        self.service_id = service_id
+        self.host = 'fake_host'
+        self.topic = 'compute'
+        self.manager = FakeManager()
+
+
+class DbDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(DbDriverTestCase, self).setUp()
+        self.flags(service_down_time=60)
+        self.context = context.get_admin_context()
+        utils.set_time_override(datetime.datetime(2012, 1, 1, 0, 0, 0))
+        self.service_ref = db.service_create(self.context,
+                                             {'host': 'fake_host',
+                                              'binary': 'nova-compute',
+                                              'topic': 'compute',
+                                              'report_count': 0})
+        self.service = FakeService(self.service_ref['id'])
+        self.driver = heartbeat.DbDriver()
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(DbDriverTestCase, self).tearDown()
+
+    def _report_count(self):
+        return db.service_get(self.context,
+                              self.service.service_id)['report_count']
+
+    def test_report(self):
+        self.assertTrue(self.driver.report(self.context, self.service))
+        service_ref = db.service_get(self.context, self.service.service_id)
+        self.assertEqual(service_ref['report_count'], 1)
+        self.assertEqual(service_ref['updated_at'], utils.utcnow())
+        self.assertTrue(self.driver.is_up(service_ref))
+
+    def test_report_written_every_third_of_down_time(self):
+        self.driver.report(self.context, self.service)
+        utils.advance_time_seconds(10)
+        self.driver.report(self.context, self.service)
+        self.assertEqual(self._report_count(), 1)
+        utils.advance_time_seconds(10)
+        self.driver.report(self.context, self.service)
+        self.assertEqual(self._report_count(), 2)
+
+    def test_report_deleted_service(self):
+        db.service_destroy(self.context, self.service.service_id)
+        self.assertFalse(self.driver.report(self.context, self.service))
+
+    def test_is_up(self):
+        self.driver.report(self.context, self.service)
+        service_ref = db.service_get(self.context, self.service.service_id)
+        utils.advance_time_seconds(60)
+        self.assertTrue(self.driver.is_up(service_ref))
+        utils.advance_time_seconds(1)
+        self.assertFalse(self.driver.is_up(service_ref))
+
+
+class SchedulerDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(SchedulerDriverTestCase, self).setUp()
+        self.flags(service_down_time=60)
+        self.context = context.get_admin_context()
+        utils.set_time_override(datetime.datetime(2012, 1, 1, 0, 0, 0))
+        self.driver = heartbeat.SchedulerDriver()
+        self.service_ref = {'host': 'fake_host',
+                            'topic': 'compute',
+                            'created_at': utils.utcnow(),
+                            'updated_at': None}
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(SchedulerDriverTestCase, self).tearDown()
+
+    def test_report_sends_capabilities(self):
+        service = FakeService(1)
+        service.manager.last_capabilities = {'free_ram_mb': 1024}
+        self.mox.StubOutWithMock(db, 'service_heartbeat')
+        self.mox.StubOutWithMock(scheduler_api,
+                                 'update_service_capabilities')
+        scheduler_api.update_service_capabilities(self.context, 'compute',
+                'fake_host', {'free_ram_mb': 1024})
+        db.service_heartbeat(self.context, 1).AndReturn(True)
+        scheduler_api.update_service_capabilities(self.context, 'compute',
+                'fake_host', {})
+        scheduler_api.update_service_capabilities(self.context, 'compute',
+                'fake_host', {})
+        db.service_heartbeat(self.context, 1).AndReturn(True)
+        self.mox.ReplayAll()
+        self.assertTrue(self.driver.report(self.context, service))
+        service.manager.last_capabilities = None
+        # The services table is only written every half of down time
+        utils.advance_time_seconds(29)
+        self.assertTrue(self.driver.report(self.context, service))
+        utils.advance_time_seconds(1)
+        self.assertTrue(self.driver.report(self.context, service))
+
+    def test_is_up_from_capabilities(self):
+        utils.advance_time_seconds(100)
+        # Not heard from yet, the services table tells
+        self.assertFalse(self.driver.is_up(self.service_ref))
+        self.driver.capabilities_received('compute', 'fake_host')
+        self.assertTrue(self.driver.is_up(self.service_ref))
+        utils.advance_time_seconds(60)
+        self.assertTrue(self.driver.is_up(self.service_ref))
+        utils.advance_time_seconds(1)
+        self.assertFalse(self.driver.is_up(self.service_ref))
+        self.driver.capabilities_received('compute', 'fake_host')
+        self.assertTrue(self.driver.is_up(self.service_ref))
+
+    def test_service_is_up_uses_driver(self):
+        self.flags(heartbeat_driver='nova.heartbeat.SchedulerDriver')
+        self.stubs.Set(heartbeat, '_DRIVER', None)
+        utils.advance_time_seconds(100)
+        heartbeat.get_driver().capabilities_received('compute', 'fake_host')
+        self.assertTrue(utils.service_is_up(self.service_ref))
@@ -17,6 +17,8 @@
 #    under the License.
 """Unit Tests for network code."""
 
+from eventlet import greenthread
+
 from nova import test
 from nova.network import linux_net
 
@@ -160,3 +162,62 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('-A %s -j runner.py-%s' %
                             (chain, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+    def _fake_execute(self, calls):
+        def fake_execute(*cmd, **kwargs):
+            calls.append((cmd, kwargs.get('process_input')))
+            if cmd[0].endswith('-save'):
+                return '\n'.join(self.sample_filter), ''
+            return '', ''
+        return fake_execute
+
+    def test_incremental_apply_rewrites_dirty_chains(self):
+        self.flags(iptables_incremental_apply=True, use_ipv6=False)
+        calls = []
+        manager = linux_net.IptablesManager(self._fake_execute(calls))
+        manager.apply()
+        self.assertEqual([cmd for cmd, _input in calls],
+                         [('iptables-save', '-t', 'filter'),
+                          ('iptables-restore',),
+                          ('iptables-save', '-t', 'nat'),
+                          ('iptables-restore',)])
+
+        del calls[:]
+        manager.apply()
+        self.assertEqual(calls, [])
+
+        manager.ipv4['filter'].add_rule('FORWARD', '-s 1.2.3.4/5 -j DROP')
+        manager.apply()
+        self.assertEqual(len(calls), 1)
+        cmd, process_input = calls[0]
+        self.assertEqual(cmd, ('iptables-restore', '--noflush'))
+        self.assertEqual(process_input.split('\n'),
+                         ['*filter',
+                          ':%s-FORWARD - [0:0]' % linux_net.binary_name,
+                          '-A %s-FORWARD -s 1.2.3.4/5 -j DROP' %
+                              linux_net.binary_name,
+                          'COMMIT', ''])
+
+    def test_incremental_apply_unwrapped_change_rewrites_table(self):
+        self.flags(iptables_incremental_apply=True, use_ipv6=False)
+        calls = []
+        manager = linux_net.IptablesManager(self._fake_execute(calls))
+        manager.apply()
+
+        del calls[:]
+        manager.ipv4['filter'].add_rule('FORWARD', '-j ACCEPT', wrap=False)
+        manager.apply()
+        self.assertEqual([cmd for cmd, _input in calls],
+                         [('iptables-save', '-t', 'filter'),
+                          ('iptables-restore',)])
+
+    def test_apply_window_coalesces_calls(self):
+        self.flags(iptables_apply_window=0.01)
+        applied = []
+        self.stubs.Set(self.manager, '_apply', lambda: applied.append(1))
+        threads = [greenthread.spawn(self.manager.apply) for i in xrange(3)]
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(len(applied), 1)
+        self.manager.apply()
+        self.assertEqual(len(applied), 2)
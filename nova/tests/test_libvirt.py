@@ -39,6 +39,7 @@ from nova.compute import instance_types
 from nova.compute import power_state
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
+from nova.db.sqlalchemy import api as sqlalchemy_api
 from nova.virt import images
 from nova.virt import driver
 from nova.virt import firewall as base_firewall
@@ -1838,6 +1839,77 @@ class IptablesFirewallTestCase(test.TestCase):
         self.mox.ReplayAll()
         self.fw.do_refresh_security_group_rules("fake")
 
+    def test_security_group_rules_are_compiled_once(self):
+        admin_ctxt = context.get_admin_context()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        src_secgroup = db.security_group_create(admin_ctxt,
+                                                {'user_id': 'fake',
+                                                 'project_id': 'fake',
+                                                 'name': 'testsourcegroup',
+                                                 'description': 'src group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 22,
+                                       'to_port': 22,
+                                       'group_id': src_secgroup['id']})
+
+        network_model = _fake_network_info(self.stubs, 1, spectacular=True)
+        network_info = compute_utils.legacy_network_info(network_model)
+        src_instance_ref = self._create_instance_ref()
+        db.instance_add_security_group(admin_ctxt, src_instance_ref['uuid'],
+                                       src_secgroup['id'])
+        # _fake_network_info() stubbed out db.instance_info_cache_update
+        sqlalchemy_api.instance_info_cache_update(admin_ctxt,
+                src_instance_ref['uuid'],
+                {'network_info': network_model.as_cache()})
+        instance_refs = []
+        for i in xrange(2):
+            instance_ref = self._create_instance_ref()
+            db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                           secgroup['id'])
+            instance_refs.append(instance_ref)
+
+        def fake_get_nw_info(*args, **kwargs):
+            self.fail('Member ips should come from the info caches')
+
+        _fake_stub_out_get_nw_info(self.stubs, fake_get_nw_info)
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        calls = []
+        real_get_rules = db.security_group_rule_get_by_security_group
+
+        def fake_get_rules(ctxt, security_group_id):
+            calls.append(security_group_id)
+            return real_get_rules(ctxt, security_group_id)
+
+        self.stubs.Set(db, 'security_group_rule_get_by_security_group',
+                       fake_get_rules)
+
+        rules = [self.fw.instance_rules(instance_ref, network_info)
+                 for instance_ref in instance_refs]
+        self.assertEqual(calls, [secgroup['id']])
+        self.assertEqual(rules[0], rules[1])
+        for ip in network_model.fixed_ips():
+            if ip['version'] == 4:
+                self.assertTrue('-j ACCEPT -p tcp --dport 22 -s %s' %
+                                ip['address'] in rules[0][0])
+
+        self.fw.refresh_security_group_rules(secgroup['id'])
+        self.fw.instance_rules(instance_refs[0], network_info)
+        self.assertEqual(calls, [secgroup['id'], secgroup['id']])
+
+    def test_unused_security_group_rules_are_dropped(self):
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        self.fw.security_group_rules = {1: ([], [], set()),
+                                        2: ([], [], set())}
+        self.fw.instance_security_groups = {1: [1]}
+        self.fw.refresh_security_group_rules(3)
+        self.assertEqual(self.fw.security_group_rules.keys(), [1])
+
     @test.skip_if(missing_libvirt(), "Test requires libvirt")
     def test_unfilter_instance_undefines_nwfilter(self):
         admin_ctxt = context.get_admin_context()
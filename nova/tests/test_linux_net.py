@@ -17,6 +17,7 @@
 
 import os
 
+from eventlet import greenpool
 import mox
 
 from nova import context
@@ -328,6 +329,71 @@ class LinuxNetworkTestCase(test.TestCase):
         actual = self.driver._host_dhcp(data)
         self.assertEquals(actual, expected)
 
+    def _stub_dhcp_hostsfile(self):
+        written = []
+
+        def fake_write_to_file(path, data):
+            written.append((path, set(data.split('\n'))))
+
+        self.stubs.Set(self.driver, 'write_to_file', fake_write_to_file)
+        self.stubs.Set(self.driver, 'ensure_path', lambda path: None)
+        self.stubs.Set(self.driver, 'restart_dhcp',
+                       lambda context, dev, network_ref: None)
+        self.stubs.Set(self.driver, '_dhcp_hosts', {})
+        self.stubs.Set(self.driver, '_pending_dhcp_updates', {})
+        self.mox.StubOutWithMock(os, 'rename')
+        return written
+
+    def test_add_and_remove_dhcp_host(self):
+        written = self._stub_dhcp_hostsfile()
+        conffile = self.driver._dhcp_file('eth0', 'conf')
+        os.rename(conffile + '.tmp', conffile)
+        os.rename(conffile + '.tmp', conffile)
+        self.mox.ReplayAll()
+
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual(len(written), 1)
+        self.assertEqual(written[0][0], conffile)
+
+        self.mox.StubOutWithMock(db, 'network_get_associated_fixed_ips')
+        data = {'address': '192.168.0.200',
+                'vif_id': 7,
+                'vif_address': 'DE:AD:BE:EF:00:07',
+                'instance_hostname': 'fake_instance07'}
+        self.driver.add_dhcp_host(self.context, 'eth0', networks[0], data)
+        self.assertEqual(written[1][0], conffile + '.tmp')
+        self.assertEqual(written[1][1], written[0][1] | set(
+                ['DE:AD:BE:EF:00:07,fake_instance07.novalocal,'
+                 '192.168.0.200']))
+
+        self.driver.remove_dhcp_host(self.context, 'eth0', networks[0],
+                                     '192.168.0.200')
+        self.assertEqual(written[2], (conffile + '.tmp', written[0][1]))
+        # Removing an unknown fixed ip doesn't rewrite the file
+        self.driver.remove_dhcp_host(self.context, 'eth0', networks[0],
+                                     '192.168.0.200')
+        self.assertEqual(len(written), 3)
+
+    def test_dhcp_update_window(self):
+        self.flags(dhcp_update_window=0.01)
+        written = self._stub_dhcp_hostsfile()
+        conffile = self.driver._dhcp_file('eth0', 'conf')
+        os.rename(conffile + '.tmp', conffile)
+        self.mox.ReplayAll()
+
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        pool = greenpool.GreenPool()
+        for i in xrange(3):
+            data = {'address': '192.168.0.20%d' % i,
+                    'vif_id': i,
+                    'vif_address': 'DE:AD:BE:EF:00:1%d' % i,
+                    'instance_hostname': 'fake'}
+            pool.spawn(self.driver.add_dhcp_host, self.context, 'eth0',
+                       networks[0], data)
+        pool.waitall()
+        self.assertEqual(len(written), 2)
+        self.assertEqual(len(written[1][1] - written[0][1]), 3)
+
     def test_linux_bridge_driver_plug(self):
         """Makes sure plug doesn't drop FORWARD by default.
 
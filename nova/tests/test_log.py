@@ -50,6 +50,12 @@ class LoggerTestCase(test.TestCase):
         log.setup()
         self.assertEqual(logging.INFO, self.log.logger.getEffectiveLevel())
 
+    def test_is_enabled_for_follows_logger(self):
+        self.flags(verbose=False)
+        log.setup()
+        self.assertFalse(self.log.isEnabledFor(logging.DEBUG))
+        self.assertTrue(self.log.isEnabledFor(logging.INFO))
+
     def test_no_logging_via_module(self):
         for func in ('critical', 'error', 'exception', 'warning', 'warn',
                      'info', 'debug', 'log', 'audit'):
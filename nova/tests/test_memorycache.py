@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the in-process memcache client."""
+
+import datetime
+
+from nova.common import memorycache
+from nova import test
+from nova import utils
+
+
+class MemorycacheTestCase(test.TestCase):
+    def setUp(self):
+        super(MemorycacheTestCase, self).setUp()
+        utils.set_time_override(datetime.datetime(2012, 1, 1, 0, 0, 0))
+        self.client = memorycache.Client()
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(MemorycacheTestCase, self).tearDown()
+
+    def _stats(self, client=None):
+        return (client or self.client).get_stats()[0][1]
+
+    def test_get_set(self):
+        self.assertEqual(self.client.get('foo'), None)
+        self.assertTrue(self.client.set('foo', 'bar'))
+        self.assertEqual(self.client.get('foo'), 'bar')
+        self.assertEqual(self._stats()['get_hits'], 1)
+        self.assertEqual(self._stats()['get_misses'], 1)
+
+    def test_expiry(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.set('baz', 'qux', time=20)
+        self.client.set('forever', 'and ever')
+        utils.advance_time_seconds(9)
+        self.assertEqual(self.client.get('foo'), 'bar')
+        utils.advance_time_seconds(1)
+        self.assertEqual(self.client.get('foo'), None)
+        self.assertEqual(self.client.get('baz'), 'qux')
+        utils.advance_time_seconds(10)
+        self.assertEqual(self.client.get('baz'), None)
+        self.assertEqual(self.client.get('forever'), 'and ever')
+        self.assertEqual(self._stats()['curr_items'], 1)
+
+    def test_set_again_resets_expiry(self):
+        self.client.set('foo', 'bar', time=10)
+        utils.advance_time_seconds(5)
+        self.client.set('foo', 'baz', time=10)
+        utils.advance_time_seconds(5)
+        self.assertEqual(self.client.get('foo'), 'baz')
+        utils.advance_time_seconds(5)
+        self.assertEqual(self.client.get('foo'), None)
+
+    def test_add(self):
+        self.assertTrue(self.client.add('foo', 'bar', time=10))
+        self.assertFalse(self.client.add('foo', 'baz'))
+        self.assertEqual(self.client.get('foo'), 'bar')
+        utils.advance_time_seconds(10)
+        self.assertTrue(self.client.add('foo', 'baz'))
+        self.assertEqual(self.client.get('foo'), 'baz')
+
+    def test_incr(self):
+        self.assertEqual(self.client.incr('foo'), None)
+        self.client.set('foo', '1', time=10)
+        self.assertEqual(self.client.incr('foo'), 2)
+        self.assertEqual(self.client.incr('foo', delta=3), 5)
+        self.assertEqual(self.client.get('foo'), '5')
+        utils.advance_time_seconds(10)
+        self.assertEqual(self.client.incr('foo'), None)
+
+    def test_delete(self):
+        self.client.set('foo', 'bar', time=10)
+        self.assertTrue(self.client.delete('foo'))
+        self.assertFalse(self.client.delete('foo'))
+        self.assertEqual(self.client.get('foo'), None)
+
+    def test_max_entries_evicts_least_recently_used(self):
+        client = memorycache.Client(max_entries=2)
+        client.set('a', 1)
+        client.set('b', 2)
+        client.get('a')
+        client.set('c', 3)
+        self.assertEqual(client.get('b'), None)
+        self.assertEqual(client.get('a'), 1)
+        self.assertEqual(client.get('c'), 3)
+        self.assertEqual(self._stats(client)['evictions'], 1)
+        self.assertEqual(self._stats(client)['curr_items'], 2)
+
+    def test_max_entries_flag(self):
+        self.flags(memorycache_max_entries=1)
+        client = memorycache.Client([], debug=0)
+        client.set('a', 1)
+        client.set('b', 2)
+        self.assertEqual(client.get('a'), None)
+        self.assertEqual(client.get('b'), 2)
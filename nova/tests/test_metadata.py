@@ -19,9 +19,13 @@
 """Tests for metadata service."""
 
 import base64
+
+from eventlet import greenthread
 import webob
 
+from nova.api.metadata import base
 from nova.api.metadata import handler
+from nova.common import metadatacache
 from nova.db.sqlalchemy import api
 from nova import db
 from nova import exception
@@ -82,6 +86,7 @@ class MetadataTestCase(test.TestCase):
                        get_fixed_ip_by_address)
         self.stubs.Set(api, 'instance_get', instance_get)
         self.stubs.Set(api, 'instance_get_all_by_filters', instance_get_list)
+        self.stubs.Set(metadatacache, '_CACHE', None)
         self.app = handler.MetadataRequestHandler()
         network_manager = fake_network.FakeNetworkManager()
         self.stubs.Set(self.app.compute_api.network_api,
@@ -183,3 +188,72 @@ class MetadataTestCase(test.TestCase):
         self.assertEqual(self.app._format_instance_mapping(ctxt,
                                                            instance_ref1),
                          expected)
+
+    def _count_builds(self):
+        builds = []
+        real_get_metadata = base.get_metadata_for_instance
+
+        def fake_get_metadata(ctxt, instance_ref, address):
+            builds.append(address)
+            # Let other greenthreads run while building
+            greenthread.sleep(0)
+            return real_get_metadata(ctxt, instance_ref, address)
+
+        self.stubs.Set(base, 'get_metadata_for_instance', fake_get_metadata)
+        return builds
+
+    def test_metadata_is_cached(self):
+        builds = self._count_builds()
+        self.assertEqual(self.request('/meta-data/hostname'),
+                         self.request('/meta-data/hostname'))
+        self.assertEqual(builds, ['127.0.0.1'])
+
+    def test_concurrent_misses_build_once(self):
+        builds = self._count_builds()
+        threads = [greenthread.spawn(self.app.get_metadata, '127.0.0.1')
+                   for i in xrange(3)]
+        results = [thread.wait() for thread in threads]
+        self.assertEqual(builds, ['127.0.0.1'])
+        self.assertEqual(results, [results[0]] * 3)
+
+    def test_invalidate_address(self):
+        builds = self._count_builds()
+        self.request('/meta-data/hostname')
+        metadatacache.invalidate_address('127.0.0.1')
+        self.request('/meta-data/hostname')
+        self.assertEqual(builds, ['127.0.0.1', '127.0.0.1'])
+
+    def test_refresh_prefetches(self):
+        self.flags(metadata_prefetch=True)
+        self.stubs.Set(db, 'instance_get_by_uuid',
+                       lambda *args, **kwargs: self.instance)
+        self.stubs.Set(metadatacache, '_fixed_addresses',
+                       lambda *args, **kwargs: ['127.0.0.1'])
+        metadatacache.refresh(None, 'fake-uuid')
+
+        def fake_get_fixed_ip_by_address(*args, **kwargs):
+            self.fail('metadata should have been prefetched')
+
+        self.stubs.Set(network.API, 'get_fixed_ip_by_address',
+                       fake_get_fixed_ip_by_address)
+        self.assertEqual(self.request('/meta-data/local-ipv4'), '127.0.0.1')
+
+    def test_cached_addresses_without_memcached(self):
+        def fake_fixed_addresses(*args, **kwargs):
+            self.fail('no shared cache to invalidate')
+
+        self.stubs.Set(metadatacache, '_fixed_addresses',
+                       fake_fixed_addresses)
+        self.assertEqual(
+            metadatacache.cached_addresses(None, self.instance), [])
+
+    def test_cached_addresses_without_info_cache(self):
+        self.flags(memcached_servers=['127.0.0.1:11211'])
+        info_cache = {'network_info': fake_network.fake_get_instance_nw_info(
+            self.stubs, 1, 1, spectacular=True)}
+        self.stubs.Set(db, 'instance_get_by_uuid',
+                       lambda *args, **kwargs: dict(self.instance,
+                                                    info_cache=info_cache))
+        instance = {'uuid': 'fake-uuid'}
+        self.assertEqual(metadatacache.cached_addresses(None, instance),
+                         ['192.168.1.100'])
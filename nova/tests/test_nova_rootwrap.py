@@ -15,11 +15,21 @@
 #    under the License.
 
 import os
+import shutil
 import subprocess
+import sys
+import tempfile
+import time
 
+from eventlet import greenpool
+
+import nova
+from nova import exception
+from nova.rootwrap import daemon
 from nova.rootwrap import filters
 from nova.rootwrap import wrapper
 from nova import test
+from nova import utils
 
 
 class RootwrapTestCase(test.TestCase):
@@ -117,3 +127,89 @@ class RootwrapTestCase(test.TestCase):
         usercmd = ["cat", "/"]
         filtermatch = wrapper.match_filter(self.filters, usercmd)
         self.assertTrue(filtermatch is self.filters[-1])
+
+
+# Runs a daemon with the filters of the tests in a process of its own,
+# as the tests are monkey patched and the daemon is not.
+_DAEMON_SCRIPT = """
+import sys
+from nova.rootwrap import daemon
+from nova.rootwrap import filters
+daemon.RootwrapServer(sys.argv[1],
+                      [filters.CommandFilter('/bin/cat', 'root'),
+                       filters.CommandFilter('/bin/sh', 'root')],
+                      ).serve_forever()
+"""
+
+
+class RootwrapDaemonTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.stubs.Set(daemon, 'SOCKET_DIR',
+                       os.path.join(self.tempdir, 'sockets'))
+        self.path = daemon.socket_path(os.getuid())
+        topdir = os.path.abspath(os.path.join(os.path.dirname(nova.__file__),
+                                              os.pardir))
+        env = dict(os.environ, PYTHONPATH=topdir)
+        self.process = subprocess.Popen([sys.executable, '-c',
+                                         _DAEMON_SCRIPT, self.path],
+                                        env=env)
+        for i in xrange(500):
+            if os.path.exists(self.path) or self.process.poll() is not None:
+                break
+            time.sleep(0.01)
+        self.assertTrue(os.path.exists(self.path))
+        self.flags(use_rootwrap_daemon=True)
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.process.wait()
+        shutil.rmtree(self.tempdir)
+        super(RootwrapDaemonTestCase, self).tearDown()
+
+    def test_socket_mode(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0777, 0600)
+        self.assertEqual(os.stat(daemon.SOCKET_DIR).st_mode & 0777, 0755)
+
+    def test_socket_dir_writable_by_others(self):
+        os.chmod(daemon.SOCKET_DIR, 0777)
+        self.assertRaises(OSError, daemon.RootwrapServer,
+                          os.path.join(daemon.SOCKET_DIR, 'other.sock'), [])
+
+    def test_run_command_unauthorized(self):
+        cat_filter = filters.CommandFilter('/bin/cat', 'root')
+        returncode, stdout, stderr = daemon.run_command([cat_filter],
+                                                        ['ls', '/'], None)
+        self.assertEqual(returncode, daemon.RC_UNAUTHORIZED)
+        self.assertEqual(stdout, 'Unauthorized command: ls /\n')
+
+    def test_execute(self):
+        out, err = utils.execute('cat', process_input='foo\0bar',
+                                 run_as_root=True)
+        self.assertEqual(out, 'foo\0bar')
+        self.assertEqual(err, '')
+
+    def test_execute_exit_code(self):
+        self.assertRaises(exception.ProcessExecutionError, utils.execute,
+                          'sh', '-c', 'exit 3', run_as_root=True)
+        out, err = utils.execute('sh', '-c', 'echo foo >&2; exit 3',
+                                 run_as_root=True, check_exit_code=[3])
+        self.assertEqual(err, 'foo\n')
+
+    def test_execute_unauthorized(self):
+        self.assertRaises(exception.ProcessExecutionError, utils.execute,
+                          'ls', '/', run_as_root=True)
+
+    def test_execute_concurrently(self):
+        # Both commands only finish once the other one started.
+        fifo = os.path.join(self.tempdir, 'fifo')
+        os.mkfifo(fifo)
+        pool = greenpool.GreenPool()
+        reader = pool.spawn(utils.execute, 'cat', fifo, run_as_root=True)
+        pool.spawn(utils.execute, 'sh', '-c', 'echo foo > %s' % fifo,
+                   run_as_root=True)
+        pool.waitall()
+        self.assertEqual(reader.wait(), ('foo\n', ''))
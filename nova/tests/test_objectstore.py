@@ -128,6 +128,40 @@ class S3APITestCase(test.TestCase):
 
         self._ensure_no_buckets(bucket.get_all_keys())
 
+    def test_key_contents_are_streamed(self):
+        bucket_name = 'testbucket'
+        key_contents = 'x' * (s3server.CHUNK_SIZE * 2 + 1)
+
+        b = self.conn.create_bucket(bucket_name)
+        k = b.new_key('bigkey')
+        k.set_contents_from_string(key_contents)
+
+        key = b.get_key('bigkey')
+        self.assertEquals(key.get_contents_as_string(), key_contents)
+        # No upload is left behind in the bucket
+        self.assertEquals([key.name for key in b.get_all_keys()], ['bigkey'])
+
+    def test_key_range(self):
+        bucket_name = 'testbucket'
+
+        b = self.conn.create_bucket(bucket_name)
+        k = b.new_key('somekey')
+        k.set_contents_from_string('0123456789')
+
+        key = b.get_key('somekey')
+        self.assertEquals(
+            key.get_contents_as_string(headers={'Range': 'bytes=2-5'}),
+            '2345')
+        self.assertEquals(
+            key.get_contents_as_string(headers={'Range': 'bytes=-3'}),
+            '789')
+        self.assertEquals(
+            key.get_contents_as_string(headers={'Range': 'bytes=0-1,4-5'}),
+            '0123456789')
+        self.assertRaises(boto_exception.S3ResponseError,
+                          key.get_contents_as_string,
+                          headers={'Range': 'bytes=20-30'})
+
     def test_unknown_bucket(self):
         bucket_name = 'falalala'
         self.assertRaises(boto_exception.S3ResponseError,
@@ -20,12 +20,18 @@
 Unit Tests for remote procedure calls using queue
 """
 
+import random
+import time
+
+import eventlet
+from eventlet import event
 import mox
 
 from nova import context
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova.openstack.common import cfg
 from nova import test
 from nova import service
@@ -43,6 +49,9 @@ test_service_opts = [
     cfg.IntOpt("test_service_listen_port",
                default=0,
                help="Port number to bind test service to"),
+    cfg.IntOpt("test_service_periodic_spacing",
+               default=120,
+               help="Seconds between runs of the flag spaced test task"),
     ]
 
 flags.FLAGS.register_opts(test_service_opts)
@@ -54,6 +63,36 @@ class FakeManager(manager.Manager):
         return 'manager'
 
 
+class PeriodicManager(manager.Manager):
+    """Manager with periodic tasks for tests"""
+    def __init__(self, *args, **kwargs):
+        super(PeriodicManager, self).__init__(*args, **kwargs)
+        self.calls = []
+        self.slow_event = None
+
+    @manager.periodic_task
+    def _every_tick(self, context):
+        self.calls.append('every_tick')
+
+    @manager.periodic_task(spacing=60)
+    def _spaced(self, context):
+        self.calls.append('spaced')
+
+    @manager.periodic_task(spacing='test_service_periodic_spacing')
+    def _flag_spaced(self, context):
+        self.calls.append('flag_spaced')
+
+    @manager.periodic_task
+    def _slow(self, context):
+        self.calls.append('slow')
+        if self.slow_event:
+            self.slow_event.wait()
+
+    @manager.periodic_task
+    def _failing(self, context):
+        raise test.TestingException()
+
+
 class ExtendedService(service.Service):
     def test_method(self):
         return 'service'
@@ -79,6 +118,90 @@ class ServiceManagerTestCase(test.TestCase):
         self.assertEqual(serv.test_method(), 'service')
 
 
+class PeriodicTasksTestCase(test.TestCase):
+    """Test cases for the periodic tasks of managers"""
+
+    def setUp(self):
+        super(PeriodicTasksTestCase, self).setUp()
+        self.now = 1000.0
+        self.stubs.Set(time, 'time', lambda: self.now)
+        self.stubs.Set(random, 'uniform', lambda a, b: b / 2)
+        self.manager = PeriodicManager()
+        self.context = context.get_admin_context()
+
+    def test_spacing_with_jitter(self):
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('spaced'), 0)
+        self.now += 29
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('spaced'), 0)
+        self.now += 1
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('spaced'), 1)
+        self.now += 59
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('spaced'), 1)
+        self.now += 1
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('spaced'), 2)
+        self.assertEqual(self.manager.calls.count('every_tick'), 5)
+
+    def test_spacing_from_flag(self):
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('flag_spaced'), 0)
+        self.now += 60
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('flag_spaced'), 1)
+        self.now += 60
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('flag_spaced'), 1)
+        self.flags(test_service_periodic_spacing=0)
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.calls.count('flag_spaced'), 2)
+
+    def test_raise_on_error(self):
+        self.assertRaises(test.TestingException,
+                          self.manager.periodic_tasks,
+                          self.context, raise_on_error=True)
+
+    def test_stats(self):
+        self.manager.periodic_tasks(self.context)
+        self.manager.periodic_tasks(self.context)
+        stats = self.manager.periodic_task_stats(self.context)
+        self.assertFalse('_spaced' in stats)
+        self.assertFalse('_flag_spaced' in stats)
+        self.assertEqual(stats['_every_tick']['runs'], 2)
+        self.assertEqual(stats['_every_tick']['errors'], 0)
+        self.assertEqual(stats['_failing']['runs'], 2)
+        self.assertEqual(stats['_failing']['errors'], 2)
+        self.assertEqual(stats['_failing']['last_start'], 1000.0)
+        self.assertEqual(stats['_failing']['last_duration'], 0.0)
+        self.assertFalse(stats['_failing']['running'])
+
+    def test_skip_while_running(self):
+        self.flags(periodic_task_concurrency=2)
+        self.manager.slow_event = event.Event()
+        self.manager.periodic_tasks(self.context)
+        eventlet.sleep(0)
+        self.manager.periodic_tasks(self.context)
+        eventlet.sleep(0)
+        stats = self.manager.periodic_task_stats(self.context)
+        self.assertEqual(self.manager.calls.count('slow'), 1)
+        self.assertTrue(stats['_slow']['running'])
+        self.assertEqual(stats['_slow']['overruns'], 1)
+        self.assertEqual(stats['_every_tick']['runs'], 2)
+
+        self.now += 5
+        self.manager.slow_event.send()
+        eventlet.sleep(0)
+        stats = self.manager.periodic_task_stats(self.context)
+        self.assertFalse(stats['_slow']['running'])
+        self.assertEqual(stats['_slow']['last_duration'], 5.0)
+        self.manager.periodic_tasks(self.context)
+        eventlet.sleep(0)
+        self.assertEqual(self.manager.calls.count('slow'), 2)
+
+
 class ServiceFlagsTestCase(test.TestCase):
     def test_service_enabled_on_create_based_on_flag(self):
         self.flags(enable_new_services=True)
@@ -109,6 +232,8 @@ class ServiceTestCase(test.TestCase):
     def setUp(self):
         super(ServiceTestCase, self).setUp()
         self.mox.StubOutWithMock(service, 'db')
+        self.mox.StubOutWithMock(heartbeat, 'db')
+        self.stubs.Set(heartbeat, '_DRIVER', None)
 
     def test_create(self):
         host = 'foo'
@@ -142,8 +267,8 @@ class ServiceTestCase(test.TestCase):
                                       binary).AndRaise(exception.NotFound())
         service.db.service_create(mox.IgnoreArg(),
                                   service_create).AndReturn(service_ref)
-        service.db.service_get(mox.IgnoreArg(),
-                               mox.IgnoreArg()).AndRaise(Exception())
+        heartbeat.db.service_heartbeat(mox.IgnoreArg(),
+                                       mox.IgnoreArg()).AndRaise(Exception())
 
         self.mox.ReplayAll()
         serv = service.Service(host,
@@ -175,10 +300,8 @@ class ServiceTestCase(test.TestCase):
                                       binary).AndRaise(exception.NotFound())
         service.db.service_create(mox.IgnoreArg(),
                                   service_create).AndReturn(service_ref)
-        service.db.service_get(mox.IgnoreArg(),
-                               service_ref['id']).AndReturn(service_ref)
-        service.db.service_update(mox.IgnoreArg(), service_ref['id'],
-                                  mox.ContainsKeyValue('report_count', 1))
+        heartbeat.db.service_heartbeat(mox.IgnoreArg(),
+                                       service_ref['id']).AndReturn(True)
 
         self.mox.ReplayAll()
         serv = service.Service(host,
@@ -191,6 +314,35 @@ class ServiceTestCase(test.TestCase):
 
         self.assert_(not serv.model_disconnected)
 
+    def test_report_state_recreates_service(self):
+        host = 'foo'
+        binary = 'bar'
+        topic = 'test'
+        service_ref = {'host': host,
+                       'binary': binary,
+                       'topic': topic,
+                       'report_count': 0,
+                       'availability_zone': 'nova',
+                       'id': 1}
+
+        service.db.service_get_by_args(mox.IgnoreArg(),
+                                       host,
+                                       binary).AndReturn(service_ref)
+        heartbeat.db.service_heartbeat(mox.IgnoreArg(),
+                                       service_ref['id']).AndReturn(False)
+        service.db.service_create(mox.IgnoreArg(),
+                                  mox.ContainsKeyValue('report_count', 0)
+                                  ).AndReturn(dict(service_ref, id=2))
+
+        self.mox.ReplayAll()
+        serv = service.Service(host,
+                               binary,
+                               topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.start()
+        serv.report_state()
+        self.assertEqual(serv.service_id, 2)
+
 
 class TestWSGIService(test.TestCase):
 
@@ -29,8 +29,10 @@ from eventlet import greenpool
 import iso8601
 import lockfile
 import mox
+import netaddr
 
 import nova
+from nova.db.sqlalchemy import models
 from nova import exception
 from nova import flags
 from nova import test
@@ -529,6 +531,43 @@ class ToPrimitiveTestCase(test.TestCase):
         self.assertTrue(ret[1].startswith('<function foo at 0x'))
         self.assertEquals(ret[2], '<built-in function dir>')
 
+    def test_netaddr(self):
+        x = [netaddr.IPAddress('10.0.0.1'), netaddr.IPNetwork('10.0.0.0/8')]
+        self.assertEquals(utils.to_primitive(x), ['10.0.0.1', '10.0.0.0/8'])
+
+    def test_model(self):
+        instance = models.Instance(id=1, hostname='foo',
+                                   launched_at=datetime.datetime(2012, 1, 2))
+        ret = utils.to_primitive([instance, instance])
+        self.assertEquals(ret[0], ret[1])
+        self.assertEquals(ret[0]['hostname'], 'foo')
+        self.assertEquals(ret[0]['launched_at'], '2012-01-02 00:00:00')
+
+    def test_mock(self):
+        self.assertEquals(utils.to_primitive(self.mox.CreateMockAnything()),
+                          'mock')
+        self.assertEquals(utils.to_primitive(self.mox.CreateMock(dict)),
+                          'mock')
+
+
+class DumpsTestCase(test.TestCase):
+    def test_dumps(self):
+        x = {'a': [1, 2], 'b': None}
+        self.assertEquals(utils.loads(utils.dumps(x)), x)
+
+    def test_dumps_converts_unknown_types(self):
+        instance = models.Instance(id=1, hostname='foo')
+        x = {'instance': instance,
+             'created': datetime.datetime(2012, 1, 2, 3, 4, 5),
+             'cidr': netaddr.IPNetwork('10.0.0.0/24')}
+        self.assertEquals(utils.loads(utils.dumps(x)),
+                          {'instance': utils.to_primitive(instance),
+                           'created': '2012-01-02 03:04:05',
+                           'cidr': '10.0.0.0/24'})
+
+    def test_dumps_unserializable(self):
+        self.assertRaises(TypeError, utils.dumps, {'a': object()})
+
 
 class MonkeyPatchTestCase(test.TestCase):
     """Unit test for utils.monkey_patch()."""
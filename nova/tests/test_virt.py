@@ -15,9 +15,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import os
+import shutil
+import tempfile
+
+import eventlet
+
+from nova import exception
 from nova import flags
+import nova.image
 from nova import test
 from nova.virt import driver
+from nova.virt import images
 
 FLAGS = flags.FLAGS
 
@@ -81,3 +91,57 @@ class TestVirtDriver(test.TestCase):
                                                 'swap_size': 0}))
         self.assertTrue(driver.swap_is_usable({'device_name': '/dev/sdb',
                                                 'swap_size': 1}))
+
+
+class FakeImageService(object):
+    def __init__(self, chunks, checksum):
+        self.chunks = chunks
+        self.checksum = checksum
+
+    def get(self, context, image_id, data):
+        for chunk in self.chunks:
+            data.write(chunk)
+        return {'id': image_id, 'checksum': self.checksum}
+
+
+class TestVirtImages(test.TestCase):
+    def setUp(self):
+        super(TestVirtImages, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'image')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestVirtImages, self).tearDown()
+
+    def _stub_image_service(self, checksum):
+        service = FakeImageService(['foo', 'bar'], checksum)
+        self.stubs.Set(nova.image, 'get_image_service',
+                       lambda context, image_href: (service, image_href))
+
+    def test_fetch_verifies_checksum(self):
+        self._stub_image_service(hashlib.md5('foobar').hexdigest())
+        images.fetch(None, '1', self.path, None, None)
+        self.assertEqual(open(self.path).read(), 'foobar')
+
+    def test_fetch_checksum_mismatch(self):
+        self._stub_image_service(hashlib.md5('foo').hexdigest())
+        self.assertRaises(exception.ImageUnacceptable, images.fetch,
+                          None, '1', self.path, None, None)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_concurrent_fetches_to_same_path(self):
+        calls = []
+
+        def fake_fetch_to_raw(context, image_href, path, user_id, project_id):
+            calls.append(path)
+            eventlet.sleep(0)
+            return {'id': image_href}
+
+        self.stubs.Set(images, '_fetch_to_raw', fake_fetch_to_raw)
+        threads = [eventlet.spawn(images.fetch_to_raw, None, '1', self.path,
+                                  None, None) for i in xrange(3)]
+        results = [thread.wait() for thread in threads]
+        self.assertEqual(calls, [self.path])
+        self.assertEqual(results, [{'id': '1'}] * 3)
+        self.assertEqual(images._fetches, {})
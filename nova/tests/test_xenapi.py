@@ -1459,7 +1459,29 @@ class XenAPIBWUsageTestCase(test.TestCase):
         compilation failed.  c.f. bug #910045.
         """
         result = self.conn.get_all_bw_usage(datetime.datetime.utcnow())
-        self.assertEqual(result, [])
+        self.assertEqual(list(result), [])
+
+
+class XenAPIRRDTestCase(test.TestCase):
+    RRD_UPDATES = (
+        '<xport><meta><start>1000</start><step>5</step><end>1010</end>'
+        '<rows>2</rows><columns>3</columns><legend>'
+        '<entry>AVERAGE:vm:uuid1:cpu0</entry>'
+        '<entry>AVERAGE:vm:uuid1:vif_0_rx</entry>'
+        '<entry>AVERAGE:vm:uuid2:cpu0</entry>'
+        '</legend></meta><data>'
+        '<row><t>1010</t><v>0.3000</v><v>20.0000</v><v>NaN</v></row>'
+        '<row><t>1005</t><v>0.1000</v><v>NaN</v><v>NaN</v></row>'
+        '</data></xport>')
+
+    def test_parse_rrd_update(self):
+        metrics = vm_utils.parse_rrd_update(self.RRD_UPDATES, 1000)
+        self.assertEqual(metrics, {'uuid1': {'cpu0': 0.2, 'vif_0_rx': 50.0},
+                                   'uuid2': {'cpu0': 0.0}})
+
+    def test_parse_rrd_update_until(self):
+        metrics = vm_utils.parse_rrd_update(self.RRD_UPDATES, 1000, 1005)
+        self.assertEqual(metrics['uuid1'], {'cpu0': 0.1, 'vif_0_rx': 0.0})
 
 
 # TODO(salvatore-orlando): this class and
@@ -1701,7 +1723,7 @@ class XenAPIDom0IptablesFirewallTestCase(test.TestCase):
                                        'to_port': 299,
                                        'cidr': '192.168.99.0/24'})
         #validate the extra rule
-        self.fw.refresh_security_group_rules(secgroup)
+        self.fw.refresh_security_group_rules(secgroup['id'])
         regex = re.compile('-A .* -j ACCEPT -p udp --dport 200:299'
                            ' -s 192.168.99.0/24')
         self.assertTrue(len(filter(regex.match, self._out_rules)) > 0,
@@ -48,6 +48,7 @@ from eventlet import corolocal
 from eventlet import event
 from eventlet import greenthread
 from eventlet import semaphore
+from eventlet.green import socket as green_socket
 from eventlet.green import subprocess
 import iso8601
 import lockfile
@@ -57,6 +58,7 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
+from nova.rootwrap import daemon as rootwrap_daemon
 
 
 LOG = logging.getLogger(__name__)
@@ -166,6 +168,78 @@ def fetchfile(url, target):
     execute('curl', '--fail', url, '-o', target)
 
 
+def _run_subprocess(cmd, process_input, shell):
+    LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+    _PIPE = subprocess.PIPE  # pylint: disable=E1101
+    obj = subprocess.Popen(cmd,
+                           stdin=_PIPE,
+                           stdout=_PIPE,
+                           stderr=_PIPE,
+                           close_fds=True,
+                           shell=shell)
+    result = None
+    if process_input is not None:
+        result = obj.communicate(process_input)
+    else:
+        result = obj.communicate()
+    obj.stdin.close()  # pylint: disable=E1101
+    return obj.returncode, result  # pylint: disable=E1101
+
+
+_ROOTWRAP_DAEMON_ERRNOS = (errno.ENOENT, errno.ECONNREFUSED)
+_rootwrap_daemon_lock = semaphore.Semaphore()
+
+
+def _rootwrap_daemon_connect(path):
+    sock = green_socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def _rootwrap_daemon_socket():
+    """Connect to the rootwrap daemon, starting it if it isn't running."""
+    path = rootwrap_daemon.socket_path(os.getuid())
+    try:
+        return _rootwrap_daemon_connect(path)
+    except socket.error, e:
+        if e.errno not in _ROOTWRAP_DAEMON_ERRNOS:
+            raise
+    with _rootwrap_daemon_lock:
+        # Another greenthread may have started it meanwhile.
+        try:
+            return _rootwrap_daemon_connect(path)
+        except socket.error, e:
+            if e.errno not in _ROOTWRAP_DAEMON_ERRNOS:
+                raise
+        LOG.info(_('Starting rootwrap daemon on %s'), path)
+        execute(*(shlex.split(FLAGS.root_helper) + ['--daemon']))
+        return _rootwrap_daemon_connect(path)
+
+
+def _run_with_rootwrap_daemon(cmd, process_input, shell):
+    LOG.debug(_('Running cmd (rootwrap daemon): %s'), ' '.join(cmd))
+    sock = _rootwrap_daemon_socket()
+    try:
+        rootwrap_daemon.send_message(sock, json.dumps(cmd))
+        rootwrap_daemon.send_message(sock, process_input or '')
+        try:
+            returncode = json.loads(rootwrap_daemon.recv_message(sock))
+            stdout = rootwrap_daemon.recv_message(sock)
+            stderr = rootwrap_daemon.recv_message(sock)
+        except EOFError:
+            raise exception.ProcessExecutionError(
+                    description=_('The rootwrap daemon closed the '
+                                  'connection'),
+                    cmd=' '.join(cmd))
+    finally:
+        sock.close()
+    return returncode, (stdout, stderr)
+
+
 def execute(*cmd, **kwargs):
     """Helper method to execute command with optional retry.
 
@@ -184,7 +258,8 @@ def execute(*cmd, **kwargs):
     :param attempts:           How many times to retry cmd.
     :param run_as_root:        True | False. Defaults to False. If set to True,
                                the command is prefixed by the command specified
-                               in the root_helper FLAG.
+                               in the root_helper FLAG, or sent to the rootwrap
+                               daemon if use_rootwrap_daemon is set.
 
     :raises exception.Error: on receiving unknown arguments
     :raises exception.ProcessExecutionError:
@@ -210,28 +285,18 @@ def execute(*cmd, **kwargs):
         raise exception.Error(_('Got unknown keyword args '
                                 'to utils.execute: %r') % kwargs)
 
-    if run_as_root:
-        cmd = shlex.split(FLAGS.root_helper) + list(cmd)
+    if run_as_root and FLAGS.use_rootwrap_daemon and not shell:
+        run = _run_with_rootwrap_daemon
+    else:
+        if run_as_root:
+            cmd = shlex.split(FLAGS.root_helper) + list(cmd)
+        run = _run_subprocess
     cmd = map(str, cmd)
 
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=True,
-                                   shell=shell)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
-            else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+            _returncode, result = run(cmd, process_input, shell)
             if _returncode:
                 LOG.debug(_('Result was %s') % _returncode)
                 if not ignore_exit_code and _returncode not in check_exit_code:
@@ -724,6 +789,41 @@ class LoopingCall(object):
         return self.done.wait()
 
 
+# Characters which end the literal prefix of a regexp.
+_REGEXP_SPECIAL = '.^$*+?{}[]|()'
+
+
+def regexp_literal_prefix(regexp):
+    """Return a literal every string matched by regexp starts with.
+
+    The regexp is matched at the start of strings, as re.match() does.
+    Returns '' if no prefix can be determined.
+    """
+    if '|' in regexp:
+        return ''
+    if regexp.startswith('^'):
+        regexp = regexp[1:]
+    prefix = []
+    i = 0
+    while i < len(regexp):
+        char = regexp[i]
+        if char == '\\':
+            if i + 1 >= len(regexp) or regexp[i + 1].isalnum():
+                # \d, \w and friends are not literals
+                break
+            char = regexp[i + 1]
+            i += 2
+        elif char in _REGEXP_SPECIAL:
+            break
+        else:
+            i += 1
+        if i < len(regexp) and regexp[i] in '*?{':
+            # The last literal is optional
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
 def xhtml_escape(value):
     """Escapes a string so it is valid within XML or XHTML.
 
@@ -744,88 +844,167 @@ def utf8(value):
     return value
 
 
-def to_primitive(value, convert_instances=False, level=0):
-    """Convert a complex object into primitives.
+def _nasty_to_primitive(value, convert_instances, level):
+    return unicode(value)
 
-    Handy for JSON serialization. We can optionally handle instances,
-    but since this is a recursive function, we could have cyclical
-    data structures.
 
-    To handle cyclical data structures we could track the actual objects
-    visited in a set, but not all objects are hashable. Instead we just
-    track the depth of the object inspections and don't go too deep.
+def _mock_to_primitive(value, convert_instances, level):
+    return 'mock'
 
-    Therefore, convert_instances=True is lossy ... be aware.
 
-    """
-    nasty = [inspect.ismodule, inspect.isclass, inspect.ismethod,
-             inspect.isfunction, inspect.isgeneratorfunction,
-             inspect.isgenerator, inspect.istraceback, inspect.isframe,
-             inspect.iscode, inspect.isbuiltin, inspect.isroutine,
-             inspect.isabstract]
-    for test in nasty:
-        if test(value):
-            return unicode(value)
+def _scalar_to_primitive(value, convert_instances, level):
+    return value
+
+
+def _list_to_primitive(value, convert_instances, level):
+    if level > 3:
+        return '?'
+    return [to_primitive(v, convert_instances, level) for v in value]
+
+
+def _dict_to_primitive(value, convert_instances, level):
+    if level > 3:
+        return '?'
+    return dict((k, to_primitive(v, convert_instances, level))
+                for k, v in value.iteritems())
 
+
+def _datetime_to_primitive(value, convert_instances, level):
+    if level > 3:
+        return '?'
+    return str(value)
+
+
+def _iteritems_to_primitive(value, convert_instances, level):
+    if level > 3:
+        return '?'
+    return _dict_to_primitive(dict(value.iteritems()), convert_instances,
+                              level)
+
+
+def _object_to_primitive(value, convert_instances, level):
+    if level > 3:
+        return '?'
+    if hasattr(value, 'iteritems'):
+        return _dict_to_primitive(dict(value.iteritems()), convert_instances,
+                                  level)
+    elif hasattr(value, '__iter__'):
+        return _list_to_primitive(list(value), convert_instances, level)
+    elif convert_instances and hasattr(value, '__dict__'):
+        # Likely an instance of something. Watch for cycles.
+        # Ignore class member vars.
+        return _dict_to_primitive(value.__dict__, convert_instances,
+                                  level + 1)
+    else:
+        return value
+
+
+_NASTY_TESTS = (inspect.ismodule, inspect.isclass, inspect.ismethod,
+                inspect.isfunction, inspect.isgeneratorfunction,
+                inspect.isgenerator, inspect.istraceback, inspect.isframe,
+                inspect.iscode, inspect.isbuiltin, inspect.isroutine,
+                inspect.isabstract)
+
+# { type : handler(value, convert_instances, level) }
+_PRIMITIVE_HANDLERS = {
+    types.NoneType: _scalar_to_primitive,
+    bool: _scalar_to_primitive,
+    int: _scalar_to_primitive,
+    long: _scalar_to_primitive,
+    float: _scalar_to_primitive,
+    str: _scalar_to_primitive,
+    unicode: _scalar_to_primitive,
+    list: _list_to_primitive,
+    tuple: _list_to_primitive,
+    dict: _dict_to_primitive,
+    datetime.datetime: _datetime_to_primitive,
+    # Iterating over a network would list all of its addresses.
+    netaddr.IPAddress: _nasty_to_primitive,
+    netaddr.IPNetwork: _nasty_to_primitive,
     # value of itertools.count doesn't get caught by inspects
-    # above and results in infinite loop when list(value) is called.
-    if type(value) == itertools.count:
-        return unicode(value)
+    # and results in infinite loop when list(value) is called.
+    itertools.count: _nasty_to_primitive,
+}
+
 
+def _find_primitive_handler(value):
+    """Pick the to_primitive handler for the type of value."""
+    cls = type(value)
+    # Mocks pretend to be of the mocked class, so never remember them.
+    cacheable = cls.__module__ != 'mox'
+    for test in _NASTY_TESTS:
+        if test(value):
+            if cacheable:
+                _PRIMITIVE_HANDLERS[cls] = _nasty_to_primitive
+            return _nasty_to_primitive
     # FIXME(vish): Workaround for LP bug 852095. Without this workaround,
     #              tests that raise an exception in a mocked method that
     #              has a @wrap_exception with a notifier will fail. If
     #              we up the dependency to 0.5.4 (when it is released) we
     #              can remove this workaround.
     if getattr(value, '__module__', None) == 'mox':
-        return 'mock'
+        return _mock_to_primitive
+
+    if issubclass(cls, (list, tuple)):
+        handler = _list_to_primitive
+    elif issubclass(cls, dict):
+        handler = _dict_to_primitive
+    elif issubclass(cls, datetime.datetime):
+        handler = _datetime_to_primitive
+    elif hasattr(cls, 'iteritems'):
+        handler = _iteritems_to_primitive
+    else:
+        # Instances may have their own attributes, so look at each value.
+        return _object_to_primitive
+    if cacheable:
+        _PRIMITIVE_HANDLERS[cls] = handler
+    return handler
 
-    if level > 3:
-        return '?'
 
-    # The try block may not be necessary after the class check above,
-    # but just in case ...
+def to_primitive(value, convert_instances=False, level=0):
+    """Convert a complex object into primitives.
+
+    Handy for JSON serialization. We can optionally handle instances,
+    but since this is a recursive function, we could have cyclical
+    data structures.
+
+    To handle cyclical data structures we could track the actual objects
+    visited in a set, but not all objects are hashable. Instead we just
+    track the depth of the object inspections and don't go too deep.
+
+    Therefore, convert_instances=True is lossy ... be aware.
+
+    How a value is converted is decided by its type, and remembered for
+    the builtin types, datetimes and classes with iteritems() such as
+    the database models.
+
+    """
+    handler = _PRIMITIVE_HANDLERS.get(type(value))
+    if handler is None:
+        handler = _find_primitive_handler(value)
     try:
-        if isinstance(value, (list, tuple)):
-            o = []
-            for v in value:
-                o.append(to_primitive(v, convert_instances=convert_instances,
-                                      level=level))
-            return o
-        elif isinstance(value, dict):
-            o = {}
-            for k, v in value.iteritems():
-                o[k] = to_primitive(v, convert_instances=convert_instances,
-                                    level=level)
-            return o
-        elif isinstance(value, datetime.datetime):
-            return str(value)
-        elif hasattr(value, 'iteritems'):
-            return to_primitive(dict(value.iteritems()),
-                                convert_instances=convert_instances,
-                                level=level)
-        elif hasattr(value, '__iter__'):
-            return to_primitive(list(value), level)
-        elif convert_instances and hasattr(value, '__dict__'):
-            # Likely an instance of something. Watch for cycles.
-            # Ignore class member vars.
-            return to_primitive(value.__dict__,
-                                convert_instances=convert_instances,
-                                level=level + 1)
-        else:
-            return value
+        return handler(value, convert_instances, level)
     except TypeError, e:
         # Class objects are tricky since they may define something like
         # __iter__ defined but it isn't callable as list().
         return unicode(value)
 
 
+def _json_default(value):
+    """Convert a value json can't handle, raising TypeError as json does."""
+    primitive = to_primitive(value)
+    if primitive is value:
+        raise TypeError("%r is not JSON serializable" % (value,))
+    return primitive
+
+
 def dumps(value):
-    try:
-        return json.dumps(value)
-    except TypeError:
-        pass
-    return json.dumps(to_primitive(value))
+    """Serialize value to JSON, converting what json can't handle.
+
+    Only the values json does not know about are passed through
+    to_primitive(), so plain data is not walked twice.
+    """
+    return json.dumps(value, default=_json_default)
 
 
 def loads(s):
@@ -1616,11 +1795,9 @@ warnings.showwarning = _showwarning
 
 
 def service_is_up(service):
-    """Check whether a service is up based on last heartbeat."""
-    last_heartbeat = service['updated_at'] or service['created_at']
-    # Timestamps in DB are UTC.
-    elapsed = total_seconds(utcnow() - last_heartbeat)
-    return abs(elapsed) <= FLAGS.service_down_time
+    """Check whether a service is up according to the heartbeat driver."""
+    from nova import heartbeat
+    return heartbeat.get_driver().is_up(service)
 
 
 def generate_mac_address():
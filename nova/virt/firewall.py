@@ -21,6 +21,7 @@ from nova import context
 from nova import db
 from nova import flags
 from nova import log as logging
+from nova.network import model as network_model
 from nova.openstack.common import cfg
 from nova import utils
 from nova.virt import netutils
@@ -107,6 +108,11 @@ class IptablesFirewallDriver(FirewallDriver):
         self.instances = {}
         self.network_infos = {}
         self.basicly_filtered = False
+        # Compiled rules of each security group, shared by all instances
+        # in the group: {id: (ipv4 rules, ipv6 rules, grantee group ids)}
+        self.security_group_rules = {}
+        # Ids of the security groups of each instance
+        self.instance_security_groups = {}
 
         self.iptables.ipv4['filter'].add_chain('sg-fallback')
         self.iptables.ipv4['filter'].add_rule('sg-fallback', '-j DROP')
@@ -179,6 +185,7 @@ class IptablesFirewallDriver(FirewallDriver):
         self._add_filters(chain_name, ipv4_rules, ipv6_rules)
 
     def remove_filters_for_instance(self, instance):
+        self.instance_security_groups.pop(instance['id'], None)
         chain_name = self._instance_chain_name(instance)
 
         self.iptables.ipv4['filter'].remove_chain(chain_name)
@@ -257,6 +264,116 @@ class IptablesFirewallDriver(FirewallDriver):
                     '--dports', '%s:%s' % (rule.from_port,
                                            rule.to_port)]
 
+    def _security_group_rules(self, ctxt, security_group_id):
+        """Return the ipv4 and ipv6 rules of a security group.
+
+        The rules are compiled once and reused until one of the refresh_*
+        methods is called for the group.
+        """
+        compiled = self.security_group_rules.get(security_group_id)
+        if compiled is None:
+            compiled = self._compile_security_group_rules(ctxt,
+                                                          security_group_id)
+            self.security_group_rules[security_group_id] = compiled
+        ipv4_rules, ipv6_rules, _grantee_group_ids = compiled
+        return ipv4_rules, ipv6_rules
+
+    def _instances_nw_info(self, ctxt, instances):
+        """Return the network info of instances, keyed by uuid.
+
+        The network info is read from the info caches of all instances in
+        one query. Only instances with an empty cache are looked up through
+        the network API.
+        """
+        nw_infos = {}
+        if not instances:
+            return nw_infos
+        uuids = [instance['uuid'] for instance in instances]
+        for info_cache in db.instance_info_cache_get_all_by_instances(ctxt,
+                                                                      uuids):
+            if info_cache['network_info']:
+                nw_infos[info_cache['instance_id']] = \
+                    network_model.NetworkInfo.hydrate(
+                        info_cache['network_info'])
+
+        missing = [instance for instance in instances
+                   if instance['uuid'] not in nw_infos]
+        if missing:
+            # FIXME(jkoelker) This needs to be ported up into
+            #                 the compute manager which already
+            #                 has access to a nw_api handle,
+            #                 and should be the only one making
+            #                 making rpc calls.
+            import nova.network
+            nw_api = nova.network.API()
+            for instance in missing:
+                nw_infos[instance['uuid']] = nw_api.get_instance_nw_info(
+                        ctxt, instance)
+        return nw_infos
+
+    def _compile_security_group_rules(self, ctxt, security_group_id):
+        ipv4_rules = []
+        ipv6_rules = []
+        rules = db.security_group_rule_get_by_security_group(ctxt,
+                                                             security_group_id)
+
+        # Resolve the members of all grantee groups at once
+        grantees = {}
+        grantee_group_ids = set()
+        for rule in rules:
+            if not rule.cidr and rule['grantee_group']:
+                grantee_group_ids.add(rule['grantee_group']['id'])
+                for instance in rule['grantee_group']['instances']:
+                    grantees[instance['uuid']] = instance
+        nw_infos = self._instances_nw_info(ctxt, grantees.values())
+
+        for rule in rules:
+            LOG.debug(_('Adding security group rule: %r'), rule)
+
+            if not rule.cidr:
+                version = 4
+            else:
+                version = netutils.get_ip_version(rule.cidr)
+
+            if version == 4:
+                fw_rules = ipv4_rules
+            else:
+                fw_rules = ipv6_rules
+
+            protocol = rule.protocol
+            if version == 6 and rule.protocol == 'icmp':
+                protocol = 'icmpv6'
+
+            args = ['-j ACCEPT']
+            if protocol:
+                args += ['-p', protocol]
+
+            if protocol in ['udp', 'tcp']:
+                args += self._build_tcp_udp_rule(rule, version)
+            elif protocol == 'icmp':
+                args += self._build_icmp_rule(rule, version)
+            if rule.cidr:
+                LOG.info('Using cidr %r', rule.cidr)
+                args += ['-s', rule.cidr]
+                fw_rules += [' '.join(args)]
+            else:
+                if rule['grantee_group']:
+                    for instance in rule['grantee_group']['instances']:
+                        LOG.info('instance: %r', instance)
+                        nw_info = nw_infos[instance['uuid']]
+
+                        ips = [ip['address']
+                            for ip in nw_info.fixed_ips()
+                                if ip['version'] == version]
+
+                        LOG.info('ips: %r', ips)
+                        for ip in ips:
+                            subrule = args + ['-s %s' % ip]
+                            fw_rules += [' '.join(subrule)]
+
+            LOG.info('Using fw_rules: %r', fw_rules)
+        return ipv4_rules, ipv6_rules, grantee_group_ids
+
     def instance_rules(self, instance, network_info):
         ctxt = context.get_admin_context()
 
@@ -281,65 +398,16 @@ class IptablesFirewallDriver(FirewallDriver):
 
         security_groups = db.security_group_get_by_instance(ctxt,
                                                             instance['id'])
+        self.instance_security_groups[instance['id']] = [
+                security_group['id'] for security_group in security_groups]
 
         # then, security group chains and rules
         for security_group in security_groups:
-            rules = db.security_group_rule_get_by_security_group(ctxt,
-                                                          security_group['id'])
-
-            for rule in rules:
-                LOG.debug(_('Adding security group rule: %r'), rule)
+            group_ipv4_rules, group_ipv6_rules = self._security_group_rules(
+                    ctxt, security_group['id'])
+            ipv4_rules += group_ipv4_rules
+            ipv6_rules += group_ipv6_rules
 
-                if not rule.cidr:
-                    version = 4
-                else:
-                    version = netutils.get_ip_version(rule.cidr)
-
-                if version == 4:
-                    fw_rules = ipv4_rules
-                else:
-                    fw_rules = ipv6_rules
-
-                protocol = rule.protocol
-                if version == 6 and rule.protocol == 'icmp':
-                    protocol = 'icmpv6'
-
-                args = ['-j ACCEPT']
-                if protocol:
-                    args += ['-p', protocol]
-
-                if protocol in ['udp', 'tcp']:
-                    args += self._build_tcp_udp_rule(rule, version)
-                elif protocol == 'icmp':
-                    args += self._build_icmp_rule(rule, version)
-                if rule.cidr:
-                    LOG.info('Using cidr %r', rule.cidr)
-                    args += ['-s', rule.cidr]
-                    fw_rules += [' '.join(args)]
-                else:
-                    if rule['grantee_group']:
-                        # FIXME(jkoelker) This needs to be ported up into
-                        #                 the compute manager which already
-                        #                 has access to a nw_api handle,
-                        #                 and should be the only one making
-                        #                 making rpc calls.
-                        import nova.network
-                        nw_api = nova.network.API()
-                        for instance in rule['grantee_group']['instances']:
-                            LOG.info('instance: %r', instance)
-                            nw_info = nw_api.get_instance_nw_info(ctxt,
-                                                                  instance)
-
-                            ips = [ip['address']
-                                for ip in nw_info.fixed_ips()
-                                    if ip['version'] == version]
-
-                            LOG.info('ips: %r', ips)
-                            for ip in ips:
-                                subrule = args + ['-s %s' % ip]
-                                fw_rules += [' '.join(subrule)]
-
-                LOG.info('Using fw_rules: %r', fw_rules)
         ipv4_rules += ['-j $sg-fallback']
         ipv6_rules += ['-j $sg-fallback']
 
@@ -349,10 +417,17 @@ class IptablesFirewallDriver(FirewallDriver):
         pass
 
     def refresh_security_group_members(self, security_group):
+        # NOTE: Forget every group granting access to another group, not
+        #       just to this one, as a single refresh is sent when the
+        #       members of several groups change at once.
+        for security_group_id, compiled in self.security_group_rules.items():
+            if compiled[2]:
+                del self.security_group_rules[security_group_id]
         self.do_refresh_security_group_rules(security_group)
         self.iptables.apply()
 
     def refresh_security_group_rules(self, security_group):
+        self.security_group_rules.pop(security_group, None)
         self.do_refresh_security_group_rules(security_group)
         self.iptables.apply()
 
@@ -361,6 +436,17 @@ class IptablesFirewallDriver(FirewallDriver):
         for instance in self.instances.values():
             self.remove_filters_for_instance(instance)
             self.add_filters_for_instance(instance)
+        self._purge_security_group_rules()
+
+    def _purge_security_group_rules(self):
+        """Forget the compiled rules of groups no instance is in anymore,
+        such as deleted groups."""
+        in_use = set()
+        for security_group_ids in self.instance_security_groups.values():
+            in_use.update(security_group_ids)
+        for security_group_id in self.security_group_rules.keys():
+            if security_group_id not in in_use:
+                del self.security_group_rules[security_group_id]
 
     def refresh_provider_fw_rules(self):
         """See :class:`FirewallDriver` docs."""
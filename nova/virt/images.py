@@ -21,8 +21,14 @@
 Handling of VM disk images.
 """
 
+import contextlib
 import errno
+import hashlib
 import os
+import time
+
+from eventlet import event
+from eventlet import semaphore
 
 from nova import exception
 from nova import flags
@@ -38,11 +44,45 @@ image_opts = [
     cfg.BoolOpt('force_raw_images',
                 default=True,
                 help='Force backing images to raw format'),
+    cfg.IntOpt('image_fetch_workers',
+               default=4,
+               help='Maximum number of images fetched and converted at the '
+                    'same time. 0 means unlimited.'),
 ]
 
 FLAGS = flags.FLAGS
 FLAGS.register_opts(image_opts)
 
+_fetch_semaphore = None
+
+# Fetches in progress, by target path.
+_fetches = {}
+
+
+class _ChecksumFile(object):
+    """Checksums the data written through it to a file."""
+
+    def __init__(self, image_file):
+        self.image_file = image_file
+        self.checksum = hashlib.md5()
+
+    def write(self, data):
+        self.checksum.update(data)
+        self.image_file.write(data)
+
+
+@contextlib.contextmanager
+def _fetch_slot():
+    """Wait until fewer than image_fetch_workers fetches are running."""
+    global _fetch_semaphore
+    if FLAGS.image_fetch_workers <= 0:
+        yield
+        return
+    if _fetch_semaphore is None:
+        _fetch_semaphore = semaphore.Semaphore(FLAGS.image_fetch_workers)
+    with _fetch_semaphore:
+        yield
+
 
 def fetch(context, image_href, path, _user_id, _project_id):
     # TODO(vish): Improve context handling and add owner and auth data
@@ -53,13 +93,49 @@ def fetch(context, image_href, path, _user_id, _project_id):
                                                              image_href)
     with utils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
-            metadata = image_service.get(context, image_id, image_file)
-            return metadata
+            # The image is checksummed as it is written, rather than
+            # being read again once downloaded.
+            checksum_file = _ChecksumFile(image_file)
+            metadata = image_service.get(context, image_id, checksum_file)
+        expected = metadata.get('checksum')
+        actual = checksum_file.checksum.hexdigest()
+        if expected and expected != actual:
+            raise exception.ImageUnacceptable(image_id=image_href,
+                reason=_("checksum %(actual)s doesn't match %(expected)s") %
+                locals())
+        return metadata
 
 
 def fetch_to_raw(context, image_href, path, user_id, project_id):
+    """Fetch an image to path, converting it to raw if force_raw_images.
+
+    Concurrent fetches to the same path are only done once.
+    """
+    fetch = _fetches.get(path)
+    if fetch is not None:
+        return fetch.wait()
+
+    fetch = _fetches[path] = event.Event()
+    try:
+        with _fetch_slot():
+            metadata = _fetch_to_raw(context, image_href, path, user_id,
+                                     project_id)
+    except Exception as e:
+        fetch.send_exception(e)
+        raise
+    else:
+        fetch.send(metadata)
+    finally:
+        del _fetches[path]
+    return metadata
+
+
+def _fetch_to_raw(context, image_href, path, user_id, project_id):
+    timings = {'fetch': 0.0, 'info': 0.0, 'convert': 0.0}
+    start = time.time()
     path_tmp = "%s.part" % path
     metadata = fetch(context, image_href, path_tmp, user_id, project_id)
+    timings['fetch'] = time.time() - start
 
     def _qemu_img_info(path):
 
@@ -78,7 +154,9 @@ def fetch_to_raw(context, image_href, path, user_id, project_id):
         return(data)
 
     with utils.remove_path_on_error(path_tmp):
+        start = time.time()
         data = _qemu_img_info(path_tmp)
+        timings['info'] = time.time() - start
 
         fmt = data.get("file format")
         if fmt is None:
@@ -95,8 +173,10 @@ def fetch_to_raw(context, image_href, path, user_id, project_id):
             staged = "%s.converted" % path
             LOG.debug("%s was %s, converting to raw" % (image_href, fmt))
             with utils.remove_path_on_error(staged):
+                start = time.time()
                 out, err = utils.execute('qemu-img', 'convert', '-O', 'raw',
                                          path_tmp, staged)
+                timings['convert'] = time.time() - start
 
                 data = _qemu_img_info(staged)
                 if data.get('file format', None) != "raw":
@@ -109,4 +189,7 @@ def fetch_to_raw(context, image_href, path, user_id, project_id):
         else:
             os.rename(path_tmp, path)
 
+    LOG.debug(_("Fetched %(image_href)s to %(path)s: fetch %(fetch).2fs, "
+                "info %(info).2fs, convert %(convert).2fs") %
+              dict(timings, image_href=image_href, path=path))
     return metadata
@@ -297,19 +297,17 @@ class XenAPIConnection(driver.ComputeDriver):
         return self._vmops.get_diagnostics(instance)
 
     def get_all_bw_usage(self, start_time, stop_time=None):
-        """Return bandwidth usage info for each interface on each
+        """Yield bandwidth usage info for each interface on each
            running VM"""
-        bwusage = []
         start_time = time.mktime(start_time.timetuple())
         if stop_time:
             stop_time = time.mktime(stop_time.timetuple())
         for iusage in self._vmops.get_all_bw_usage(start_time,
-                                                   stop_time).values():
+                                                   stop_time).itervalues():
             for macaddr, usage in iusage.iteritems():
-                bwusage.append(dict(mac_address=macaddr,
-                                    bw_in=usage['bw_in'],
-                                    bw_out=usage['bw_out']))
-        return bwusage
+                yield dict(mac_address=macaddr,
+                           bw_in=usage['bw_in'],
+                           bw_out=usage['bw_out'])
 
     def get_console_output(self, instance):
         """Return snapshot of console"""
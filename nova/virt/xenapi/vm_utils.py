@@ -20,18 +20,20 @@ Helper methods for operations related to the management of VM records and
 their attributes like VDIs, VIFs, as well as their lookup functions.
 """
 
+import array
 import contextlib
 import cPickle as pickle
-import decimal
+import itertools
 import json
+import math
 import os
 import re
+import StringIO
 import time
 import urllib
 import urlparse
 import uuid
-from xml.dom import minidom
-from xml.parsers import expat
+from xml.etree import cElementTree as ElementTree
 
 from eventlet import greenthread
 
@@ -1075,17 +1077,21 @@ class VMHelper(xenapi.HelperBase):
             vm_uuid = record["uuid"]
             xml = get_rrd(get_rrd_server(), vm_uuid)
             if xml:
-                rrd = minidom.parseString(xml)
-                for i, node in enumerate(rrd.firstChild.childNodes):
-                    # We don't want all of the extra garbage
-                    if i >= 3 and i <= 11:
-                        ref = node.childNodes
-                        # Name and Value
-                        if len(ref) > 6:
-                            _ref_zero = ref[0].firstChild.data
-                            diags[_ref_zero] = ref[6].firstChild.data
+                # Only the first data sources are wanted, the archives
+                # after them are most of the document and aren't parsed.
+                data_sources = 0
+                for event, elem in ElementTree.iterparse(
+                        StringIO.StringIO(xml), events=('start', 'end')):
+                    if event == 'start':
+                        if elem.tag == 'rra':
+                            break
+                    elif elem.tag == 'ds':
+                        diags[elem.findtext('name')] = elem.findtext('value')
+                        data_sources += 1
+                        if data_sources == 9:
+                            break
             return diags
-        except expat.ExpatError as e:
+        except SyntaxError as e:
             LOG.exception(_('Unable to parse rrd of %(vm_uuid)s') % locals())
             return {"Unable to retrieve diagnostics": e}
 
@@ -1097,8 +1103,7 @@ class VMHelper(xenapi.HelperBase):
 
         xml = get_rrd_updates(get_rrd_server(), start_time)
         if xml:
-            doc = minidom.parseString(xml)
-            return parse_rrd_update(doc, start_time, stop_time)
+            return parse_rrd_update(xml, start_time, stop_time)
 
         raise exception.CouldNotFetchMetrics()
 
@@ -1239,85 +1244,84 @@ def get_rrd_updates(server, start_time):
         return None
 
 
-def parse_rrd_meta(doc):
-    data = {}
-    meta = doc.getElementsByTagName('meta')[0]
-    for tag in ('start', 'end', 'step'):
-        data[tag] = int(meta.getElementsByTagName(tag)[0].firstChild.data)
-    legend = meta.getElementsByTagName('legend')[0]
-    data['legend'] = [child.firstChild.data for child in legend.childNodes]
-    return data
-
-
-def parse_rrd_data(doc):
-    dnode = doc.getElementsByTagName('data')[0]
-    return [dict(
-            time=int(child.getElementsByTagName('t')[0].firstChild.data),
-            values=[decimal.Decimal(valnode.firstChild.data)
-                  for valnode in child.getElementsByTagName('v')])
-            for child in dnode.childNodes]
+def parse_rrd_data(xml):
+    """Parse an RRD updates XML into arrays.
 
-
-def parse_rrd_update(doc, start, until=None):
+    Returns the legend, the times of the rows and one array of values per
+    column.  The XML is parsed as a stream and each row is dropped once
+    its values are in the arrays.
+    """
+    legend = []
+    times = array.array('l')
+    columns = None
+    row = []
+    for _event, elem in ElementTree.iterparse(StringIO.StringIO(xml)):
+        if elem.tag == 'v':
+            row.append(float(elem.text))
+        elif elem.tag == 't':
+            times.append(int(elem.text))
+        elif elem.tag == 'row':
+            if columns is None:
+                columns = [array.array('d') for _value in row]
+            for column, value in itertools.izip(columns, row):
+                column.append(value)
+            row = []
+            elem.clear()
+        elif elem.tag == 'entry':
+            legend.append(elem.text)
+    return legend, times, columns or []
+
+
+def parse_rrd_update(xml, start, until=None):
+    """Return the metrics of each VM in an RRD updates XML.
+
+    The bandwidth of VIFs is integrated over the period, the other
+    metrics are averaged.
+    """
     sum_data = {}
-    meta = parse_rrd_meta(doc)
-    data = parse_rrd_data(doc)
-    for col, collabel in enumerate(meta['legend']):
+    legend, times, columns = parse_rrd_data(xml)
+    for collabel, values in itertools.izip(legend, columns):
         _datatype, _objtype, uuid, name = collabel.split(':')
-        vm_data = sum_data.get(uuid, dict())
+        vm_data = sum_data.setdefault(uuid, {})
         if name.startswith('vif'):
-            vm_data[name] = integrate_series(data, col, start, until)
+            vm_data[name] = integrate_series(times, values, start, until)
         else:
-            vm_data[name] = average_series(data, col, until)
-        sum_data[uuid] = vm_data
+            vm_data[name] = average_series(times, values, until)
     return sum_data
 
 
-def average_series(data, col, until=None):
-    vals = [row['values'][col] for row in data
-            if (not until or (row['time'] <= until)) and
-                row['values'][col].is_finite()]
-    if vals:
-        try:
-            return (sum(vals) / len(vals)).quantize(decimal.Decimal('1.0000'))
-        except decimal.InvalidOperation:
-            # (mdragon) Xenserver occasionally returns odd values in
-            # data that will throw an error on averaging (see bug 918490)
-            # These are hard to find, since, whatever those values are,
-            # Decimal seems to think they are a valid number, sortof.
-            # We *think* we've got the the cases covered, but just in
-            # case, log and return NaN, so we don't break reporting of
-            # other statistics.
-            LOG.error(_("Invalid statistics data from Xenserver: %s")
-                      % str(vals))
-            return decimal.Decimal('NaN')
-    else:
-        return decimal.Decimal('0.0000')
+def average_series(times, values, until=None):
+    """Average the finite values, of rows up to until if given."""
+    if until:
+        values = [val for time, val in itertools.izip(times, values)
+                  if time <= until]
+    values = [val for val in values
+              if not (math.isnan(val) or math.isinf(val))]
+    if not values:
+        return 0.0
+    return round(math.fsum(values) / len(values), 4)
+
 
+def integrate_series(times, values, start, until=None):
+    """Integrate values over time from start, NaNs counting as 0.
 
-def integrate_series(data, col, start, until=None):
-    total = decimal.Decimal('0.0000')
+    The rows come newest first.
+    """
+    total = 0.0
     prev_time = int(start)
     prev_val = None
-    for row in reversed(data):
-        if not until or (row['time'] <= until):
-            time = row['time']
-            val = row['values'][col]
-            if val.is_nan():
-                val = decimal.Decimal('0.0000')
-            if prev_val is None:
-                prev_val = val
-            if prev_val >= val:
-                total += ((val * (time - prev_time)) +
-                          (decimal.Decimal('0.5000') * (prev_val - val) *
-                          (time - prev_time)))
-            else:
-                total += ((prev_val * (time - prev_time)) +
-                          (decimal.Decimal('0.5000') * (val - prev_val) *
-                          (time - prev_time)))
-            prev_time = time
+    for time, val in itertools.izip(reversed(times), reversed(values)):
+        if until and time > until:
+            continue
+        if math.isnan(val):
+            val = 0.0
+        if prev_val is None:
             prev_val = val
-    return total.quantize(decimal.Decimal('1.0000'))
+        # Area of the trapezoid between the previous row and this one
+        total += (prev_val + val) * (time - prev_time) / 2.0
+        prev_time = time
+        prev_val = val
+    return round(total, 4)
 
 
 def _get_all_vdis_in_sr(session, sr_ref):
@@ -67,6 +67,7 @@ setuptools.setup(name='nova',
                'bin/instance-usage-audit',
                'bin/nova-all',
                'bin/nova-api',
+               'bin/nova-api-limiter',
                'bin/nova-api-ec2',
                'bin/nova-api-metadata',
                'bin/nova-api-os-compute',
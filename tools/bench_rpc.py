@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""bench_rpc.py - Measure rpc.call throughput on the fake kombu transport
+
+Runs an echo consumer and times rpc.call() with a queue declared for each
+call and with amqp_rpc_single_reply_queue, using the in-memory kombu
+transport so no broker is needed.  The calls are made one at a time as
+the memory transport mixes up the messages of concurrent consumers.
+
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import optparse
+import os
+import sys
+import time
+
+# If ../nova/__init__.py exists, add ../ to Python search path, so that
+# it will override what happens to be installed in /usr/(local/)lib/python...
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import context
+from nova import flags
+from nova.rpc import impl_kombu
+
+
+FLAGS = flags.FLAGS
+
+
+class EchoProxy(object):
+    def echo(self, context, value):
+        return value
+
+
+def bench(number):
+    """Return the number of rpc.call() per second."""
+    ctxt = context.get_admin_context()
+    msg = {'method': 'echo', 'args': {'value': 42}}
+    start = time.time()
+    for _i in xrange(number):
+        impl_kombu.call(ctxt, 'bench_rpc', msg)
+    return number / (time.time() - start)
+
+
+def main():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('-n', '--number', type='int', default=500,
+                      help='Number of calls made in each mode')
+    options, _args = parser.parse_args()
+
+    FLAGS([])
+    FLAGS.set_override('fake_rabbit', True)
+    FLAGS.set_override('verbose', False)
+
+    conn = impl_kombu.create_connection()
+    conn.create_consumer('bench_rpc', EchoProxy(), fanout=False)
+    conn.consume_in_thread()
+    try:
+        for single_reply_queue in (False, True):
+            FLAGS.set_override('amqp_rpc_single_reply_queue',
+                               single_reply_queue)
+            calls = bench(options.number)
+            print 'single_reply_queue=%-5s %8.1f calls/sec' % (
+                    single_reply_queue, calls)
+    finally:
+        conn.close()
+        impl_kombu.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""bench_serialization.py - Time the JSON serialization of nova payloads
+
+Compares utils.to_primitive() and utils.dumps() with the recursive
+implementation they replaced, on the instance and network_info payloads
+sent over RPC and in notifications.
+
+"""
+
+import datetime
+import inspect
+import itertools
+import json
+import optparse
+import os
+import sys
+import timeit
+
+# If ../nova/__init__.py exists, add ../ to Python search path, so that
+# it will override what happens to be installed in /usr/(local/)lib/python...
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova.db.sqlalchemy import models
+from nova.network import model as network_model
+from nova import utils
+
+
+def legacy_to_primitive(value, convert_instances=False, level=0):
+    """utils.to_primitive() before the per-type handlers."""
+    nasty = [inspect.ismodule, inspect.isclass, inspect.ismethod,
+             inspect.isfunction, inspect.isgeneratorfunction,
+             inspect.isgenerator, inspect.istraceback, inspect.isframe,
+             inspect.iscode, inspect.isbuiltin, inspect.isroutine,
+             inspect.isabstract]
+    for test in nasty:
+        if test(value):
+            return unicode(value)
+    if type(value) == itertools.count:
+        return unicode(value)
+    if getattr(value, '__module__', None) == 'mox':
+        return 'mock'
+    if level > 3:
+        return '?'
+    try:
+        if isinstance(value, (list, tuple)):
+            return [legacy_to_primitive(v, convert_instances, level)
+                    for v in value]
+        elif isinstance(value, dict):
+            return dict((k, legacy_to_primitive(v, convert_instances, level))
+                        for k, v in value.iteritems())
+        elif isinstance(value, datetime.datetime):
+            return str(value)
+        elif hasattr(value, 'iteritems'):
+            return legacy_to_primitive(dict(value.iteritems()),
+                                       convert_instances, level)
+        elif hasattr(value, '__iter__'):
+            return legacy_to_primitive(list(value), level)
+        elif convert_instances and hasattr(value, '__dict__'):
+            return legacy_to_primitive(value.__dict__, convert_instances,
+                                       level + 1)
+        else:
+            return value
+    except TypeError:
+        return unicode(value)
+
+
+def legacy_dumps(value):
+    """utils.dumps() before only unknown types were converted."""
+    try:
+        return json.dumps(value)
+    except TypeError:
+        pass
+    return json.dumps(legacy_to_primitive(value))
+
+
+def make_instance():
+    now = datetime.datetime(2012, 6, 1, 12, 0, 0)
+    instance = models.Instance(
+            id=1, uuid='6a1b5b84-0f8a-4b8a-b3d8-2ba16e3c5a4c',
+            user_id='fake-user', project_id='fake-project',
+            image_ref='cedef40a-ed67-4d10-800e-17455edce175',
+            kernel_id='', ramdisk_id='', hostname='server-1',
+            host='compute-1', launch_index=0, key_name='key',
+            key_data='ssh-rsa AAAA', power_state=1, vm_state='active',
+            task_state=None, memory_mb=2048, vcpus=1, root_gb=20,
+            ephemeral_gb=0, instance_type_id=1, user_data='',
+            reservation_id='r-12345678', launched_at=now,
+            created_at=now, updated_at=now, display_name='server-1',
+            display_description='', availability_zone='nova',
+            locked=False, os_type='linux', architecture='x86_64',
+            vm_mode=None, root_device_name='/dev/vda',
+            access_ip_v4='10.0.0.2', access_ip_v6=None,
+            config_drive='', progress=100, auto_disk_config=False)
+    return instance
+
+
+def make_network_info():
+    network_info = network_model.NetworkInfo()
+    for i in xrange(2):
+        subnet = network_model.Subnet(
+                cidr='10.0.%d.0/24' % i,
+                gateway=network_model.IP(address='10.0.%d.1' % i,
+                                         type='gateway'),
+                dns=[network_model.IP(address='8.8.8.8', type='dns')])
+        fixed_ip = network_model.FixedIP(address='10.0.%d.2' % i)
+        fixed_ip.add_floating_ip(network_model.IP(address='172.16.0.%d' % i,
+                                                  type='floating'))
+        subnet.add_ip(fixed_ip)
+        network = network_model.Network(id='net-%d' % i, bridge='br100',
+                                        label='private-%d' % i,
+                                        subnets=[subnet])
+        network_info.append(network_model.VIF(id='vif-%d' % i,
+                                              address='fa:16:3e:00:00:0%d' % i,
+                                              network=network))
+    return network_info
+
+
+def main():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('-n', '--number', type='int', default=2000,
+                      help='Number of times each payload is serialized')
+    options, _args = parser.parse_args()
+
+    instance = make_instance()
+    payloads = {
+        'instance': instance,
+        'network_info': make_network_info(),
+        'notification': {'instance': instance,
+                         'network_info': make_network_info(),
+                         'timestamp': datetime.datetime.utcnow()},
+    }
+    funcs = [('legacy to_primitive', legacy_to_primitive),
+             ('to_primitive', utils.to_primitive),
+             ('legacy dumps', legacy_dumps),
+             ('dumps', utils.dumps)]
+
+    for name, payload in sorted(payloads.iteritems()):
+        for func_name, func in funcs:
+            seconds = timeit.timeit(lambda: func(payload),
+                                    number=options.number)
+            print '%-14s %-20s %8.1f usec/call' % (
+                    name, func_name, seconds * 1e6 / options.number)
+
+
+if __name__ == '__main__':
+    main()